@@ -0,0 +1,208 @@
+"""Coverage of a dataset version in memory-mapped files, one per chromosome."""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+MAGIC = b'SWFC'
+HEADER = struct.Struct('<4sB')
+
+
+def coverage_path(directory: str, dataset_version: int, chrom: str) -> str:
+    """
+    Get the path of the coverage file of a chromosome.
+
+    Args:
+        directory (str): directory of the coverage files
+        dataset_version (int): id of the dataset version
+        chrom (str): chromosome
+
+    Returns:
+        str: path of the coverage file
+
+    """
+    return os.path.join(directory, str(dataset_version), f'{chrom}.cov')
+
+
+def record_struct(levels: int) -> struct.Struct:
+    """
+    Get the format of the records of a coverage file.
+
+    Each record is pos (uint32) followed by mean, median and the coverage
+    levels (float32), little endian.
+
+    Args:
+        levels (int): number of coverage levels
+
+    Returns:
+        struct.Struct: the record format
+
+    """
+    return struct.Struct(f'<I{levels + 2}f')
+
+
+class CoverageFile:
+    """
+    Read-only coverage of a chromosome, memory-mapped from a file.
+
+    The file starts with a header (MAGIC and the number of coverage levels),
+    followed by fixed-size records sorted by position. Regions are found by
+    binary search and read straight from the mapping, so the data is kept in
+    the OS page cache and shared by all processes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Map a coverage file.
+
+        Args:
+            path (str): path of the coverage file
+
+        """
+        with open(path, 'rb') as coverage_file:
+            self._mmap = mmap.mmap(coverage_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, levels = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f'Not a coverage file: {path}')
+        self.record = record_struct(levels)
+        self.size = (len(self._mmap) - HEADER.size) // self.record.size
+
+    def _position(self, index: int) -> int:
+        return struct.unpack_from('<I', self._mmap, HEADER.size + index * self.record.size)[0]
+
+    def _bisect(self, pos: int) -> int:
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._position(middle) < pos:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def read(self, start_pos: int, end_pos: int) -> list:
+        """
+        Read the coverage of the positions start_pos->end_pos, inclusive.
+
+        The float32 values are returned with 7 significant digits, like the
+        real columns of data.coverage.
+
+        Args:
+            start_pos (int): first position
+            end_pos (int): last position
+
+        Returns:
+            list: pos, mean, median and coverage (dict) for each position with coverage
+
+        """
+        first = HEADER.size + self._bisect(start_pos) * self.record.size
+        last = HEADER.size + self._bisect(end_pos + 1) * self.record.size
+        coverage = []
+        for pos, *values in self.record.iter_unpack(memoryview(self._mmap)[first:last]):
+            values = [float(f'{value:.7g}') for value in values]
+            coverage.append({'pos': pos, 'mean': values[0], 'median': values[1],
+                             'coverage': values[2:]})
+        return coverage
+
+
+class CoverageWriter:
+    """
+    Write the coverage of a dataset version to coverage files.
+
+    The files are written under temporary names and renamed by close(), so
+    readers never see a partial file.
+    """
+
+    def __init__(self, directory: str, dataset_version: int):
+        """
+        Prepare to write the coverage of a dataset version.
+
+        Args:
+            directory (str): directory of the coverage files
+            dataset_version (int): id of the dataset version
+
+        """
+        self.directory = directory
+        self.dataset_version = dataset_version
+        self._files: dict = {}
+
+    def add(self, row: dict):
+        """
+        Add the coverage of a position.
+
+        The positions of each chromosome must be added in increasing order.
+
+        Args:
+            row (dict): chrom, pos, mean, median and coverage of the position
+
+        """
+        chrom = row['chrom']
+        if chrom not in self._files:
+            path = coverage_path(self.directory, self.dataset_version, chrom)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            coverage_file = os.fdopen(tmp_fd, 'wb')
+            coverage_file.write(HEADER.pack(MAGIC, len(row['coverage'])))
+            self._files[chrom] = [coverage_file, tmp_path, path,
+                                  record_struct(len(row['coverage'])), -1]
+        coverage_file, _, _, record, last_pos = self._files[chrom]
+        if row['pos'] <= last_pos:
+            raise ValueError(f'Coverage not sorted by position at {chrom}:{row["pos"]}')
+        coverage_file.write(record.pack(row['pos'], row['mean'], row['median'],
+                                        *row['coverage']))
+        self._files[chrom][4] = row['pos']
+
+    def close(self):
+        """Finish the coverage files, replacing any earlier files of the chromosomes."""
+        for coverage_file, tmp_path, path, _, _ in self._files.values():
+            coverage_file.close()
+            os.replace(tmp_path, path)
+        self._files = {}
+
+
+_COVERAGE_FILES: dict = {}
+_COVERAGE_FILES_LOCK = threading.Lock()
+
+
+def get_coverage_file(directory: str, dataset: str, dataset_version: int,
+                      chrom: str) -> CoverageFile:
+    """
+    Get the mapped coverage file of a chromosome.
+
+    Mapped files are kept open until dropped by invalidate_coverage_files().
+
+    Args:
+        directory (str): directory of the coverage files; empty if not used
+        dataset (str): short name of the dataset
+        dataset_version (int): id of the dataset version
+        chrom (str): chromosome
+
+    Returns:
+        CoverageFile: the coverage file; None if there is none
+
+    """
+    if not directory:
+        return None
+    path = coverage_path(directory, dataset_version, chrom)
+    with _COVERAGE_FILES_LOCK:
+        entry = _COVERAGE_FILES.get(path)
+        if entry is None and os.path.exists(path):
+            entry = (dataset, CoverageFile(path))
+            _COVERAGE_FILES[path] = entry
+    return entry[1] if entry else None
+
+
+def invalidate_coverage_files(dataset: str = None):
+    """
+    Drop mapped coverage files, so files replaced by a new import are mapped again.
+
+    Args:
+        dataset (str): short name of the dataset to drop; None drops all files
+
+    """
+    with _COVERAGE_FILES_LOCK:
+        for path in [path for path, entry in _COVERAGE_FILES.items()
+                     if dataset is None or entry[0] == dataset]:
+            del _COVERAGE_FILES[path]
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 
 import logging
+import struct
+import threading
+import time
+import zlib
+from typing import NamedTuple
 
+import psycopg2
 from peewee import (BlobField,
                     BooleanField,
                     CharField,
+                    CompositeKey,
                     DateTimeField,
                     IntegerField,
                     Field,
@@ -13,17 +20,92 @@ from peewee import (BlobField,
                     Model,
                     TextField,
                     fn)
-from playhouse.postgres_ext import ArrayField, BinaryJSONField, PostgresqlExtDatabase
+from playhouse.pool import PooledPostgresqlExtDatabase
+from playhouse.postgres_ext import ArrayField, BinaryJSONField
 
 import settings
 
+
+class PostgresqlPool(PooledPostgresqlExtDatabase):  # pylint: disable=too-many-ancestors
+    """
+    Connection pool that optionally checks idle connections before reuse and
+    keeps statistics on how long it takes to check out a connection.
+    """
+    SLOW_CHECKOUT = 0.1
+    # connections returned to the pool more recently than this (s) are not checked
+    HEALTH_CHECK_IDLE = 30
+
+    def __init__(self, db_name, health_check=True, **kwargs):
+        self.health_check = health_check
+        self._idle_since = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {'checkouts': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+        super().__init__(db_name, **kwargs)
+
+    def connect(self, reuse_if_open=False):
+        start = time.monotonic()
+        try:
+            return super().connect(reuse_if_open)
+        finally:
+            wait = time.monotonic() - start
+            with self._stats_lock:
+                self._stats['checkouts'] += 1
+                self._stats['wait_total'] += wait
+                self._stats['wait_max'] = max(self._stats['wait_max'], wait)
+            if wait > self.SLOW_CHECKOUT:
+                logging.warning(f"Waited {wait:.3f} s for a database connection " +
+                                f"({len(self._in_use)} in use)")
+
+    def _close(self, conn, close_conn=False):
+        super()._close(conn, close_conn)
+        if conn.closed:
+            self._idle_since.pop(self.conn_key(conn), None)
+        else:
+            self._idle_since[self.conn_key(conn)] = time.monotonic()
+
+    def _is_closed(self, conn):
+        idle_since = self._idle_since.pop(self.conn_key(conn), None)
+        if super()._is_closed(conn):
+            return True
+        if not self.health_check or \
+           (idle_since is not None and time.monotonic() - idle_since < self.HEALTH_CHECK_IDLE):
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+        except psycopg2.Error:
+            logging.info("Dropping broken database connection from the pool")
+            conn.close()
+            return True
+        return False
+
+    def pool_stats(self) -> dict:
+        """
+        Get statistics for the pool.
+
+        Returns:
+            dict: number of checkouts, total and max checkout time (s), connections in use and idle
+
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['in_use'] = len(self._in_use)
+        stats['idle'] = len(self._connections)
+        return stats
+
+
 # pylint: disable=no-member
-database = PostgresqlExtDatabase(settings.psql_name,
-                                 user=settings.psql_user,
-                                 password=settings.psql_pass,
-                                 host=settings.psql_host,
-                                 port=settings.psql_port,
-                                 register_hstore=False)
+database = PostgresqlPool(settings.psql_name,
+                          user=settings.psql_user,
+                          password=settings.psql_pass,
+                          host=settings.psql_host,
+                          port=settings.psql_port,
+                          register_hstore=False,
+                          max_connections=settings.psql_pool_size,
+                          stale_timeout=settings.psql_pool_stale_timeout,
+                          timeout=settings.psql_pool_wait_timeout,
+                          health_check=settings.psql_pool_health_check)
 # pylint: enable=no-member
 
 class BaseModel(Model):
@@ -48,6 +130,38 @@ class EnumField(Field):
             raise ValueError("Illegal value for '{}'".format(self.column_name))
         return value
 
+
+class CoverageBlockField(BlobField):
+    """
+    Coverage of consecutive positions, packed into a compressed binary blob.
+
+    The value is a list of dicts with pos, mean, median and coverage. In the blob
+    a byte giving the number of coverage levels is followed by one record per
+    position: pos (uint32), mean, median and the coverage levels (float32),
+    little endian. The float32 values are returned with 7 significant digits,
+    like the real columns of data.coverage.
+    """
+
+    def db_value(self, value):
+        levels = len(value[0]['coverage']) if value else 0
+        record = struct.Struct(f'<I{levels + 2}f')
+        data = bytearray([levels])
+        for row in value:
+            data += record.pack(row['pos'], row['mean'], row['median'], *row['coverage'])
+        return super().db_value(zlib.compress(bytes(data)))
+
+    def python_value(self, value):
+        if value is None:
+            return None
+        data = zlib.decompress(value)
+        record = struct.Struct(f'<I{data[0] + 2}f')
+        coverage = []
+        for pos, *values in record.iter_unpack(data[1:]):
+            values = [float(f'{value:.7g}') for value in values]
+            coverage.append({'pos': pos, 'mean': values[0], 'median': values[1],
+                             'coverage': values[2:]})
+        return coverage
+
 ###
 # Reference Tables
 ##
@@ -223,6 +337,7 @@ class DatasetVersion(BaseModel):
                                                  'REGISTERED', 'PUBLIC'])
     beacon_access = EnumField(null=False, choices=['PRIVATE', 'CONTROLLED',
                                                    'REGISTERED', 'PUBLIC'])
+    coverage_blocks = BooleanField(default=False)
 
 
 class DatasetFile(BaseModel):
@@ -275,6 +390,22 @@ class Variant(BaseModel):
     allele_num = IntegerField()
     quality_metrics = BinaryJSONField()
     vep_annotations = BinaryJSONField()
+    major_consequence = CharField(null=True)
+    flags = ArrayField(CharField, null=True)
+    hgvs = CharField(null=True)
+    canonical = CharField(null=True)
+
+
+class VariantRsid(BaseModel):
+    class Meta:
+        table_name = 'variant_rsids'
+        schema = 'data'
+        primary_key = CompositeKey('dataset_version', 'rsid', 'variant')
+
+    dataset_version = ForeignKeyField(DatasetVersion, column_name="dataset_version",
+                                      backref="variant_rsids")
+    rsid = IntegerField()
+    variant = ForeignKeyField(Variant, column_name="variant", backref="rsids")
 
 
 class VariantMate(BaseModel):
@@ -306,6 +437,10 @@ class VariantGenes(BaseModel):
 
     variant = ForeignKeyField(Variant, column_name="variant", backref="genes")
     gene = ForeignKeyField(Gene, column_name="gene", backref="variants")
+    major_consequence = CharField(null=True)
+    flags = ArrayField(CharField, null=True)
+    hgvs = CharField(null=True)
+    canonical = CharField(null=True)
 
 
 class VariantTranscripts(BaseModel):
@@ -315,6 +450,10 @@ class VariantTranscripts(BaseModel):
 
     variant = ForeignKeyField(Variant, column_name="variant", backref="transcripts")
     transcript = ForeignKeyField(Transcript, column_name="transcript", backref="variants")
+    major_consequence = CharField(null=True)
+    flags = ArrayField(CharField, null=True)
+    hgvs = CharField(null=True)
+    canonical = CharField(null=True)
 
 
 class Coverage(BaseModel):
@@ -340,6 +479,51 @@ class Coverage(BaseModel):
     coverage = ArrayField(FloatField, null=True)
 
 
+# max number of bases covered by a CoverageBlock
+COVERAGE_BLOCK_SIZE = 10000
+
+
+class CoverageBlock(BaseModel):
+    """
+    Compact alternative to Coverage, storing the coverage in blocks of positions.
+
+    A block covers the positions start_pos->end_pos within COVERAGE_BLOCK_SIZE
+    bases, aligned to multiples of COVERAGE_BLOCK_SIZE.
+    """
+    class Meta:
+        table_name = "coverage_blocks"
+        schema = 'data'
+
+    dataset_version = ForeignKeyField(DatasetVersion, column_name="dataset_version")
+    chrom = CharField(max_length=10)
+    start_pos = IntegerField()
+    end_pos = IntegerField()
+    coverage = CoverageBlockField()
+
+
+class CoverageBin(BaseModel):
+    """
+    Coverage aggregated in bins of bin_size bases, starting at pos.
+
+    The values are averages over the positions with coverage in the bin, and
+    min_mean and max_mean are the extremes of the mean coverage.
+    """
+    class Meta:
+        table_name = "coverage_bins"
+        schema = 'data'
+
+    dataset_version = ForeignKeyField(DatasetVersion, column_name="dataset_version")
+    bin_size = IntegerField()
+    chrom = CharField(max_length=10)
+    pos = IntegerField()
+    positions = IntegerField()
+    mean = FloatField()
+    median = FloatField()
+    min_mean = FloatField()
+    max_mean = FloatField()
+    coverage = ArrayField(FloatField, null=True)
+
+
 class Metrics(BaseModel):
     class Meta:
         table_name = "metrics"
@@ -382,7 +566,7 @@ class User(BaseModel):
             bool: allowed to access
 
         """
-        dsv = get_dataset_version(dataset.short_name, ds_version)
+        dsv = get_dataset_version_record(dataset.short_name, ds_version)
         if not dsv:
             return False
         if dsv.file_access in ('REGISTERED', 'PUBLIC'):
@@ -610,6 +794,128 @@ def get_dataset_version(dataset: str, version: str = None):
     return dataset_version
 
 
+class DatasetVersionRecord(NamedTuple):
+    """Immutable summary of a dataset version, as stored in the version cache."""
+    id: int
+    dataset: int
+    short_name: str
+    version: str
+    reference_set: int
+    file_access: str
+    coverage_blocks: bool
+
+    @classmethod
+    def from_model(cls, dataset_version):
+        """
+        Summarise a DatasetVersion (or DatasetVersionCurrent) with its Dataset joined.
+
+        Args:
+            dataset_version (DatasetVersion): the dataset version
+
+        Returns:
+            DatasetVersionRecord: the summary
+
+        """
+        return cls(id=dataset_version.id,
+                   dataset=dataset_version.dataset.id,
+                   short_name=dataset_version.dataset.short_name,
+                   version=dataset_version.version,
+                   reference_set=dataset_version.reference_set_id,
+                   file_access=dataset_version.file_access,
+                   coverage_blocks=dataset_version.coverage_blocks)
+
+
+DATASET_VERSION_CHANNEL = 'dataset_version_changed'
+
+_DATASET_VERSION_CACHE: dict = {}
+_DATASET_VERSION_CACHE_LOCK = threading.Lock()
+
+
+def get_dataset_version_record(dataset: str, version: str = None):
+    """
+    Given dataset get a cached summary of the DatasetVersion.
+
+    Entries are kept for ``settings.dataset_version_cache_ttl`` seconds or
+    until invalidated, so repeated lookups within a request (or across
+    requests) do not hit the database.
+
+    Args:
+        dataset (str): short name of the dataset
+        version (str): the dataset version; None for the current version
+
+    Returns:
+        DatasetVersionRecord: the corresponding record; None if not found
+
+    """
+    key = (dataset, version)
+    now = time.monotonic()
+    with _DATASET_VERSION_CACHE_LOCK:
+        cached = _DATASET_VERSION_CACHE.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    dataset_version = get_dataset_version(dataset, version)
+    if not dataset_version:
+        return None
+    record = DatasetVersionRecord.from_model(dataset_version)
+    ttl = settings.dataset_version_cache_ttl  # pylint: disable=no-member
+    if ttl > 0:
+        with _DATASET_VERSION_CACHE_LOCK:
+            _DATASET_VERSION_CACHE[key] = (now + ttl, record)
+    return record
+
+
+def invalidate_dataset_version_cache(dataset: str = None):
+    """
+    Drop cached dataset versions.
+
+    Args:
+        dataset (str): short name of the dataset to drop; None drops all entries
+
+    """
+    with _DATASET_VERSION_CACHE_LOCK:
+        if dataset is None:
+            _DATASET_VERSION_CACHE.clear()
+            return
+        for key in [key for key in _DATASET_VERSION_CACHE if key[0] == dataset]:
+            del _DATASET_VERSION_CACHE[key]
+
+
+def notify_dataset_version_changed(dataset: str):
+    """
+    Tell running servers that the versions of a dataset have changed.
+
+    Args:
+        dataset (str): short name of the dataset
+
+    """
+    database.execute_sql('SELECT pg_notify(%s, %s)', (DATASET_VERSION_CHANNEL, dataset))
+
+
+def listen_for_dataset_version_changes():
+    """
+    Open a dedicated connection listening for dataset version changes.
+
+    The caller is responsible for polling the connection and handling
+    ``connection.notifies``.
+
+    Returns:
+        psycopg2.extensions.connection: the listening connection
+
+    """
+    # pylint: disable=no-member
+    connection = psycopg2.connect(dbname=settings.psql_name,
+                                  user=settings.psql_user,
+                                  password=settings.psql_pass,
+                                  host=settings.psql_host,
+                                  port=settings.psql_port)
+    # pylint: enable=no-member
+    connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {DATASET_VERSION_CHANNEL}')
+    return connection
+
+
 def build_dict_from_row(row) -> dict:
     """Build a dictionary from a row object"""
     outdict = {}
@@ -1,16 +1,121 @@
+import asyncio
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
 import os.path
 import datetime
+import threading
 import urllib.parse
 
 import peewee
+import psycopg2.extensions
 import tornado.auth
 import tornado.escape
 from tornado.escape import json_encode
 import tornado.httpclient
+import tornado.ioloop
+import tornado.iostream
 import tornado.web
 
 import db
+import response_cache
+import settings
+
+# pylint: disable=no-member
+QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=settings.query_workers,
+                                    thread_name_prefix='query')
+STREAM_EXECUTOR = ThreadPoolExecutor(max_workers=settings.stream_workers,
+                                     thread_name_prefix='stream')
+RESPONSE_CACHE = response_cache.ResponseCache(settings.response_cache_size,
+                                              settings.response_cache_dir)
+# pylint: enable=no-member
+# max number of items from a streamed query waiting to be sent
+STREAM_BUFFER_SIZE = 4
+
+_END_OF_STREAM = object()
+
+# requests being handled by this process, waited for on shutdown
+ACTIVE_REQUESTS = set()
+
+
+class StreamTimeoutError(Exception):
+    """The client did not read a streamed response within the read timeout."""
+
+
+def execute_query(func, *args, **kwargs):
+    """
+    Run a blocking database call in a transaction limited by the query timeout.
+
+    Intended to be run in a worker thread; the connection is returned to the
+    pool when the call is done.
+
+    Args:
+        func (function): the function doing the database calls
+        args: positional arguments for ``func``
+        kwargs: keyword arguments for ``func``
+
+    Returns:
+        the return value of ``func``
+
+    """
+    with db.database.connection_context(), db.database.atomic():
+        db.database.execute_sql('SET LOCAL statement_timeout = %s',
+                                (int(settings.query_timeout * 1000),))  # pylint: disable=no-member
+        return func(*args, **kwargs)
+
+
+def _end_stream(queue):
+    """
+    End a stream whose producer gave up, dropping the items not yet consumed.
+
+    Args:
+        queue (asyncio.Queue): the queue of the stream
+
+    """
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(_END_OF_STREAM)
+
+
+def _feed_queue(loop, queue, stop, func, *args, **kwargs):
+    """
+    Put the items generated by a blocking function on an asyncio queue.
+
+    Blocks while the queue is full, and ends early if ``stop`` is set. If the
+    queue stays full for ``settings.stream_read_timeout`` seconds the stream
+    is ended, so a slow client does not keep the transaction open.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): the loop the queue belongs to
+        queue (asyncio.Queue): the queue to put the items on
+        stop (threading.Event): set by the consumer to end the stream
+        func (function): generator function doing the database calls
+        args: positional arguments for ``func``
+        kwargs: keyword arguments for ``func``
+
+    Raises:
+        StreamTimeoutError: the items were not consumed in time
+
+    """
+    def put(item):
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        try:
+            future.result(timeout=settings.stream_read_timeout)  # pylint: disable=no-member
+        except concurrent.futures.TimeoutError as err:
+            future.cancel()
+            stop.set()
+            loop.call_soon_threadsafe(_end_stream, queue)
+            raise StreamTimeoutError('Stream not read in time') from err
+
+    try:
+        for item in func(*args, **kwargs):
+            if stop.is_set():
+                break
+            put(item)
+    finally:
+        if not stop.is_set():
+            put(_END_OF_STREAM)
 
 
 class BaseHandler(tornado.web.RequestHandler):
@@ -20,18 +125,103 @@ class BaseHandler(tornado.web.RequestHandler):
     to make security status explicit.
     """
     def prepare(self):
+        ACTIVE_REQUESTS.add(self)
         # Make sure we have the xsrf_token, this will generate the xsrf cookie if it isn't set
         self.xsrf_token  # pylint: disable=pointless-statement
-        if db.database.is_closed():
-            try:
-                db.database.connect()
-            except peewee.DatabaseError as err:
-                logging.error(f"Failed to connect to database: {err}")
+        # a pooled connection is only checked out by the first query made on
+        # the IOLoop, so handlers using run_query() or stream_query() do not
+        # hold one; it is returned to the pool in on_finish()
 
     def on_finish(self):
+        ACTIVE_REQUESTS.discard(self)
         if not db.database.is_closed():
             db.database.close()
 
+    def on_connection_close(self):
+        ACTIVE_REQUESTS.discard(self)
+        super().on_connection_close()
+
+    async def run_query(self, func, *args, **kwargs):
+        """
+        Run a blocking database call in the query executor, off the IOLoop.
+
+        Sends 504 if a statement exceeds the query timeout.
+
+        Args:
+            func (function): the function doing the database calls
+            args: positional arguments for ``func``
+            kwargs: keyword arguments for ``func``
+
+        Returns:
+            the return value of ``func``
+
+        """
+        call = functools.partial(execute_query, func, *args, **kwargs)
+        try:
+            return await tornado.ioloop.IOLoop.current().run_in_executor(QUERY_EXECUTOR, call)
+        except psycopg2.extensions.QueryCanceledError as err:
+            logging.warning(f"Query timed out: {func.__name__}")
+            raise tornado.web.HTTPError(504, reason='Query timed out') from err
+
+    async def stream_query(self, func, *args, **kwargs):
+        """
+        Run a blocking database generator in the stream executor and yield its items.
+
+        The generator runs in a single transaction and waits when
+        ``STREAM_BUFFER_SIZE`` items are not yet consumed, so a slow client
+        slows down the query instead of the results piling up in memory.
+        Streams have their own executor so they cannot hold up other queries,
+        and the connection is closed if the client stops reading for
+        ``settings.stream_read_timeout`` seconds.
+
+        Args:
+            func (function): generator function doing the database calls
+            args: positional arguments for ``func``
+            kwargs: keyword arguments for ``func``
+
+        Yields:
+            the items generated by ``func``
+
+        Raises:
+            tornado.iostream.StreamClosedError: the stream was aborted as the client stopped reading
+
+        """
+        queue = asyncio.Queue(maxsize=STREAM_BUFFER_SIZE)
+        stop = threading.Event()
+        call = functools.partial(execute_query, _feed_queue, asyncio.get_event_loop(),
+                                 queue, stop, func, *args, **kwargs)
+        producer = tornado.ioloop.IOLoop.current().run_in_executor(STREAM_EXECUTOR, call)
+        producer.add_done_callback(self._close_unread_stream)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                yield item
+            await producer
+        except StreamTimeoutError as err:
+            raise tornado.iostream.StreamClosedError() from err
+        except psycopg2.extensions.QueryCanceledError as err:
+            logging.warning(f"Query timed out: {func.__name__}")
+            raise tornado.web.HTTPError(504, reason='Query timed out') from err
+        finally:
+            # let a producer waiting on a full queue see that the stream ended
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+    def _close_unread_stream(self, producer):
+        """
+        Close the connection if the producer of a stream gave up waiting for the client.
+
+        Args:
+            producer (asyncio.Future): the producer of the stream, see stream_query()
+
+        """
+        if not producer.cancelled() and isinstance(producer.exception(), StreamTimeoutError):
+            logging.warning(f"Closing {self.request.uri}, the client stopped reading")
+            self.request.connection.stream.close()
+
     def get_current_user(self):
         email = self.get_secure_cookie('email')
         name = self.get_secure_cookie('user')
@@ -100,7 +290,76 @@ def _convert_keys_to_hump_back(chunk):
 
 
 class UnsafeHandler(BaseHandler):
-    pass
+    """
+    Handler for requests that do not need a logged in user.
+
+    Handlers setting ``cache_responses`` must have ``dataset`` and
+    ``ds_version`` arguments; their GET responses are then kept in
+    ``RESPONSE_CACHE`` for the resolved dataset version and sent with an ETag.
+    Responses for an explicitly requested version may be cached by clients for
+    ``settings.response_cache_max_age`` seconds, while those for the current
+    version must be revalidated as the current version can change.
+    """
+    cache_responses = False
+    _cache_key = None
+    _etag = None
+
+    async def prepare(self):  # pylint: disable=invalid-overridden-method
+        super().prepare()
+        if (not self.cache_responses or self.request.method != 'GET'
+                or not RESPONSE_CACHE.enabled):
+            return
+        ds_version = self.path_kwargs.get('ds_version')
+        dataset_version = await self.run_query(db.get_dataset_version_record,
+                                               self.path_kwargs['dataset'], ds_version)
+        if not dataset_version:
+            return
+
+        if ds_version:
+            self.set_header('Cache-Control',
+                            f'max-age={settings.response_cache_max_age}')  # pylint: disable=no-member
+        else:
+            self.set_header('Cache-Control', 'no-cache')
+
+        key = (dataset_version.short_name, dataset_version.id, self.request.uri)
+        cached = RESPONSE_CACHE.get(key)
+        if not cached and RESPONSE_CACHE.directory:
+            cached = await tornado.ioloop.IOLoop.current().run_in_executor(None,
+                                                                           RESPONSE_CACHE.load,
+                                                                           key)
+            if cached:
+                RESPONSE_CACHE.add(key, cached)
+        if not cached:
+            self._cache_key = key
+            return
+
+        self.set_header('Content-Type', cached.content_type)
+        self._etag = cached.etag
+        self.write(cached.body)
+        self.finish()
+
+    def compute_etag(self):
+        if self._etag:
+            return self._etag
+        return super().compute_etag()
+
+    def finish(self, chunk=None):
+        if chunk is not None:
+            self.write(chunk)
+        if self._cache_key and self.get_status() == 200:
+            # pylint: disable=protected-access
+            body = b''.join(self._write_buffer)
+            entry = response_cache.CachedResponse(response_cache.make_etag(body),
+                                                  self._headers.get('Content-Type'),
+                                                  body)
+            # pylint: enable=protected-access
+            RESPONSE_CACHE.add(self._cache_key, entry)
+            if RESPONSE_CACHE.directory:
+                tornado.ioloop.IOLoop.current().run_in_executor(None, RESPONSE_CACHE.save,
+                                                                self._cache_key, entry)
+            self._etag = entry.etag
+            self._cache_key = None
+        return super().finish()
 
 
 class SafeHandler(BaseHandler):
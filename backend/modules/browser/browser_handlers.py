@@ -2,6 +2,8 @@
 
 import logging
 
+import tornado.iostream
+
 import db
 import handlers
 
@@ -13,7 +15,7 @@ from . import utils
 class Autocomplete(handlers.UnsafeHandler):
     """Provide autocompletion for protein names based on current query."""
 
-    def get(self, dataset: str, query: str, ds_version: str = None):
+    async def get(self, dataset: str, query: str, ds_version: str = None):
         """
         Provide autocompletion for protein names based on current query.
 
@@ -24,19 +26,15 @@ class Autocomplete(handlers.UnsafeHandler):
 
         """
         dataset, ds_version = utils.parse_dataset(dataset, ds_version)
-        ret = {}
-
-        results = lookups.autocomplete(dataset, query, ds_version)
-        ret = {'values': sorted(list(set(results)))[:20]}
-
-        self.finish(ret)
+        results = await self.run_query(lookups.autocomplete, dataset, query, ds_version)
+        self.finish({'values': results})
 
 
 class Download(handlers.UnsafeHandler):
     """Download variants in CSV format."""
 
-    def get(self, dataset: str, datatype: str, item: str,  # pylint: disable=too-many-arguments
-            ds_version: str = None, filter_type: str = None):
+    async def get(self, dataset: str, datatype: str,  # pylint: disable=too-many-arguments
+                  item: str, ds_version: str = None, filter_type: str = None):
         """
         Download variants in CSV format.
 
@@ -57,36 +55,73 @@ class Download(handlers.UnsafeHandler):
         self.set_header(f'content-Disposition',
                         f'attachment; filename={filename}')
 
-        data = utils.get_variant_list(dataset, datatype, item, ds_version)
-        # filter variants based on what is shown
-        if filter_type:
-            filters = filter_type.split('~')
-            if filters[1] == 'false':
-                data['variants'] = [variant for variant in data['variants']
-                                    if variant['filter_string'] == 'PASS']
-            if filters[0] == 'mislof':
-                data['variants'] = [variant for variant in data['variants']
-                                    if variant['major_consequence'] == 'missense'
-                                    or 'LoF' in variant['flags']]
-            elif 'lof' in filters[0]:
-                data['variants'] = [variant for variant in data['variants']
-                                    if 'LoF' in variant['flags']]
-
-        # Write header
-        self.write(','.join([h[1] for h in data['headers']]) + '\n')
-
-        for variant in data['variants']:
-            headers = [h[0] for h in data['headers']]
-            self.write(','.join(map(str, [variant[h] for h in headers])) + '\n')
+        chunks = self.stream_query(utils.get_variant_list_csv, dataset, datatype, item,
+                                   ds_version, filter_type)
+        try:
+            async for chunk in chunks:
+                self.write(chunk)
+                await self.flush()
+        except error.NotFoundError as err:
+            self.send_error(status_code=404, reason=str(err))
+        except (error.ParsingError, error.MalformedRequest) as err:
+            self.send_error(status_code=400, reason=str(err))
+        except tornado.iostream.StreamClosedError:
+            logging.info(f'Download of {filename} aborted by the client')
+        finally:
+            await chunks.aclose()
+
+
+class GetFrequencies(handlers.UnsafeHandler):
+    """Look up the frequencies of many variants."""
+
+    def check_xsrf_cookie(self):
+        """Allow scripts to post lookups, as they only read public data."""
+
+    async def post(self, dataset: str, ds_version: str = None):
+        """
+        Look up the frequencies of the variants in the request body, streamed as NDJSON.
+
+        The body is either a JSON list of variant ids or VCF-like text, see
+        utils.parse_variant_lookup().
+
+        Args:
+            dataset (str): dataset short name
+            ds_version (str): dataset version
+
+        """
+        dataset, ds_version = utils.parse_dataset(dataset, ds_version)
+        try:
+            variants = utils.parse_variant_lookup(self.request.body.decode('utf-8', 'replace'))
+        except (error.ParsingError, error.MalformedRequest) as err:
+            self.send_error(status_code=400, reason=str(err))
+            return
+        self.set_header('Content-Type', 'application/x-ndjson')
+
+        chunks = self.stream_query(utils.get_variant_frequencies_ndjson, dataset, variants,
+                                   ds_version)
+        try:
+            async for chunk in chunks:
+                self.write(chunk)
+                await self.flush()
+        except error.NotFoundError as err:
+            self.send_error(status_code=404, reason=str(err))
+        except tornado.iostream.StreamClosedError:
+            logging.info(f'Frequency lookup of {len(variants)} variants aborted by the client')
+        finally:
+            await chunks.aclose()
 
 
 class GetCoverage(handlers.UnsafeHandler):
     """Retrieve coverage."""
 
-    def get(self, dataset: str, datatype: str, item: str, ds_version: str = None):
+    cache_responses = True
+
+    async def get(self, dataset: str, datatype: str, item: str, ds_version: str = None):
         """
         Retrieve coverage.
 
+        The coverage is aggregated into ``bins`` bins if given as an argument.
+
         Args:
             dataset (str): dataset short name
             datatype (str): type of data
@@ -95,8 +130,10 @@ class GetCoverage(handlers.UnsafeHandler):
 
         """
         dataset, ds_version = utils.parse_dataset(dataset, ds_version)
+        bins = self.get_argument('bins', None)
         try:
-            ret = utils.get_coverage(dataset, datatype, item, ds_version)
+            ret = await self.run_query(utils.get_coverage, dataset, datatype, item, ds_version,
+                                       bins)
         except error.NotFoundError as err:
             self.send_error(status_code=404, reason=str(err))
             return
@@ -109,7 +146,9 @@ class GetCoverage(handlers.UnsafeHandler):
 class GetCoveragePos(handlers.UnsafeHandler):
     """Retrieve coverage range."""
 
-    def get(self, dataset: str, datatype: str, item: str, ds_version: str = None):
+    cache_responses = True
+
+    async def get(self, dataset: str, datatype: str, item: str, ds_version: str = None):
         """
         Retrieve coverage range.
 
@@ -122,7 +161,7 @@ class GetCoveragePos(handlers.UnsafeHandler):
         """
         dataset, ds_version = utils.parse_dataset(dataset, ds_version)
         try:
-            ret = utils.get_coverage_pos(dataset, datatype, item, ds_version)
+            ret = await self.run_query(utils.get_coverage_pos, dataset, datatype, item, ds_version)
         except error.NotFoundError as err:
             self.send_error(status_code=404, reason=str(err))
             return
@@ -136,7 +175,9 @@ class GetCoveragePos(handlers.UnsafeHandler):
 class GetGene(handlers.UnsafeHandler):
     """Request information about a gene."""
 
-    def get(self, dataset: str, gene: str, ds_version: str = None):
+    cache_responses = True
+
+    async def get(self, dataset: str, gene: str, ds_version: str = None):
         """
         Request information about a gene.
 
@@ -153,7 +194,7 @@ class GetGene(handlers.UnsafeHandler):
 
         # Gene
         try:
-            gene = lookups.get_gene(dataset, gene_id, ds_version)
+            gene = await self.run_query(lookups.get_gene, dataset, gene_id, ds_version)
         except error.NotFoundError as err:
             self.send_error(status_code=404, reason=str(err))
             return
@@ -161,7 +202,8 @@ class GetGene(handlers.UnsafeHandler):
         ret['gene'] = gene
 
         # Add exons from transcript
-        transcript = lookups.get_transcript(dataset, gene['canonical_transcript'], ds_version)
+        transcript = await self.run_query(lookups.get_transcript, dataset,
+                                          gene['canonical_transcript'], ds_version)
         ret['exons'] = []
         for exon in sorted(transcript['exons'], key=lambda k: k['start']):
             ret['exons'] += [{'start': exon['start'],
@@ -169,7 +211,8 @@ class GetGene(handlers.UnsafeHandler):
                               'type': exon['feature_type']}]
 
         # Transcripts
-        transcripts_in_gene = lookups.get_transcripts_in_gene(dataset, gene_id, ds_version)
+        transcripts_in_gene = await self.run_query(lookups.get_transcripts_in_gene,
+                                                   dataset, gene_id, ds_version)
         if transcripts_in_gene:
             ret['transcripts'] = []
             for transcript in transcripts_in_gene:
@@ -185,7 +228,9 @@ class GetGene(handlers.UnsafeHandler):
 class GetRegion(handlers.UnsafeHandler):
     """Request information about genes in a region."""
 
-    def get(self, dataset: str, region: str, ds_version: str = None):
+    cache_responses = True
+
+    async def get(self, dataset: str, region: str, ds_version: str = None):
         """
         Request information about genes in a region.
 
@@ -212,7 +257,8 @@ class GetRegion(handlers.UnsafeHandler):
             self.send_error(status_code=400, reason='Region too large')
             return
 
-        genes_in_region = lookups.get_genes_in_region(dataset, chrom, start, stop, ds_version)
+        genes_in_region = await self.run_query(lookups.get_genes_in_region,
+                                               dataset, chrom, start, stop, ds_version)
         if genes_in_region:
             ret['region']['genes'] = []
             for gene in genes_in_region:
@@ -225,7 +271,9 @@ class GetRegion(handlers.UnsafeHandler):
 class GetTranscript(handlers.UnsafeHandler):
     """Request information about a transcript."""
 
-    def get(self, dataset: str, transcript: str, ds_version: str = None):
+    cache_responses = True
+
+    async def get(self, dataset: str, transcript: str, ds_version: str = None):
         """
         Request information about a transcript.
 
@@ -241,7 +289,8 @@ class GetTranscript(handlers.UnsafeHandler):
 
         # Add transcript information
         try:
-            transcript = lookups.get_transcript(dataset, transcript_id, ds_version)
+            transcript = await self.run_query(lookups.get_transcript,
+                                              dataset, transcript_id, ds_version)
         except error.NotFoundError as err:
             self.send_error(status_code=404, reason=str(err))
             return
@@ -258,13 +307,14 @@ class GetTranscript(handlers.UnsafeHandler):
                               'type': exon['feature_type']}]
 
         # Add gene information
-        gene = lookups.get_gene_by_dbid(transcript['gene'])
+        gene = await self.run_query(lookups.get_gene_by_dbid, transcript['gene'])
         ret['gene']['id'] = gene['gene_id']
         ret['gene']['name'] = gene['name']
         ret['gene']['full_name'] = gene['full_name']
         ret['gene']['canonical_transcript'] = gene['canonical_transcript']
 
-        gene_transcripts = lookups.get_transcripts_in_gene_by_dbid(transcript['gene'])
+        gene_transcripts = await self.run_query(lookups.get_transcripts_in_gene_by_dbid,
+                                                transcript['gene'])
         ret['gene']['transcripts'] = [g['transcript_id'] for g in gene_transcripts]
 
         self.finish(ret)
@@ -273,7 +323,7 @@ class GetTranscript(handlers.UnsafeHandler):
 class GetVariant(handlers.UnsafeHandler):
     """Request information about a gene."""
 
-    def get(self, dataset: str, variant: str, ds_version: str = None):
+    async def get(self, dataset: str, variant: str, ds_version: str = None):
         """
         Request information about a gene.
 
@@ -300,8 +350,8 @@ class GetVariant(handlers.UnsafeHandler):
             return
         orig_variant = variant
         try:
-            variant = lookups.get_variant(dataset, split_var[1], split_var[0],
-                                          split_var[2], split_var[3], ds_version)
+            variant = await self.run_query(lookups.get_variant, dataset, split_var[1],
+                                           split_var[0], split_var[2], split_var[3], ds_version)
         except error.NotFoundError as err:
             logging.info('Variant not found ({})'.format(orig_variant))
             self.send_error(status_code=404, reason=str(err))
@@ -351,20 +401,11 @@ class GetVariant(handlers.UnsafeHandler):
         # data easier to use in the template
 
         # get the variant for other datasets with the same reference_set
-        curr_dsv = db.get_dataset_version(dataset, ds_version)
-        dsvs = [db.get_dataset_version(dset.short_name) for dset in db.Dataset.select()
-                if dset.short_name != dataset]
-        # if the only available version is not released yet
-        dsvs = list(filter(lambda dsv: dsv, dsvs))
-        dsvs = [dsv for dsv in dsvs if dsv.reference_set == curr_dsv.reference_set]
+        curr_dsv = await self.run_query(db.get_dataset_version_record, dataset, ds_version)
         dsv_groups = [(curr_dsv, variant)]
-        for dsv in dsvs:
-            try:
-                hit = lookups.get_variant(dsv.dataset.short_name, split_var[1], split_var[0],
-                                          split_var[2], split_var[3], dsv.version)
-            except error.NotFoundError:
-                continue
-            dsv_groups.append((dsv, hit))
+        dsv_groups += await self.run_query(lookups.get_variant_in_other_datasets, dataset,
+                                           split_var[1], split_var[0], split_var[2],
+                                           split_var[3], ds_version)
 
         frequencies = {'headers': [['Dataset', 'pop'],
                                    ['Allele Count', 'acs'],
@@ -379,7 +420,7 @@ class GetVariant(handlers.UnsafeHandler):
                     'hom_count': 'homs'}
 
         for dsv_group in dsv_groups:
-            ds_name = dsv_group[0].dataset.short_name
+            ds_name = dsv_group[0].short_name
 
             if ds_name not in frequencies['datasets']:
                 frequencies['datasets'][ds_name] = {'pop': ds_name}
@@ -403,7 +444,9 @@ class GetVariant(handlers.UnsafeHandler):
 class GetVariants(handlers.UnsafeHandler):
     """Retrieve variants."""
 
-    def get(self, dataset: str, datatype: str, item: str, ds_version: str = None):
+    cache_responses = True
+
+    async def get(self, dataset: str, datatype: str, item: str, ds_version: str = None):
         """
         Retrieve variants.
 
@@ -415,7 +458,7 @@ class GetVariants(handlers.UnsafeHandler):
         """
         dataset, ds_version = utils.parse_dataset(dataset, ds_version)
         try:
-            ret = utils.get_variant_list(dataset, datatype, item, ds_version)
+            ret = await self.run_query(utils.get_variant_list, dataset, datatype, item, ds_version)
         except error.NotFoundError as err:
             self.send_error(status_code=404, reason=str(err))
             return
@@ -435,7 +478,7 @@ class GetVariants(handlers.UnsafeHandler):
 class Search(handlers.UnsafeHandler):
     """Perform a search for the wanted object."""
 
-    def get(self, dataset: str, query: str, ds_version: str = None):
+    async def get(self, dataset: str, query: str, ds_version: str = None):
         """
         Perform a search for the wanted object.
 
@@ -447,7 +490,8 @@ class Search(handlers.UnsafeHandler):
         dataset, ds_version = utils.parse_dataset(dataset, ds_version)
         ret = {"dataset": dataset, "value": None, "type": None}
 
-        datatype, identifier = lookups.get_awesomebar_result(dataset, query, ds_version)
+        datatype, identifier = await self.run_query(lookups.get_awesomebar_result,
+                                                    dataset, query, ds_version)
 
         if datatype == "dbsnp_variant_set":
             datatype = "dbsnp"
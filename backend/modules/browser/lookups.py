@@ -1,39 +1,92 @@
 """Lookup functions for the variant browser."""
+# pylint: disable=too-many-lines
 
+import bisect
+import collections
 import logging
 import re
+import threading
 
+from peewee import Case, fn, Tuple
+from playhouse.postgres_ext import ServerSide
+
+import coverage_files
 import db
+import settings
 
 from . import error
 
 SEARCH_LIMIT = 10000
 
+# max number of suggestions returned by autocomplete()
+AUTOCOMPLETE_LIMIT = 20
+
+# max number of searches without results remembered by get_awesomebar_result()
+AWESOMEBAR_MISS_CACHE_SIZE = 10000
+
+# max number of variants requested in a single query by iter_variant_frequencies()
+VARIANT_BATCH_SIZE = 1000
+
+# columns used in frequency tables
+FREQUENCY_COLUMNS = (db.Variant.variant_id, db.Variant.allele_count, db.Variant.allele_num,
+                     db.Variant.allele_freq, db.Variant.hom_count)
+
+RSID_REGEX = re.compile(r'^rs(\d+)$')
+
 REGION_REGEX = re.compile(r'^\s*(\d+|X|Y|M|MT)\s*([-:]?)\s*(\d*)-?([\dACTG]*)-?([ACTG]*)')
 
+# columns used in the variant lists, apart from the consequence summary
+VARIANT_LIST_COLUMNS = (db.Variant.variant_id, db.Variant.chrom, db.Variant.pos,
+                        db.Variant.ref, db.Variant.alt, db.Variant.rsid,
+                        db.Variant.filter_string, db.Variant.allele_count,
+                        db.Variant.allele_num, db.Variant.allele_freq,
+                        db.Variant.hom_count)
+
+# consequence summary columns of variants, variant_genes and variant_transcripts
+CONSEQUENCE_SUMMARY_COLUMNS = ('major_consequence', 'flags', 'hgvs', 'canonical')
+
+# gene names and aliases per reference set, see get_gene_name_index()
+_GENE_NAME_INDEX: dict = {}
+_GENE_NAME_INDEX_LOCK = threading.Lock()
+
+# symbols per reference set, see get_search_index()
+_SEARCH_INDEX: dict = {}
+_SEARCH_INDEX_LOCK = threading.Lock()
 
-def autocomplete(dataset: str, query: str, ds_version: str = None) -> list:
+# searches without results per dataset version, see get_awesomebar_result()
+_AWESOMEBAR_MISSES = collections.OrderedDict()
+_AWESOMEBAR_MISSES_LOCK = threading.Lock()
+
+
+def autocomplete(dataset: str, query: str, ds_version: str = None,
+                 limit: int = AUTOCOMPLETE_LIMIT) -> list:
     """
     Provide autocomplete suggestions based on the query.
 
+    The gene names and aliases are matched case-insensitively using the
+    in-memory index of the reference set.
+
     Args:
         dataset (str): short name of dataset
         query (str): the query to compare to the available gene names
         ds_version (str): the dataset version
+        limit (int): max number of suggestions
 
     Returns:
-        list: A list of genes names whose beginning matches the query
+        list: sorted gene names and aliases whose beginning matches the query
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError as err:
         raise error.NotFoundError(f'Reference set not found for dataset {dataset}.') from err
-    query = (db.Gene.select(db.Gene.name)
-             .where(((db.Gene.name.startswith(query)) &
-                     (db.Gene.reference_set == ref_set))))
-    gene_names = [str(gene.name) for gene in query]
-    return gene_names
+    keys, names = get_gene_name_index(ref_set)
+    prefix = query.upper()
+    start = bisect.bisect_left(keys, prefix)
+    stop = start
+    while stop < len(keys) and stop - start < limit and keys[stop].startswith(prefix):
+        stop += 1
+    return names[start:stop]
 
 
 def get_awesomebar_result(dataset: str, query: str, ds_version: str = None) -> tuple:
@@ -56,9 +109,12 @@ def get_awesomebar_result(dataset: str, query: str, ds_version: str = None) -> t
 
     Follow these steps:
 
-    * if query is an ensembl ID, return it
-    * if a gene symbol, return that gene's ensembl ID
     * if an RSID, return that variant's string
+    * if a gene symbol, alias or ensembl ID, look it up in the search index
+    * if a region or variant, return it
+
+    At most one database query is made per search, and searches without
+    results are remembered per dataset version.
 
     Args:
         dataset (str): short name of dataset
@@ -69,70 +125,40 @@ def get_awesomebar_result(dataset: str, query: str, ds_version: str = None) -> t
         tuple: (datatype, identifier)
 
     """
-    # pylint: disable=too-many-return-statements,too-many-branches
     query = query.strip()
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
+    if not dataset_version:
+        return _parse_region_query(query.upper(), None)
 
-    # Parse Variant types
-    try:
-        variant = get_variants_by_rsid(dataset, query.lower(), ds_version=ds_version)
-    except (error.NotFoundError, error.ParsingError):
-        pass
-    else:
-        if len(variant) == 1:
-            return ('variant', variant[0]['variant_id'])
-        return ('dbsnp_variant_set', variant[0]['rsid'])
-
-    # Gene
-    try:
-        gene = get_gene_by_name(dataset, query)
-        return 'gene', gene['gene_id']
-    except error.NotFoundError:
-        pass
-
-    # Capital letters for all other queries
-    query = query.upper()
-    try:
-        gene = get_gene_by_name(dataset, query)
-        return 'gene', gene['gene_id']
-    except error.NotFoundError:
-        pass
-
-    # Ensembl formatted queries
-    if query.startswith('ENS'):
-        # Gene
-        try:
-            gene = get_gene(dataset, query)
-            return 'gene', gene['gene_id']
-        except error.NotFoundError:
-            pass
-        # Transcript
-        try:
-            transcript = get_transcript(dataset, query)
-            return 'transcript', transcript['transcript_id']
-        except error.NotFoundError:
-            pass
+    miss_key = (dataset_version.short_name, dataset_version.id, query)
+    with _AWESOMEBAR_MISSES_LOCK:
+        if miss_key in _AWESOMEBAR_MISSES:
+            _AWESOMEBAR_MISSES.move_to_end(miss_key)
+            return 'not_found', _AWESOMEBAR_MISSES[miss_key]
 
-    # Region and variant queries
-    query = query[3:] if query.startswith('CHR') else query
+    result = _search(dataset_version, query)
+    if result[0] == 'not_found':
+        with _AWESOMEBAR_MISSES_LOCK:
+            _AWESOMEBAR_MISSES[miss_key] = result[1]
+            while len(_AWESOMEBAR_MISSES) > AWESOMEBAR_MISS_CACHE_SIZE:
+                _AWESOMEBAR_MISSES.popitem(last=False)
+    return result
 
-    match = REGION_REGEX.match(query)
-    if match:
-        target = match.group(0)
-        target_type = 'region'
-        if match.group(2) == ":":
-            target = target.replace(":", "-")
 
-        if match.group(5) and set(match.group(4)).issubset(set("ACGT")):
-            target_type = 'variant'
-            try:
-                get_raw_variant(dataset, int(match.group(3)), match.group(1),
-                                match.group(4), match.group(5), ds_version)
-            except error.NotFoundError:
-                target_type = 'not_found'
+def invalidate_awesomebar_misses(dataset: str = None):
+    """
+    Forget searches without results, so data added by a new import is found.
 
-        return target_type, target
+    Args:
+        dataset (str): short name of the dataset to drop; None drops all searches
 
-    return 'not_found', query
+    """
+    with _AWESOMEBAR_MISSES_LOCK:
+        if dataset is None:
+            _AWESOMEBAR_MISSES.clear()
+            return
+        for key in [key for key in _AWESOMEBAR_MISSES if key[0] == dataset]:
+            del _AWESOMEBAR_MISSES[key]
 
 
 def get_coverage_for_bases(dataset: str, chrom: str, start_pos: int,
@@ -140,6 +166,10 @@ def get_coverage_for_bases(dataset: str, chrom: str, start_pos: int,
     """
     Get the coverage for the list of bases given by start_pos->end_pos, inclusive.
 
+    The coverage is read from the memory-mapped coverage file of the chromosome
+    if there is one, and otherwise from the coverage blocks or the coverage per
+    position, depending on how the dataset version was imported.
+
     Args:
         dataset (str): short name for the dataset
         chrom (str): chromosome
@@ -151,23 +181,136 @@ def get_coverage_for_bases(dataset: str, chrom: str, start_pos: int,
         list: coverage dicts for the region of interest. None if failed
 
     """
-    dataset_version = db.get_dataset_version(dataset, ds_version)
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
     if not dataset_version:
         raise error.NotFoundError(f'Unable to find the dataset version in the database')
 
     if end_pos is None:
         end_pos = start_pos
-    coverage = list(db.Coverage.select()
-                    .where((db.Coverage.pos >= start_pos) &
-                           (db.Coverage.pos <= end_pos) &
-                           (db.Coverage.chrom == chrom) &
-                           (db.Coverage.dataset_version == dataset_version.id))
-                    .dicts())
+    coverage_file = coverage_files.get_coverage_file(settings.coverage_dir,
+                                                     dataset_version.short_name,
+                                                     dataset_version.id, chrom)
+    if coverage_file:
+        coverage = [dict(row, dataset_version=dataset_version.id, chrom=chrom)
+                    for row in coverage_file.read(start_pos, end_pos)]
+        if not coverage:
+            raise error.NotFoundError('No coverage found for the region')
+        return coverage
+
+    if dataset_version.coverage_blocks:
+        blocks = (db.CoverageBlock.select(db.CoverageBlock.coverage)
+                  .where((db.CoverageBlock.dataset_version == dataset_version.id) &
+                         (db.CoverageBlock.chrom == chrom) &
+                         (db.CoverageBlock.start_pos > start_pos - db.COVERAGE_BLOCK_SIZE) &
+                         (db.CoverageBlock.start_pos <= end_pos) &
+                         (db.CoverageBlock.end_pos >= start_pos))
+                  .order_by(db.CoverageBlock.start_pos))
+        coverage = [dict(row, dataset_version=dataset_version.id, chrom=chrom)
+                    for block in blocks
+                    for row in block.coverage
+                    if start_pos <= row['pos'] <= end_pos]
+    else:
+        coverage = list(db.Coverage.select()
+                        .where((db.Coverage.pos >= start_pos) &
+                               (db.Coverage.pos <= end_pos) &
+                               (db.Coverage.chrom == chrom) &
+                               (db.Coverage.dataset_version == dataset_version.id))
+                        .dicts())
     if not coverage:
         raise error.NotFoundError('No coverage found for the region')
     return coverage
 
 
+def get_coverage_bins(dataset: str, chrom: str, start_pos: int,  # pylint: disable=too-many-arguments
+                      end_pos: int, bin_size: int, ds_version: str = None) -> list:
+    """
+    Get the coverage bins of a size computed at import overlapping start_pos->end_pos.
+
+    Args:
+        dataset (str): short name for the dataset
+        chrom (str): chromosome
+        start_pos (int): first position of interest
+        end_pos (int): last position of interest
+        bin_size (int): size of the bins, one of utils.COVERAGE_BIN_SIZES
+        ds_version (str): version of the dataset
+
+    Returns:
+        list: coverage bin dicts for the region of interest
+
+    """
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
+    if not dataset_version:
+        raise error.NotFoundError('Unable to find the dataset version in the database')
+
+    coverage = list(db.CoverageBin.select()
+                    .where((db.CoverageBin.dataset_version == dataset_version.id) &
+                           (db.CoverageBin.bin_size == bin_size) &
+                           (db.CoverageBin.chrom == chrom) &
+                           (db.CoverageBin.pos > start_pos - bin_size) &
+                           (db.CoverageBin.pos <= end_pos))
+                    .order_by(db.CoverageBin.pos)
+                    .dicts())
+    if not coverage:
+        raise error.NotFoundError('No coverage bins found for the region')
+    return coverage
+
+
+def get_coverage_for_exons(dataset: str, transcript: dict, padding: int = 0,
+                           ds_version: str = None) -> list:
+    """
+    Get the coverage for the exons of a transcript, skipping bases without coverage.
+
+    The coverage per position is selected in a single query joining the exons
+    of the transcript to the coverage, so each exon is read as an index range
+    and the introns are not read. Coverage files are read for each exon, while
+    coverage blocks are read for the transcript and then filtered.
+
+    Args:
+        dataset (str): short name for the dataset
+        transcript (dict): the transcript, as returned by get_transcript()
+        padding (int): number of bases added on both sides of each exon
+        ds_version (str): version of the dataset
+
+    Returns:
+        list: coverage dicts for the exons, sorted by position
+
+    """
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
+    if not dataset_version:
+        raise error.NotFoundError('Unable to find the dataset version in the database')
+
+    chrom = transcript['chrom']
+    coverage_file = coverage_files.get_coverage_file(settings.coverage_dir,
+                                                     dataset_version.short_name,
+                                                     dataset_version.id, chrom)
+    intervals = _exon_intervals(transcript['exons'], padding)
+    if coverage_file:
+        return [dict(row, dataset_version=dataset_version.id, chrom=chrom)
+                for start_pos, end_pos in intervals
+                for row in coverage_file.read(start_pos, end_pos)
+                if row['mean']]
+
+    if not dataset_version.coverage_blocks:
+        # padded exons can overlap, so each position is selected once
+        coverage = list(db.Coverage.select()
+                        .distinct([db.Coverage.pos])
+                        .join(db.Feature, on=((db.Coverage.pos >= db.Feature.start - padding) &
+                                              (db.Coverage.pos <= db.Feature.stop + padding)))
+                        .where((db.Feature.transcript == transcript['id']) &
+                               (db.Feature.feature_type == 'exon') &
+                               (db.Coverage.dataset_version == dataset_version.id) &
+                               (db.Coverage.chrom == chrom) &
+                               (db.Coverage.mean > 0))
+                        .order_by(db.Coverage.pos)
+                        .dicts())
+        if coverage:
+            return coverage
+
+    coverage = get_coverage_for_bases(dataset, chrom, transcript['start'] - padding,
+                                      transcript['stop'] + padding, ds_version)
+    return [row for row in coverage if row['mean'] and _in_intervals(row['pos'], intervals)]
+
+
 def get_coverage_for_transcript(dataset: str, chrom: str, start_pos: int,
                                 end_pos: int = None, ds_version: str = None) -> list:
     """
@@ -209,7 +352,7 @@ def get_exons_in_transcript(dataset: str, transcript_id: str, ds_version: str =
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError:
         logging.info(f'get_exons_in_transcript({dataset}, ' +
                      f'{transcript_id}): unable to find dataset dbid')
@@ -251,7 +394,7 @@ def get_gene(dataset: str, gene_id: str, ds_version: str = None) -> dict:
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError as err:
         raise error.NotFoundError(f'Reference set not found for dataset {dataset}.') from err
 
@@ -295,7 +438,7 @@ def get_gene_by_name(dataset: str, gene_name: str, ds_version: str = None) -> di
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError as err:
         raise error.NotFoundError(f'Reference set not found for dataset {dataset}.') from err
 
@@ -318,8 +461,38 @@ def get_gene_by_name(dataset: str, gene_name: str, ds_version: str = None) -> di
             raise error.NotFoundError(f'Gene {gene_name} not found in reference data') from err
 
 
+def get_gene_name_index(ref_set: int) -> tuple:
+    """
+    Get the sorted gene names and aliases of a reference set.
+
+    The index is built on first use and kept in memory, as reference sets do
+    not change while the server is running.
+
+    Args:
+        ref_set (int): id of the reference set
+
+    Returns:
+        tuple: (upper case names, names), both sorted by the upper case names
+
+    """
+    with _GENE_NAME_INDEX_LOCK:
+        index = _GENE_NAME_INDEX.get(ref_set)
+        if index is None:
+            genes = (db.Gene.select(db.Gene.name)
+                     .where(db.Gene.reference_set == ref_set))
+            aliases = (db.GeneOtherNames.select(db.GeneOtherNames.name)
+                       .join(db.Gene)
+                       .where(db.Gene.reference_set == ref_set))
+            names = {gene.name for gene in genes} | {alias.name for alias in aliases}
+            names.discard(None)
+            names = sorted(names, key=lambda name: (name.upper(), name))
+            index = ([name.upper() for name in names], names)
+            _GENE_NAME_INDEX[ref_set] = index
+    return index
+
+
 def get_genes_in_region(dataset: str, chrom: str, start_pos: int,
-                        stop_pos: int, ds_version: str = None) -> dict:
+                        stop_pos: int, ds_version: str = None) -> list:
     """
     Retrieve genes located within a region.
 
@@ -331,11 +504,11 @@ def get_genes_in_region(dataset: str, chrom: str, start_pos: int,
         ds_version (str): dataset version
 
     Returns:
-        dict: values for the gene; empty if not found
+        list: values for the genes (dict); empty if not found
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError as err:
         raise error.NotFoundError(f'Reference set not found for dataset {dataset}.') from err
 
@@ -343,7 +516,7 @@ def get_genes_in_region(dataset: str, chrom: str, start_pos: int,
                                    (db.Gene.start <= stop_pos) &
                                    (db.Gene.stop >= start_pos) &
                                    (db.Gene.chrom == chrom)).dicts()
-    return genes
+    return list(genes)
 
 
 def get_raw_variant(dataset: str, pos: int, chrom: str, ref: str,  # pylint: disable=too-many-arguments
@@ -363,37 +536,68 @@ def get_raw_variant(dataset: str, pos: int, chrom: str, ref: str,  # pylint: dis
         dict: values for the variant; None if not found
 
     """
-    dataset_version = db.get_dataset_version(dataset, ds_version)
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
     if not dataset_version:
         raise error.NotFoundError(f'Unable to find the dataset version in the database')
 
     try:
-        variant = (db.Variant
-                   .select()
-                   .where((db.Variant.pos == pos) &
-                          (db.Variant.ref == ref) &
-                          (db.Variant.alt == alt) &
-                          (db.Variant.chrom == chrom) &
-                          (db.Variant.dataset_version == dataset_version))
-                   .dicts()
-                   .get())
-        variant['genes'] = [gene['gene_id'] for gene in
-                            db.VariantGenes.select(db.Gene.gene_id)
-                            .join(db.Gene)
-                            .where(db.VariantGenes.variant == variant['id'])
-                            .dicts()]
-        variant['transcripts'] = [transcript['transcript_id'] for transcript in
-                                  db.VariantTranscripts.select(db.Transcript.transcript_id)
-                                  .join(db.Transcript)
-                                  .where(db.VariantTranscripts.variant == variant['id'])
-                                  .dicts()]
-        return variant
+        return (raw_variants_query(dataset_version.id)
+                .where((db.Variant.pos == pos) &
+                       (db.Variant.ref == ref) &
+                       (db.Variant.alt == alt) &
+                       (db.Variant.chrom == chrom))
+                .get())
     except db.Variant.DoesNotExist as err:
         logging.info('get_raw_variant({}, {}, {}, {}, {}, {}): unable to retrieve variant'
                      .format(dataset, pos, chrom, ref, alt, dataset_version.id))
         raise error.NotFoundError(f'Variant {chrom}-{pos}-{ref}-{alt} not found') from err
 
 
+def get_search_index(ref_set: int) -> dict:
+    """
+    Get the symbols of a reference set that can be searched for.
+
+    The symbols are gene names, gene aliases, Ensembl gene ids and Ensembl
+    transcript ids. Gene names take precedence over aliases and ids using
+    the same symbol. The index is built on first use and kept in memory, as
+    reference sets do not change while the server is running.
+
+    Args:
+        ref_set (int): id of the reference set
+
+    Returns:
+        dict: (datatype, identifier) for each symbol
+
+    """
+    with _SEARCH_INDEX_LOCK:
+        index = _SEARCH_INDEX.get(ref_set)
+        if index is None:
+            index = {}
+            genes = (db.Gene.select(db.Gene.name, db.Gene.gene_id)
+                     .where(db.Gene.reference_set == ref_set)
+                     .order_by(db.Gene.id)
+                     .tuples())
+            aliases = (db.GeneOtherNames.select(db.GeneOtherNames.name, db.Gene.gene_id)
+                       .join(db.Gene)
+                       .where(db.Gene.reference_set == ref_set)
+                       .order_by(db.GeneOtherNames.id)
+                       .tuples())
+            transcripts = (db.Transcript.select(db.Transcript.transcript_id)
+                           .join(db.Gene)
+                           .where(db.Gene.reference_set == ref_set)
+                           .order_by(db.Transcript.id))
+            genes = list(genes)
+            for symbols in (genes, aliases, [(gene_id, gene_id) for _, gene_id in genes]):
+                for symbol, gene_id in symbols:
+                    if symbol:
+                        index.setdefault(symbol, ('gene', gene_id))
+            for transcript in transcripts:
+                index.setdefault(transcript.transcript_id,
+                                 ('transcript', transcript.transcript_id))
+            _SEARCH_INDEX[ref_set] = index
+    return index
+
+
 def get_transcript(dataset: str, transcript_id: str, ds_version: str = None) -> dict:
     """
     Retrieve transcript by transcript id.
@@ -410,7 +614,7 @@ def get_transcript(dataset: str, transcript_id: str, ds_version: str = None) ->
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError as err:
         raise error.NotFoundError(f'Reference set not found for dataset {dataset}.') from err
     try:
@@ -442,7 +646,7 @@ def get_transcripts_in_gene(dataset: str, gene_id: str, ds_version: str = None)
 
     """
     try:
-        ref_set = db.get_dataset_version(dataset, ds_version).reference_set
+        ref_set = db.get_dataset_version_record(dataset, ds_version).reference_set
     except AttributeError as err:
         logging.info(f'get_transcripts_in_gene({dataset}, {gene_id}): unable to get ref dbid')
         raise error.NotFoundError(f'Reference set not found for dataset {dataset}.') from err
@@ -496,12 +700,54 @@ def get_variant(dataset: str, pos: int, chrom: str, ref: str,  # pylint: disable
 
     """
     variant = get_raw_variant(dataset, pos, chrom, ref, alt, ds_version)
-    variant = get_raw_variant(dataset, pos, chrom, ref, alt, ds_version)
     if variant and variant.get('rsid') and not str(variant['rsid']).startswith('rs'):
         variant['rsid'] = 'rs{}'.format(variant['rsid'])
     return variant
 
 
+def get_variant_in_other_datasets(dataset: str, pos: int, chrom: str,  # pylint: disable=too-many-arguments
+                                  ref: str, alt: str, ds_version: str = None) -> list:
+    """
+    Retrieve a variant from the current versions of other datasets with the same reference set.
+
+    All datasets are searched in a single query, and only the frequencies of
+    the variant are retrieved.
+
+    Args:
+        dataset (str): short name of the dataset to compare with
+        pos (int): position of the variant
+        chrom (str): name of the chromosome
+        ref (str): reference sequence
+        alt (str): variant sequence
+        ds_version (str): version of the dataset to compare with
+
+    Returns:
+        list: (DatasetVersionRecord, variant dict) for each dataset where the variant was found
+
+    """
+    curr_dsv = db.get_dataset_version_record(dataset, ds_version)
+    if not curr_dsv:
+        raise error.NotFoundError('Unable to find the dataset version in the database')
+
+    # datasets whose only version is not released yet have no current version
+    query = (db.Variant
+             .select(*FREQUENCY_COLUMNS, db.DatasetVersionCurrent, db.Dataset)
+             .join(db.DatasetVersionCurrent,
+                   on=(db.Variant.dataset_version == db.DatasetVersionCurrent.id),
+                   attr='current_version')
+             .join(db.Dataset)
+             .where((db.Variant.pos == pos) &
+                    (db.Variant.ref == ref) &
+                    (db.Variant.alt == alt) &
+                    (db.Variant.chrom == chrom) &
+                    (db.DatasetVersionCurrent.reference_set == curr_dsv.reference_set) &
+                    (db.Dataset.short_name != dataset))
+             .order_by(db.Dataset.id))
+    return [(db.DatasetVersionRecord.from_model(variant.current_version),
+             {column.name: getattr(variant, column.name) for column in FREQUENCY_COLUMNS})
+            for variant in query]
+
+
 def get_variants_by_rsid(dataset: str, rsid: str, ds_version: str = None) -> list:
     """
     Retrieve variants by their associated rsid.
@@ -515,7 +761,7 @@ def get_variants_by_rsid(dataset: str, rsid: str, ds_version: str = None) -> lis
         list: variants as dict; no hits returns None
 
     """
-    dataset_version = db.get_dataset_version(dataset, ds_version)
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
     if not dataset_version:
         raise error.NotFoundError(f'Unable to find the dataset version in the database')
 
@@ -531,8 +777,9 @@ def get_variants_by_rsid(dataset: str, rsid: str, ds_version: str = None) -> lis
 
     variants = (db.Variant
                 .select()
-                .where((db.Variant.rsid == int_rsid) &
-                       (db.Variant.dataset_version == dataset_version))
+                .join(db.VariantRsid, on=(db.VariantRsid.variant == db.Variant.id))
+                .where((db.VariantRsid.dataset_version == dataset_version.id) &
+                       (db.VariantRsid.rsid == int_rsid))
                 .dicts())
 
     if not variants:
@@ -553,27 +800,7 @@ def get_variants_in_gene(dataset: str, gene_id: str, ds_version: str = None) ->
         list: values for the variants
 
     """
-    dataset_version = db.get_dataset_version(dataset, ds_version)
-    if not dataset_version:
-        raise error.NotFoundError(f'Unable to find the dataset version in the database')
-    gene = get_gene(dataset, gene_id, ds_version)
-    if not gene:
-        raise error.NotFoundError(f'Gene {gene_id} not found in reference data')
-
-    variants = list(db.Variant.select()
-                    .join(db.VariantGenes)
-                    .where((db.VariantGenes.gene == gene['id']) &
-                           (db.Variant.dataset_version == dataset_version))
-                    .dicts())
-    for variant in variants:
-        if not variant['hom_count']:
-            variant['hom_count'] = 0
-        variant['filter'] = variant['filter_string']
-
-    for variant in variants:
-        if variant['rsid']:
-            variant['rsid'] = 'rs{}'.format(variant['rsid'])
-    return variants
+    return list(iter_variants_in_gene(dataset, gene_id, ds_version))
 
 
 def get_variants_in_region(dataset: str, chrom: str, start_pos: int,
@@ -592,65 +819,382 @@ def get_variants_in_region(dataset: str, chrom: str, start_pos: int,
         list: variant dicts, None if no hits
 
     """
-    dataset_version = db.get_dataset_version(dataset, ds_version)
+    return list(iter_variants_in_region(dataset, chrom, start_pos, end_pos, ds_version))
+
+
+def get_variants_in_transcript(dataset: str, transcript_id: str, ds_version: str = None) -> list:
+    """
+    Retrieve variants inside a transcript.
+
+    Args:
+        dataset (str): short name of the dataset
+        transcript_id (str): id of the transcript (ENST)
+        ds_version (str): version of the dataset
+
+    Returns:
+        list: values for the variant; None if not found
+
+    """
+    return list(iter_variants_in_transcript(dataset, transcript_id, ds_version))
+
+
+def get_variants_query(dataset: str, datatype: str, item, ds_version: str = None,
+                       list_columns: bool = False):
+    """
+    Build the query for the variants in a gene, transcript or region.
+
+    The query is not executed, so it can be further filtered or iterated with a
+    server-side cursor.
+
+    With ``list_columns``, only the columns used in the variant lists are
+    selected. The consequence summary is taken for the gene or transcript if
+    the datatype is gene or transcript. The VEP annotations are then only
+    included for variants imported without a consequence summary.
+
+    Args:
+        dataset (str): short name of the dataset
+        datatype (str): gene, transcript or region
+        item: gene id, transcript id or (chrom, start_pos, end_pos) for a region
+        ds_version (str): version of the dataset
+        list_columns (bool): only select the columns needed for variant lists
+
+    Returns:
+        peewee.SelectQuery: query returning the variants as dicts
+
+    """
+    columns = []
+    if list_columns:
+        summary = {'gene': db.VariantGenes,
+                   'transcript': db.VariantTranscripts}.get(datatype, db.Variant)
+        columns = list(VARIANT_LIST_COLUMNS)
+        columns += [getattr(summary, column) for column in CONSEQUENCE_SUMMARY_COLUMNS]
+        columns.append(Case(None,
+                            [(summary.major_consequence.is_null(), db.Variant.vep_annotations)],
+                            None).alias('vep_annotations'))
+
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
     if not dataset_version:
         raise error.NotFoundError(f'Unable to find the dataset version in the database')
+
+    if datatype == 'gene':
+        gene = get_gene(dataset, item, ds_version)
+        if not gene:
+            raise error.NotFoundError(f'Gene {item} not found in reference data')
+        query = (db.Variant.select(*columns)
+                 .join(db.VariantGenes)
+                 .where(db.VariantGenes.gene == gene['id']))
+    elif datatype == 'transcript':
+        transcript = get_transcript(dataset, item, ds_version)
+        if not transcript:
+            raise error.NotFoundError(f'Transcript {item} not found in reference data')
+        query = (db.Variant.select(*columns)
+                 .join(db.VariantTranscripts)
+                 .where(db.VariantTranscripts.transcript == transcript['id']))
+    elif datatype == 'region':
+        chrom, start_pos, end_pos = item
+        query = (db.Variant.select(*columns)
+                 .where((db.Variant.pos >= start_pos) &
+                        (db.Variant.pos <= end_pos) &
+                        (db.Variant.chrom == chrom)))
+    else:
+        raise error.MalformedRequest(f'Unknown datatype: {datatype}')
+
+    return query.where(db.Variant.dataset_version == dataset_version.id).dicts()
+
+
+def iter_variants(query, fetch_size: int = None, transcript_id: str = None):
+    """
+    Iterate over the variants of a query using a server-side cursor.
+
+    Only ``fetch_size`` rows are held in memory at a time. Must be consumed
+    within a single thread, as the cursor lives in a transaction.
+
+    Args:
+        query (peewee.SelectQuery): query from get_variants_query()
+        fetch_size (int): rows per fetch; defaults to the variantFetchSize setting
+        transcript_id (str): if given, only keep the VEP annotations for this transcript
+
+    Yields:
+        dict: values for a variant
+
+    """
+    if not fetch_size:
+        fetch_size = settings.variant_fetch_size
+    for variant in ServerSide(query, array_size=fetch_size):
+        prepare_variant(variant)
+        if transcript_id and variant.get('vep_annotations'):
+            variant['vep_annotations'] = [anno for anno in variant['vep_annotations']
+                                          if anno['Feature'] == transcript_id]
+        yield variant
+
+
+def iter_variant_frequencies(dataset: str, variants: list, ds_version: str = None):
+    """
+    Iterate over the frequencies of many variants.
+
+    The variants are looked up in batches of ``VARIANT_BATCH_SIZE`` per query,
+    and yielded in the given order.
+
+    Args:
+        dataset (str): short name of the dataset
+        variants (list): (chrom, pos, ref, alt) for each variant
+        ds_version (str): dataset version
+
+    Yields:
+        tuple: ((chrom, pos, ref, alt), frequencies as dict; None if not found)
+
+    """
+    dataset_version = db.get_dataset_version_record(dataset, ds_version)
+    if not dataset_version:
+        raise error.NotFoundError('Unable to find the dataset version in the database')
+
     query = (db.Variant
-             .select()
-             .where((db.Variant.pos >= start_pos) &
-                    (db.Variant.pos <= end_pos) &
-                    (db.Variant.chrom == chrom) &
-                    (db.Variant.dataset_version == dataset_version))
+             .select(db.Variant.chrom, db.Variant.pos, db.Variant.ref, db.Variant.alt,
+                     *FREQUENCY_COLUMNS)
+             .where(db.Variant.dataset_version == dataset_version.id)
              .dicts())
+    for key, variant in _iter_variants_by_key(query, variants):
+        if variant:
+            variant = {column.name: variant[column.name] for column in FREQUENCY_COLUMNS}
+        yield key, variant
 
-    variants = list(query)
 
-    for variant in variants:
-        if not variant['hom_count']:
-            variant['hom_count'] = 0
-        variant['filter'] = variant['filter_string']
+def iter_variants_in_gene(dataset: str, gene_id: str, ds_version: str = None,
+                          fetch_size: int = None):
+    """
+    Iterate over the variants present inside a gene using a server-side cursor.
 
-    for variant in variants:
-        if variant['rsid']:
-            variant['rsid'] = 'rs{}'.format(variant['rsid'])
-    return variants
+    Args:
+        dataset (str): short name of the dataset
+        gene_id (str): id of the gene
+        ds_version (str): version of the dataset
+        fetch_size (int): rows per fetch; defaults to the variantFetchSize setting
 
+    Yields:
+        dict: values for a variant
 
-def get_variants_in_transcript(dataset: str, transcript_id: str, ds_version: str = None) -> list:
     """
-    Retrieve variants inside a transcript.
+    query = get_variants_query(dataset, 'gene', gene_id, ds_version)
+    yield from iter_variants(query, fetch_size)
+
+
+def iter_variants_in_region(dataset: str, chrom: str, start_pos: int,  # pylint: disable=too-many-arguments
+                            end_pos: int, ds_version: str = None, fetch_size: int = None):
+    """
+    Iterate over the variants that overlap a region using a server-side cursor.
+
+    Args:
+        dataset (str): short name of the dataset
+        chrom (str): name of the chromosome
+        start_pos (int): start of the region
+        end_pos (int): end of the region
+        ds_version (str): version of the dataset
+        fetch_size (int): rows per fetch; defaults to the variantFetchSize setting
+
+    Yields:
+        dict: values for a variant
+
+    """
+    query = get_variants_query(dataset, 'region', (chrom, start_pos, end_pos), ds_version)
+    yield from iter_variants(query, fetch_size)
+
+
+def iter_variants_in_transcript(dataset: str, transcript_id: str, ds_version: str = None,
+                                fetch_size: int = None):
+    """
+    Iterate over the variants inside a transcript using a server-side cursor.
 
     Args:
         dataset (str): short name of the dataset
         transcript_id (str): id of the transcript (ENST)
         ds_version (str): version of the dataset
+        fetch_size (int): rows per fetch; defaults to the variantFetchSize setting
+
+    Yields:
+        dict: values for a variant
+
+    """
+    query = get_variants_query(dataset, 'transcript', transcript_id, ds_version)
+    yield from iter_variants(query, fetch_size, transcript_id)
+
+
+def prepare_variant(variant: dict):
+    """
+    Fill in defaults and format the rsid of a variant read from the database.
+    Changes are performed in-place.
+
+    Args:
+        variant (dict): variant data from database
+
+    """
+    if not variant['hom_count']:
+        variant['hom_count'] = 0
+    variant['filter'] = variant['filter_string']
+    if variant['rsid']:
+        variant['rsid'] = 'rs{}'.format(variant['rsid'])
+
+
+def raw_variants_query(dataset_version_id: int):
+    """
+    Build the query for variants including the ids of their genes and transcripts.
+
+    The genes and transcripts are aggregated into arrays in the same query.
+
+    Args:
+        dataset_version_id (int): id of the dataset version
 
     Returns:
-        list: values for the variant; None if not found
+        peewee.SelectQuery: query returning the variants as dicts
 
     """
-    dataset_version = db.get_dataset_version(dataset, ds_version)
-    if not dataset_version:
-        raise error.NotFoundError(f'Unable to find the dataset version in the database')
+    genes = (db.VariantGenes
+             .select(db.Gene.gene_id)
+             .join(db.Gene)
+             .where(db.VariantGenes.variant == db.Variant.id)
+             .order_by(db.VariantGenes.id))
+    transcripts = (db.VariantTranscripts
+                   .select(db.Transcript.transcript_id)
+                   .join(db.Transcript)
+                   .where(db.VariantTranscripts.variant == db.Variant.id)
+                   .order_by(db.VariantTranscripts.id))
+    return (db.Variant
+            .select(db.Variant, fn.ARRAY(genes).alias('genes'),
+                    fn.ARRAY(transcripts).alias('transcripts'))
+            .where(db.Variant.dataset_version == dataset_version_id)
+            .dicts())
+
+
+def _search(dataset_version: db.DatasetVersionRecord, query: str) -> tuple:
+    """
+    Resolve a search in a dataset version, see get_awesomebar_result().
 
-    transcript = get_transcript(dataset, transcript_id, ds_version)
-    if not transcript:
-        raise error.NotFoundError(f'Transcript {transcript_id} not found in reference data')
+    Args:
+        dataset_version (db.DatasetVersionRecord): the dataset version
+        query (str): the stripped search query
 
-    variants = list(db.Variant.select()
-                    .join(db.VariantTranscripts)
-                    .where((db.VariantTranscripts.transcript == transcript['id']) &
-                           (db.Variant.dataset_version == dataset_version))
-                    .dicts())
+    Returns:
+        tuple: (datatype, identifier)
 
-    for variant in variants:
-        if not variant['hom_count']:
-            variant['hom_count'] = 0
-        variant['filter'] = variant['filter_string']
+    """
+    match = RSID_REGEX.match(query.lower())
+    if match:
+        variants = list(db.VariantRsid
+                        .select(db.Variant.variant_id, db.VariantRsid.rsid)
+                        .join(db.Variant)
+                        .where((db.VariantRsid.dataset_version == dataset_version.id) &
+                               (db.VariantRsid.rsid == int(match.group(1))))
+                        .limit(2)
+                        .dicts())
+        if len(variants) == 1:
+            return 'variant', variants[0]['variant_id']
+        if variants:
+            return 'dbsnp_variant_set', variants[0]['rsid']
+
+    index = get_search_index(dataset_version.reference_set)
+    result = index.get(query) or index.get(query.upper())
+    if result:
+        return result
+
+    return _parse_region_query(query.upper(), dataset_version)
+
+
+def _parse_region_query(query: str, dataset_version: db.DatasetVersionRecord) -> tuple:
+    """
+    Resolve a search for a region or a variant, see get_awesomebar_result().
 
-    for variant in variants:
-        variant['vep_annotations'] = [anno for anno in variant['vep_annotations']
-                                      if anno['Feature'] == transcript_id]
-        if variant['rsid']:
-            variant['rsid'] = 'rs{}'.format(variant['rsid'])
-    return variants
+    Args:
+        query (str): the upper case search query
+        dataset_version (db.DatasetVersionRecord): the dataset version; None if not found
+
+    Returns:
+        tuple: (datatype, identifier)
+
+    """
+    query = query[3:] if query.startswith('CHR') else query
+
+    match = REGION_REGEX.match(query)
+    if match:
+        target = match.group(0)
+        target_type = 'region'
+        if match.group(2) == ":":
+            target = target.replace(":", "-")
+
+        if match.group(5) and set(match.group(4)).issubset(set("ACGT")):
+            target_type = 'not_found'
+            if dataset_version:
+                variant = (db.Variant
+                           .select(db.Variant.id)
+                           .where((db.Variant.dataset_version == dataset_version.id) &
+                                  (db.Variant.chrom == match.group(1)) &
+                                  (db.Variant.pos == int(match.group(3))) &
+                                  (db.Variant.ref == match.group(4)) &
+                                  (db.Variant.alt == match.group(5))))
+                if variant.exists():
+                    target_type = 'variant'
+
+        return target_type, target
+
+    return 'not_found', query
+
+
+def _exon_intervals(features: list, padding: int) -> list:
+    """
+    Get the exons of a transcript as sorted, non-overlapping position intervals.
+
+    Args:
+        features (list): features of the transcript, as in get_transcript()['exons']
+        padding (int): number of bases added on both sides of each exon
+
+    Returns:
+        list: (start, stop) of each interval, inclusive
+
+    """
+    exons = sorted((feature['start'], feature['stop']) for feature in features
+                   if feature['feature_type'] == 'exon')
+    intervals: list = []
+    for start, stop in exons:
+        start, stop = start - padding, stop + padding
+        if intervals and start <= intervals[-1][1] + 1:
+            intervals[-1] = (intervals[-1][0], max(stop, intervals[-1][1]))
+        else:
+            intervals.append((start, stop))
+    return intervals
+
+
+def _in_intervals(pos: int, intervals: list) -> bool:
+    """
+    Check whether a position is in any of a list of intervals.
+
+    Args:
+        pos (int): the position
+        intervals (list): sorted, non-overlapping (start, stop) intervals, inclusive
+
+    Returns:
+        bool: whether the position is in an interval
+
+    """
+    index = bisect.bisect_right(intervals, (pos, float('inf'))) - 1
+    return index >= 0 and intervals[index][1] >= pos
+
+
+def _iter_variants_by_key(query, variants: list):
+    """
+    Look up many variants by position and change, ``VARIANT_BATCH_SIZE`` per query.
+
+    Args:
+        query: variant query returning dicts including chrom, pos, ref and alt
+        variants (list): (chrom, pos, ref, alt) for each variant
+
+    Yields:
+        tuple: ((chrom, pos, ref, alt), values from the query; None if not found),
+               in the given order
+
+    """
+    columns = (db.Variant.chrom, db.Variant.pos, db.Variant.ref, db.Variant.alt)
+    for i in range(0, len(variants), VARIANT_BATCH_SIZE):
+        batch = [tuple(variant) for variant in variants[i:i + VARIANT_BATCH_SIZE]]
+        found = {}
+        for variant in query.where(Tuple(*columns).in_(list(set(batch)))):
+            found[(variant['chrom'], variant['pos'], variant['ref'], variant['alt'])] = variant
+        for key in batch:
+            yield key, found.get(key)
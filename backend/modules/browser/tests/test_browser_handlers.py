@@ -18,8 +18,8 @@ def test_get_autocomplete():
     query = 'PA'
     response = requests.get('{}/api/dataset/{}/browser/autocomplete/{}'.format(BASE_URL, dataset, query))
     data = json.loads(response.text)
-    assert set(data["values"]) == set(["PABPC1P9", "PACSIN2", "PANX2", "PARP4P3",
-                                       "PARVB", "PARVG", "PATZ1", "PAXBP1", "PAXBP1-AS1"])
+    assert data["values"] == ["PABPC1P9", "PACSIN2", "PANX2", "PARP4P3", "PARVB",
+                              "PARVG", "PATZ", "PATZ1", "PAXBP1", "PAXBP1-AS1"]
 
 
 def test_download():
@@ -40,6 +40,8 @@ def test_download():
     assert len(response.text.split('\n')) == 2
     filename = f'{dataset}_{data_type}_{data_item}.csv'
     assert response.headers['content-disposition'] == f'attachment; filename={filename}'
+    response = requests.get('{}/api/dataset/{}/browser/download/{}/{}'.format(BASE_URL, dataset, data_type, 'ENST123'))
+    assert response.status_code == 404
 
     data_type = 'region'
     data_item = '22-29450622-29465622'
@@ -62,6 +64,12 @@ def test_get_coverage():
     response = requests.get('{}/api/dataset/{}/browser/coverage/{}/{}'.format(BASE_URL, dataset, data_type, data_item))
     data = json.loads(response.text)
     assert len(data['coverage']) == 144
+    response = requests.get('{}/api/dataset/{}/browser/coverage/{}/{}?bins=5'.format(BASE_URL, dataset, data_type, data_item))
+    data = json.loads(response.text)
+    assert len(data['coverage']) == 5
+    assert set(data['coverage'][0]) == {'pos', 'mean', 'median', 'min', 'max', 'coverage'}
+    response = requests.get('{}/api/dataset/{}/browser/coverage/{}/{}?bins=x'.format(BASE_URL, dataset, data_type, data_item))
+    assert response.status_code == 400
     data_type = 'region'
     data_item = '1-1-1000000'
     response = requests.get('{}/api/dataset/{}/browser/coverage/{}/{}'.format(BASE_URL, dataset, data_type, data_item))
@@ -101,6 +109,32 @@ def test_get_coverage_pos():
     assert response.status_code == 404
 
 
+def test_get_frequencies():
+    """
+    Test GetFrequencies.post()
+    """
+    dataset = 'SweGen'
+
+    url = '{}/api/dataset/{}/browser/frequencies'.format(BASE_URL, dataset)
+    response = requests.post(url, data=json.dumps(['22-29461622-G-A', '1-55500281-A-T']))
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{'variantId': '22-29461622-G-A', 'found': True, 'alleleCount': 1247,
+                      'alleleNum': 2000, 'alleleFreq': 0.6235, 'homCount': 772},
+                     {'variantId': '1-55500281-A-T', 'found': False}]
+
+    response = requests.post(url, data='#CHROM\tPOS\tID\tREF\tALT\n22\t16080482\t.\tCAT\tC\n')
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 1
+    assert lines[0]['alleleCount'] == 314
+
+    response = requests.post(url, data='22-16080482-CAT')
+    assert response.status_code == 400
+    response = requests.post('{}/api/dataset/{}/browser/frequencies'.format(BASE_URL, 'bad_dataset'),
+                             data='22-16080482-CAT-C')
+    assert response.status_code == 404
+
+
 def test_get_gene():
     """
     Test GetGene.get()
@@ -126,6 +160,28 @@ def test_get_gene():
     gene_id = 'BAD_GENE_ID'
     response = requests.get('{}/api/dataset/{}/browser/gene/{}'.format(BASE_URL, dataset, gene_id))
     assert response.status_code == 404
+    assert 'Cache-Control' not in response.headers
+
+
+def test_get_gene_cached():
+    """
+    Test the response cache and ETags of GetGene.get()
+    """
+    url = f'{BASE_URL}/api/dataset/SweGen/browser/gene/ENSG00000015475'
+    first = requests.get(url)
+    second = requests.get(url)
+    assert second.text == first.text
+    assert second.headers['Etag'] == first.headers['Etag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    response = requests.get(url, headers={'If-None-Match': first.headers['Etag']})
+    assert response.status_code == 304
+    assert not response.text
+
+    # explicit version
+    url = f'{BASE_URL}/api/dataset/SweGen/version/20161223/browser/gene/ENSG00000015475'
+    response = requests.get(url)
+    assert response.headers['Cache-Control'].startswith('max-age=')
 
 
 def test_get_region():
@@ -4,18 +4,34 @@ Tests for the functions available in lookups.py
 
 import pytest
 
+import coverage_files
+import db
+import settings
+
 from .. import error
 from .. import lookups
 
 
+def set_coverage_blocks(version_id: int, coverage_blocks: bool):
+    """Record whether a dataset version stores its coverage in blocks."""
+    (db.DatasetVersion.update(coverage_blocks=coverage_blocks)
+     .where(db.DatasetVersion.id == version_id)
+     .execute())
+    db.invalidate_dataset_version_cache()
+
+
 def test_autocomplete():
     """
     Test get_autocomplete()
     """
     res = lookups.autocomplete('SweGen', 'PA')
-    expected = set(["PABPC1P9", "PACSIN2", "PANX2", "PARP4P3",
-                    "PARVB", "PARVG", "PATZ1", "PAXBP1", "PAXBP1-AS1"])
-    assert set(res) == expected
+    expected = ["PABPC1P9", "PACSIN2", "PANX2", "PARP4P3", "PARVB",
+                "PARVG", "PATZ", "PATZ1", "PAXBP1", "PAXBP1-AS1"]
+    assert res == expected
+    assert lookups.autocomplete('SweGen', 'pa', limit=3) == expected[:3]
+    # aliases
+    assert lookups.autocomplete('SweGen', 'hpp') == ['hPPAR']
+    assert lookups.autocomplete('SweGen', 'PAZ') == []
     with pytest.raises(error.NotFoundError):
         res = lookups.autocomplete('Bad_dataset', 'PA')
 
@@ -44,9 +60,45 @@ def test_get_awesomebar_result():
     assert result == ('variant', '22-29461622-G-A')
     result = lookups.get_awesomebar_result('SweGen', 'DOES_NOT_EXIST')
     assert result == ('not_found', 'DOES_NOT_EXIST')
+    result = lookups.get_awesomebar_result('SweGen', ' nf1p3 ')
+    assert result == ('gene', 'ENSG00000183249')
+    result = lookups.get_awesomebar_result('SweGen', 'PATZ')
+    assert result == ('gene', 'ENSG00000100105')
+    result = lookups.get_awesomebar_result('SweGen', 'enst00000457709')
+    assert result == ('transcript', 'ENST00000457709')
+    result = lookups.get_awesomebar_result('SweGen', 'rs1')
+    assert result == ('not_found', 'RS1')
+    result = lookups.get_awesomebar_result('Bad_dataset', '22-46615715-46615880')
+    assert result == ('region', '22-46615715-46615880')
+    result = lookups.get_awesomebar_result('Bad_dataset', '22-29461622-G-A')
+    assert result == ('not_found', '22-29461622-G-A')
+
+    # searches without results are remembered
+    version_id = db.get_dataset_version_record('SweGen', None).id
+    assert lookups._AWESOMEBAR_MISSES[('SweGen', version_id, 'rs1')] == 'RS1'  # pylint: disable=protected-access
+    lookups.AWESOMEBAR_MISS_CACHE_SIZE, orig = 1, lookups.AWESOMEBAR_MISS_CACHE_SIZE
+    try:
+        assert lookups.get_awesomebar_result('SweGen', 'NOT_A_GENE') == ('not_found', 'NOT_A_GENE')
+        assert lookups.get_awesomebar_result('SweGen', 'rs1') == ('not_found', 'RS1')
+        assert len(lookups._AWESOMEBAR_MISSES) == 1  # pylint: disable=protected-access
+    finally:
+        lookups.AWESOMEBAR_MISS_CACHE_SIZE = orig
+
+
+def test_invalidate_awesomebar_misses():
+    """
+    Test invalidate_awesomebar_misses()
+    """
+    lookups.invalidate_awesomebar_misses()
+    lookups.get_awesomebar_result('SweGen', 'DOES_NOT_EXIST')
+    lookups.get_awesomebar_result('Dataset 1', 'DOES_NOT_EXIST')
+    lookups.invalidate_awesomebar_misses('SweGen')
+    assert [key[0] for key in lookups._AWESOMEBAR_MISSES] == ['Dataset 1']  # pylint: disable=protected-access
+    lookups.invalidate_awesomebar_misses()
+    assert not lookups._AWESOMEBAR_MISSES  # pylint: disable=protected-access
 
 
-def test_get_coverage_for_bases():
+def test_get_coverage_for_bases(tmp_path, monkeypatch):
     """
     Test get_coverage_for_bases()
     """
@@ -72,11 +124,116 @@ def test_get_coverage_for_bases():
     with pytest.raises(error.NotFoundError):
         lookups.get_coverage_for_bases('SweGen', '1', 55500283, 55500285)
 
+    # coverage blocks
+    rows = [{'pos': pos, 'mean': 30.5, 'median': 30.0, 'coverage': [1.0, 0.5]}
+            for pos in range(55500280, 55500290, 2)]
+    version_id = db.get_dataset_version_record('SweGen').id
+    block = db.CoverageBlock.create(dataset_version=version_id, chrom='1',
+                                    start_pos=55500280, end_pos=55500288, coverage=rows)
+    try:
+        # only read for versions imported with coverage blocks
+        with pytest.raises(error.NotFoundError):
+            lookups.get_coverage_for_bases('SweGen', '1', 55500283, 55500285)
+        set_coverage_blocks(version_id, True)
+        coverage = lookups.get_coverage_for_bases('SweGen', '1', 55500283, 55500285)
+        assert coverage == [dict(row, dataset_version=version_id, chrom='1')
+                            for row in rows[2:3]]
+        coverage = lookups.get_coverage_for_bases('SweGen', '1', 55500270, 55500300)
+        assert [row['pos'] for row in coverage] == [row['pos'] for row in rows]
+    finally:
+        block.delete_instance()
+        set_coverage_blocks(version_id, False)
+
+    # coverage files
+    writer = coverage_files.CoverageWriter(str(tmp_path), version_id)
+    for row in rows:
+        writer.add(dict(row, chrom='1'))
+    writer.close()
+    monkeypatch.setattr(settings, 'coverage_dir', str(tmp_path))
+    coverage = lookups.get_coverage_for_bases('SweGen', '1', 55500283, 55500285)
+    assert coverage == [dict(row, dataset_version=version_id, chrom='1') for row in rows[2:3]]
+    with pytest.raises(error.NotFoundError):
+        lookups.get_coverage_for_bases('SweGen', '1', 55500289, 55500289)
+    # other chromosomes are still read from the database
+    assert len(lookups.get_coverage_for_bases('SweGen', '22', 46615715, 46615880)) == 17
+
     # incorrect dataset
     with pytest.raises(error.NotFoundError):
         lookups.get_coverage_for_bases('BAD_DATASET', '1', 55500283, 55500320)
 
 
+def test_get_coverage_bins():
+    """
+    Test get_coverage_bins()
+    """
+    coverage = lookups.get_coverage_bins('SweGen', '22', 46546450, 46549652, 1000)
+    assert [row['pos'] for row in coverage] == [46546000, 46547000, 46548000, 46549000]
+    assert sum(row['positions'] for row in coverage) > 323
+    coverage = lookups.get_coverage_bins('SweGen', '22', 46546450, 46549652, 100)
+    per_base = lookups.get_coverage_for_bases('SweGen', '22', 46546400, 46549699)
+    assert sum(row['positions'] for row in coverage) == len(per_base)
+
+    with pytest.raises(error.NotFoundError):
+        lookups.get_coverage_bins('SweGen', '1', 55500283, 55500285, 100)
+    with pytest.raises(error.NotFoundError):
+        lookups.get_coverage_bins('BAD_DATASET', '22', 46546450, 46549652, 100)
+
+
+def test_get_coverage_for_exons(tmp_path, monkeypatch):
+    """
+    Test get_coverage_for_exons()
+    """
+    transcript = lookups.get_transcript('SweGen', 'ENST00000440343')
+    # introns are skipped
+    coverage = lookups.get_coverage_for_exons('SweGen', transcript, 50)
+    assert len(coverage) == 41
+    full = lookups.get_coverage_for_transcript('SweGen', '22', transcript['start'] - 50,
+                                               transcript['stop'] + 50)
+    assert len(full) == 333
+    assert coverage == [row for row in full if row['pos'] in {row['pos'] for row in coverage}]
+    assert [row['pos'] for row in coverage] == sorted(row['pos'] for row in coverage)
+    assert len(lookups.get_coverage_for_exons('SweGen', transcript)) < 41
+
+    # coverage blocks
+    rows = [{'pos': pos, 'mean': 30.5, 'median': 30.0, 'coverage': [1.0, 0.5]}
+            for pos in range(transcript['start'] - 100, transcript['start'] + 9000, 10)]
+    exons = [(exon['start'] - 50, exon['stop'] + 50) for exon in transcript['exons']
+             if exon['feature_type'] == 'exon']
+    expected = [row['pos'] for row in rows
+                if any(start <= row['pos'] <= stop for start, stop in exons)]
+    assert 0 < len(expected) < len(rows)
+    version_id = db.get_dataset_version_record('SweGen', '20170823').id
+    block = db.CoverageBlock.create(dataset_version=version_id, chrom='22',
+                                    start_pos=rows[0]['pos'], end_pos=rows[-1]['pos'],
+                                    coverage=rows)
+    set_coverage_blocks(version_id, True)
+    try:
+        coverage = lookups.get_coverage_for_exons('SweGen', transcript, 50, '20170823')
+        assert [row['pos'] for row in coverage] == expected
+    finally:
+        block.delete_instance()
+        set_coverage_blocks(version_id, False)
+
+    # coverage files
+    version_id = db.get_dataset_version_record('SweGen').id
+    writer = coverage_files.CoverageWriter(str(tmp_path), version_id)
+    for row in full:
+        writer.add(row)
+    writer.close()
+    coverage = lookups.get_coverage_for_exons('SweGen', transcript, 50)
+    monkeypatch.setattr(settings, 'coverage_dir', str(tmp_path))
+    assert ([row['pos'] for row in lookups.get_coverage_for_exons('SweGen', transcript, 50)] ==
+            [row['pos'] for row in coverage])
+
+    # no hits
+    with pytest.raises(error.NotFoundError):
+        lookups.get_coverage_for_exons('SweGen', transcript, 50, '20170823')
+
+    # incorrect dataset
+    with pytest.raises(error.NotFoundError):
+        lookups.get_coverage_for_exons('BAD_DATASET', transcript, 50)
+
+
 def test_get_coverage_for_transcript():
     """
     Test get_coverage_for_transcript()
@@ -205,6 +362,18 @@ def test_get_gene_by_name():
     assert result['gene_id'] == 'ENSG00000223875'
 
 
+def test_get_gene_name_index():
+    """
+    Test get_gene_name_index()
+    """
+    keys, names = lookups.get_gene_name_index(1)
+    assert keys == sorted(keys)
+    assert keys == [name.upper() for name in names]
+    assert 'PATZ1' in names and 'PATZ' in names
+    assert lookups.get_gene_name_index(1)[1] is names
+    assert lookups.get_gene_name_index(-1) == ([], [])
+
+
 def test_get_genes_in_region():
     """
     Test get_genes_in_region()
@@ -225,6 +394,20 @@ def test_get_genes_in_region():
     assert not lookups.get_genes_in_region('SweGen', '22', 25595800, 25595801)
 
 
+def test_get_search_index():
+    """
+    Test get_search_index()
+    """
+    index = lookups.get_search_index(1)
+    assert index['NF1P3'] == ('gene', 'ENSG00000183249')
+    assert index['ENSG00000183249'] == ('gene', 'ENSG00000183249')
+    assert index['PATZ'] == ('gene', 'ENSG00000100105')
+    assert index['ENST00000428301'] == ('transcript', 'ENST00000428301')
+    assert len([value for value in index.values() if value[0] == 'transcript']) == 115
+    assert lookups.get_search_index(1) is index
+    assert lookups.get_search_index(-1) == {}
+
+
 def test_get_transcript():
     """
     Test get_transcript()
@@ -313,6 +496,25 @@ def test_get_variant():
     assert result['variant_id'] == '21-9411609-G-T'
 
 
+def test_get_variant_in_other_datasets():
+    """
+    Test get_variant_in_other_datasets()
+    """
+    result = lookups.get_variant_in_other_datasets('SweGen', 29461622, '22', 'G', 'A')
+    assert len(result) == 1
+    assert result[0][0].short_name == 'SweGen2'
+    assert result[0][1]['variant_id'] == '22-29461622-G-A'
+    assert result[0][1]['allele_count'] == 1247
+    assert result[0][0] == lookups.db.get_dataset_version_record('SweGen2')
+
+    # only in the current dataset
+    assert not lookups.get_variant_in_other_datasets('SweGen', 16080482, '22', 'CAT', 'C')
+
+    # incorrect dataset
+    with pytest.raises(error.NotFoundError):
+        lookups.get_variant_in_other_datasets('BAD_DATASET', 29461622, '22', 'G', 'A')
+
+
 def test_get_variants_by_rsid():
     '''
     Test get_variants_by_rsid()
@@ -393,3 +595,99 @@ def test_get_variants_in_transcript():
         assert not lookups.get_variants_in_transcript('BAD_DATASET', 'ENST00000452800')
     with pytest.raises(error.NotFoundError):
         assert not lookups.get_variants_in_transcript('SweGen', 'ENST123')
+
+
+def test_get_variants_query():
+    """
+    Test get_variants_query()
+    """
+    query = lookups.get_variants_query('SweGen', 'transcript', 'ENST00000452800')
+    assert query.count() == 508
+    query = lookups.get_variants_query('SweGen', 'region', ('22', 16360000, 16361200))
+    assert query.count() == 13
+    res = list(query.where(lookups.db.Variant.filter_string == 'PASS'))
+    assert len(res) == 4
+
+    query = lookups.get_variants_query('SweGen', 'transcript', 'ENST00000452800',
+                                       list_columns=True)
+    variant = query.dicts().first()
+    assert set(variant) == ({field.name for field in lookups.VARIANT_LIST_COLUMNS}
+                            | set(lookups.CONSEQUENCE_SUMMARY_COLUMNS)
+                            | {'vep_annotations'})
+    # no summary in the test data
+    assert variant['major_consequence'] is None
+    assert variant['vep_annotations']
+
+    # bad requests
+    with pytest.raises(error.NotFoundError):
+        lookups.get_variants_query('BAD_DATASET', 'gene', 'ENSG00000231565')
+    with pytest.raises(error.NotFoundError):
+        lookups.get_variants_query('SweGen', 'gene', 'ENSG123')
+    with pytest.raises(error.MalformedRequest):
+        lookups.get_variants_query('SweGen', 'exon', 'ENSE123')
+
+
+def test_iter_variants():
+    """
+    Test iter_variants()
+    """
+    query = lookups.get_variants_query('SweGen', 'transcript', 'ENST00000452800')
+    res = list(lookups.iter_variants(query, fetch_size=50, transcript_id='ENST00000452800'))
+    assert len(res) == 508
+    assert all(anno['Feature'] == 'ENST00000452800'
+               for variant in res for anno in variant['vep_annotations'])
+    assert all(isinstance(variant['hom_count'], int) for variant in res)
+
+
+def test_iter_variant_frequencies():
+    """
+    Test iter_variant_frequencies()
+    """
+    keys = [('22', 29461622, 'G', 'A'), ('1', 55500281, 'A', 'T'), ('22', 16080482, 'CAT', 'C')]
+    res = list(lookups.iter_variant_frequencies('SweGen', keys))
+    assert [key for key, _ in res] == keys
+    assert res[0][1] == {'variant_id': '22-29461622-G-A', 'allele_count': 1247,
+                         'allele_num': 2000, 'allele_freq': 0.6235, 'hom_count': 772}
+    assert res[1][1] is None
+    assert res[2][1]['allele_count'] == 314
+
+    # several queries
+    lookups.VARIANT_BATCH_SIZE, orig = 2, lookups.VARIANT_BATCH_SIZE
+    try:
+        assert list(lookups.iter_variant_frequencies('SweGen', keys + keys)) == res + res
+    finally:
+        lookups.VARIANT_BATCH_SIZE = orig
+
+    with pytest.raises(error.NotFoundError):
+        list(lookups.iter_variant_frequencies('bad_dataset', keys))
+
+
+def test_iter_variants_in_gene():
+    """
+    Test iter_variants_in_gene()
+    """
+    res = lookups.iter_variants_in_gene('SweGen', 'ENSG00000198062', fetch_size=100)
+    assert sum(1 for _ in res) == 512
+
+    with pytest.raises(error.NotFoundError):
+        next(lookups.iter_variants_in_gene('SweGen', 'ENSGASDFG'))
+
+
+def test_iter_variants_in_region():
+    """
+    Test iter_variants_in_region()
+    """
+    res = lookups.iter_variants_in_region('SweGen', '22', 16360000, 16361200, fetch_size=5)
+    assert len(list(res)) == 13
+
+
+def test_iter_variants_in_transcript():
+    """
+    Test iter_variants_in_transcript()
+    """
+    res = list(lookups.iter_variants_in_transcript('SweGen', 'ENST00000452800'))
+    assert len(res) == 508
+    assert res == lookups.get_variants_in_transcript('SweGen', 'ENST00000452800')
+
+    with pytest.raises(error.NotFoundError):
+        next(lookups.iter_variants_in_transcript('SweGen', 'ENST123'))
@@ -2,8 +2,12 @@
 Tests for utils.py
 """
 
+import json
+
 import pytest
 
+import db
+
 from .. import error
 from .. import lookups
 from .. import utils
@@ -69,6 +73,68 @@ def test_annotation_severity():
     assert res == -26.9
 
 
+def test_bin_coverage():
+    """
+    Test bin_coverage()
+    """
+    coverage = [{'pos': 100, 'mean': 10.0, 'median': 10.0, 'coverage': [1.0, 0.5]},
+                {'pos': 105, 'mean': 20.0, 'median': 18.0, 'coverage': [1.0, 0.7]},
+                {'pos': 112, 'mean': None, 'median': None, 'coverage': None},
+                {'pos': 125, 'mean': 30.0, 'median': 30.0, 'coverage': [0.5, 0.0]}]
+    res = utils.bin_coverage(coverage, 100, 10)
+    assert res == [{'pos': 100, 'mean': 15.0, 'median': 14.0, 'min': 10.0, 'max': 20.0,
+                    'coverage': [1.0, 0.6]},
+                   {'pos': 120, 'mean': 30.0, 'median': 30.0, 'min': 30.0, 'max': 30.0,
+                    'coverage': [0.5, 0.0]}]
+
+    # bins weighted by their positions, the one before start in the first bin
+    coverage = [{'pos': 0, 'positions': 1, 'mean': 10.0, 'median': 10.0,
+                 'min_mean': 10.0, 'max_mean': 10.0, 'coverage': [1.0]},
+                {'pos': 100, 'positions': 3, 'mean': 30.0, 'median': 20.0,
+                 'min_mean': 5.0, 'max_mean': 50.0, 'coverage': [0.6]}]
+    res = utils.bin_coverage(coverage, 50, 1000)
+    assert res == [{'pos': 50, 'mean': 25.0, 'median': 17.5, 'min': 5.0, 'max': 50.0,
+                    'coverage': [0.7]}]
+    assert utils.bin_coverage([], 50, 1000) == []
+
+
+def test_consequence_mask():
+    """
+    Test consequence_mask()
+    """
+    mask = utils.consequence_mask('missense_variant&frameshift_variant')
+    assert mask == (1 << utils.CSQ_ORDER_DICT['missense_variant'] |
+                    1 << utils.CSQ_ORDER_DICT['frameshift_variant'])
+    assert utils.consequence_mask('missense_variant&frameshift_variant') == mask
+    assert utils.consequence_mask('') == 1 << (len(utils.CSQ_ORDER) - 1)
+    with pytest.raises(KeyError):
+        utils.consequence_mask('not_a_consequence')
+
+
+def test_get_binned_coverage():
+    """
+    Test get_binned_coverage()
+    """
+    # bins computed at import
+    res = utils.get_binned_coverage('SweGen', '22', 46546400, 46549599, 32)
+    per_base = lookups.get_coverage_for_bases('SweGen', '22', 46546400, 46549599)
+    expected = utils.bin_coverage(per_base, 46546400, 100)
+    assert len(res) == len(expected) == 32
+    for binned, base in zip(res, expected):
+        for key in ('mean', 'median', 'min', 'max'):
+            assert binned[key] == pytest.approx(base[key], rel=1e-5)
+        assert binned['pos'] == base['pos']
+        assert binned['coverage'] == pytest.approx(base['coverage'], rel=1e-5)
+
+    # bins smaller than the ones computed at import
+    res = utils.get_binned_coverage('SweGen', '22', 46615715, 46615880, 4)
+    per_base = lookups.get_coverage_for_bases('SweGen', '22', 46615715, 46615880)
+    assert res == utils.bin_coverage(per_base, 46615715, 42)
+
+    with pytest.raises(error.NotFoundError):
+        utils.get_binned_coverage('SweGen', '1', 55500283, 55500285, 2)
+
+
 def test_get_coverage():
     """
     Test get_coverage()
@@ -79,6 +145,9 @@ def test_get_coverage():
     assert len(res['coverage']) == 17
     res = utils.get_coverage('SweGen', 'transcript', 'ENST00000438441')
     assert len(res['coverage']) == 144
+    # only the exons
+    res = utils.get_coverage('SweGen', 'transcript', 'ENST00000440343')
+    assert len(res['coverage']) == 41
 
     # bad regions
     with pytest.raises(error.ParsingError):
@@ -94,6 +163,24 @@ def test_get_coverage():
     with pytest.raises(error.MalformedRequest):
         res = utils.get_coverage('SweGen', 'region', '22-1-1000000')
 
+    # binned
+    res = utils.get_coverage('SweGen', 'gene', 'ENSG00000231565', bins='10')
+    assert len(res['coverage']) == 10
+    res = utils.get_coverage('SweGen', 'region', '22-46615715-46615880', bins='100')
+    assert len(res['coverage']) == 17
+    res = utils.get_coverage('SweGen', 'transcript', 'ENST00000438441', bins='1')
+    assert len(res['coverage']) == 1
+    # transcripts are binned from the exons only
+    per_base = utils.get_coverage('SweGen', 'transcript', 'ENST00000440343')['coverage']
+    res = utils.get_coverage('SweGen', 'transcript', 'ENST00000440343', bins='1')
+    assert res['coverage'][0]['mean'] == pytest.approx(sum(row['mean'] for row in per_base) /
+                                                      len(per_base))
+    assert res['coverage'][0]['min'] == min(row['mean'] for row in per_base)
+    with pytest.raises(error.ParsingError):
+        utils.get_coverage('SweGen', 'gene', 'ENSG00000231565', bins='many')
+    with pytest.raises(error.ParsingError):
+        utils.get_coverage('SweGen', 'gene', 'ENSG00000231565', bins='0')
+
 
 def test_get_coverage_pos():
     """
@@ -136,6 +223,23 @@ def test_data_structures():
                for csq in utils.CSQ_ORDER)
 
 
+def test_format_variant():
+    """
+    Test format_variant()
+    """
+    variant = lookups.get_variant('SweGen', 16269934, '22', 'A', 'G')
+    res = utils.format_variant(dict(variant), 'region', '22-16269934')
+    assert res['major_consequence'] == 'missense'
+    assert 'vep_annotations' not in res
+
+    # consequence summary stored at import
+    summary = utils.summarise_consequences(variant['vep_annotations'])
+    variant.update(summary)
+    variant['vep_annotations'] = None
+    res2 = utils.format_variant(variant, 'region', '22-16269934')
+    assert res2 == res
+
+
 def test_get_flags_from_variant():
     """
     Test get_flags_from_variant()
@@ -199,6 +303,24 @@ def test_get_transcript_hgvs():
     assert not utils.get_transcript_hgvs(dict())
 
 
+def test_get_variant_frequencies_ndjson():
+    """
+    Test get_variant_frequencies_ndjson()
+    """
+    keys = [('22', 29461622, 'G', 'A'), ('1', 55500281, 'A', 'T')]
+    res = ''.join(utils.get_variant_frequencies_ndjson('SweGen', keys))
+    lines = [json.loads(line) for line in res.splitlines()]
+    assert lines == [{'variantId': '22-29461622-G-A', 'found': True, 'alleleCount': 1247,
+                      'alleleNum': 2000, 'alleleFreq': 0.6235, 'homCount': 772},
+                     {'variantId': '1-55500281-A-T', 'found': False}]
+
+    utils.VARIANT_CHUNK_SIZE, orig = 1, utils.VARIANT_CHUNK_SIZE
+    try:
+        assert len(list(utils.get_variant_frequencies_ndjson('SweGen', keys))) == 2
+    finally:
+        utils.VARIANT_CHUNK_SIZE = orig
+
+
 def test_get_variant_list():
     """
     Test get_variant_list()
@@ -227,6 +349,36 @@ def test_get_variant_list():
         utils.get_variant_list('SweGen', 'region', '22-1-1000000')
 
 
+def test_get_variant_list_csv():
+    """
+    Test get_variant_list_csv()
+    """
+    chunks = list(utils.get_variant_list_csv('SweGen', 'transcript', 'ENST00000438441',
+                                             chunk_size=100))
+    assert chunks[0].startswith('Variant,Chrom,Position,')
+    assert [chunk.count('\n') for chunk in chunks] == [1, 100, 78]
+    rows = ''.join(chunks[1:]).split('\n')[:-1]
+    res = utils.get_variant_list('SweGen', 'transcript', 'ENST00000438441')
+    assert rows[0].split(',')[0] in [variant['variant_id'] for variant in res['variants']]
+
+    # filters
+    chunks = list(utils.get_variant_list_csv('SweGen', 'transcript', 'ENST00000438441',
+                                             filter_type='all~false'))
+    assert ''.join(chunks).count('\n') == 7
+    chunks = list(utils.get_variant_list_csv('SweGen', 'gene', 'ENSG00000198062',
+                                             filter_type='mislof~true'))
+    assert ''.join(chunks).count('\n') == 13
+    chunks = list(utils.get_variant_list_csv('SweGen', 'gene', 'ENSG00000198062',
+                                             filter_type='lof~true'))
+    assert ''.join(chunks).count('\n') == 3
+
+    # bad requests
+    with pytest.raises(error.NotFoundError):
+        list(utils.get_variant_list_csv('SweGen', 'transcript', 'ENSTWEIRD'))
+    with pytest.raises(error.MalformedRequest):
+        list(utils.get_variant_list_csv('SweGen', 'region', '22-1-1000000'))
+
+
 def test_order_vep_by_csq():
     """
     Test order_vep_by_csq()
@@ -251,6 +403,17 @@ def test_parse_dataset():
     assert utils.parse_dataset('hg19:SweGen:180101') == ('SweGen', '180101')
 
 
+def test_parse_bins():
+    """
+    Test parse_bins()
+    """
+    assert utils.parse_bins('300') == 300
+    with pytest.raises(error.ParsingError):
+        utils.parse_bins('1.5')
+    with pytest.raises(error.ParsingError):
+        utils.parse_bins('-1')
+
+
 def test_parse_region():
     assert utils.parse_region('1-2-3') == ('1', 2, 3)
     assert utils.parse_region('X-15-30') == ('X', 15, 30)
@@ -269,6 +432,43 @@ def test_parse_region():
         utils.parse_region('X-y-15')
 
 
+def test_parse_variant_lookup():
+    """
+    Test parse_variant_lookup()
+    """
+    expected = [('22', 29461622, 'G', 'A'), ('X', 15, 'C', 'T')]
+    assert utils.parse_variant_lookup('["22-29461622-G-A", "chrX-15-c-t"]') == expected
+    assert utils.parse_variant_lookup('{"variants": ["22-29461622-G-A", "X-15-C-T"]}') == expected
+    assert utils.parse_variant_lookup('22-29461622-G-A\n\nX-15-C-T\n') == expected
+    vcf = ('##fileformat=VCFv4.2\n'
+           '#CHROM\tPOS\tID\tREF\tALT\n'
+           'chr22\t29461622\t.\tG\tA,T\n'
+           'X\t15\trs1\tC\tT\t50\tPASS\n')
+    assert utils.parse_variant_lookup(vcf) == [expected[0], ('22', 29461622, 'G', 'T'),
+                                               expected[1]]
+    assert utils.parse_variant_lookup('') == []
+
+    # bad requests
+    with pytest.raises(error.ParsingError):
+        utils.parse_variant_lookup('["22-29461622-G-A"')
+    with pytest.raises(error.ParsingError):
+        utils.parse_variant_lookup('[22]')
+    with pytest.raises(error.ParsingError):
+        utils.parse_variant_lookup('{"ids": []}')
+    with pytest.raises(error.ParsingError):
+        utils.parse_variant_lookup('22-29461622-G')
+    with pytest.raises(error.ParsingError):
+        utils.parse_variant_lookup('22-x-G-A')
+    with pytest.raises(error.ParsingError):
+        utils.parse_variant_lookup('22\t29461622\t.\tG')
+    utils.VARIANT_LOOKUP_LIMIT, orig = 1, utils.VARIANT_LOOKUP_LIMIT
+    try:
+        with pytest.raises(error.MalformedRequest):
+            utils.parse_variant_lookup('22-29461622-G-A\nX-15-C-T')
+    finally:
+        utils.VARIANT_LOOKUP_LIMIT = orig
+
+
 def test_remove_extraneous_vep_annotations():
     """
     Test remove_extraneous_vep_annotations()
@@ -279,6 +479,71 @@ def test_remove_extraneous_vep_annotations():
         [{'Consequence': 'frameshift_variant'}]
 
 
+def test_summarise_consequences():
+    """
+    Test summarise_consequences()
+    """
+    variant = lookups.get_variant('SweGen', 16269934, '22', 'A', 'G')
+    orig = [dict(annotation) for annotation in variant['vep_annotations']]
+    res = utils.summarise_consequences(variant['vep_annotations'])
+    assert res['major_consequence'] == 'missense_variant'
+    assert isinstance(res['flags'], list)
+    assert variant['vep_annotations'] == orig
+
+    res = utils.summarise_consequences([])
+    assert res == {'major_consequence': '', 'flags': [], 'hgvs': '', 'canonical': ''}
+
+
+def test_variant_filter_condition():
+    """
+    Test variant_filter_condition()
+    """
+    assert utils.variant_filter_condition(None) is None
+    assert utils.variant_filter_condition('all~true') is None
+    gene = lookups.get_gene('SweGen', 'ENSG00000198062')
+
+    def count_rows(filter_type):
+        return ''.join(utils.get_variant_list_csv('SweGen', 'gene', 'ENSG00000198062',
+                                                  filter_type=filter_type)).count('\n') - 1
+
+    with db.database.atomic() as transaction:
+        # the consequence summary is used instead of the VEP annotations
+        (db.VariantGenes.update(major_consequence='intron_variant', flags=[])
+         .where(db.VariantGenes.gene == gene['id'])
+         .execute())
+        assert count_rows('mislof~true') == 0
+        assert count_rows('lof~true') == 0
+        variant = (db.VariantGenes.select(db.VariantGenes.variant)
+                   .where(db.VariantGenes.gene == gene['id'])
+                   .limit(1))
+        (db.VariantGenes.update(major_consequence='missense_variant')
+         .where((db.VariantGenes.gene == gene['id']) & (db.VariantGenes.variant.in_(variant)))
+         .execute())
+        assert count_rows('mislof~true') == 1
+        assert count_rows('lof~true') == 0
+        (db.VariantGenes.update(flags=['LC LoF'])
+         .where((db.VariantGenes.gene == gene['id']) & (db.VariantGenes.variant.in_(variant)))
+         .execute())
+        assert count_rows('lof~true') == 1
+        transaction.rollback()
+    assert count_rows('mislof~true') == 12
+
+
+def test_variant_passes_filter():
+    """
+    Test variant_passes_filter()
+    """
+    variant = {'filter_string': 'PASS', 'major_consequence': 'missense', 'flags': ''}
+    assert utils.variant_passes_filter(variant, None)
+    assert utils.variant_passes_filter(variant, 'mislof~false')
+    assert not utils.variant_passes_filter(variant, 'lof~true')
+    variant = {'filter_string': 'VQSRTrancheSNP99.60to99.80', 'major_consequence': 'stop gained',
+               'flags': 'LC LoF'}
+    assert utils.variant_passes_filter(variant, 'lof~true')
+    assert not utils.variant_passes_filter(variant, 'lof~false')
+    assert utils.variant_passes_filter(variant, 'all~true')
+
+
 def test_worst_csq_from_csq():
     """
     Test worst_csq_from_csq()
@@ -306,6 +571,17 @@ def test_worst_csq_index():
     assert utils.worst_csq_index(csqs) == 4
 
 
+def test_worst_csq_index_from_mask():
+    """
+    Test worst_csq_index_from_mask()
+    """
+    mask = utils.consequence_mask('intron_variant&frameshift_variant&missense_variant')
+    assert utils.worst_csq_index_from_mask(mask) == 4
+    for csq in utils.CSQ_ORDER:
+        index = utils.worst_csq_index_from_mask(utils.consequence_mask(csq))
+        assert index == utils.CSQ_ORDER_DICT[csq]
+
+
 def test_worst_csq_with_vep():
     """
     Test worst_csq_from_vep()
@@ -326,3 +602,9 @@ def test_worst_csq_with_vep():
     assert res == {'SYMBOL': '1', 'Consequence': 'frameshift_variant',
                    'CANONICAL': 'YES', 'major_consequence': 'frameshift_variant'}
     assert not utils.worst_csq_with_vep([])
+
+    # the first of equally severe annotations
+    veps = [{'SYMBOL': '1', 'Consequence': 'intron_variant', 'CANONICAL': ''},
+            {'SYMBOL': '2', 'Consequence': 'intron_variant&stop_lost', 'CANONICAL': 'YES'},
+            {'SYMBOL': '3', 'Consequence': 'stop_lost', 'CANONICAL': 'YES'}]
+    assert utils.worst_csq_with_vep(veps)['SYMBOL'] == '2'
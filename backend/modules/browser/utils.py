@@ -1,13 +1,25 @@
 """Utility functions for lookups and browser_handlers."""
+# pylint: disable=too-many-lines
 
+import json
 import logging
 
+from peewee import Case, SQL
+
+import db
+
 from . import error
 from . import lookups
 
 # for coverage
 AF_BUCKETS = [0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1]
 EXON_PADDING = 50
+# sizes of the coverage bins computed at import, see get_binned_coverage()
+COVERAGE_BIN_SIZES = (100, 1000, 10000)
+# number of variants per chunk when streaming a variant list
+VARIANT_CHUNK_SIZE = 1000
+# max number of variants in a single frequency lookup
+VARIANT_LOOKUP_LIMIT = 100000
 
 CHROMOSOMES = ['chr%s' % x for x in range(1, 23)]
 CHROMOSOMES.extend(['chrX', 'chrY', 'chrM'])
@@ -57,6 +69,14 @@ CSQ_ORDER = ["transcript_ablation",
 
 CSQ_ORDER_DICT = {csq: i for i, csq in enumerate(CSQ_ORDER)}
 REV_CSQ_ORDER_DICT = dict(enumerate(CSQ_ORDER))
+LOF_CONSEQUENCES = CSQ_ORDER[:CSQ_ORDER_DICT['frameshift_variant'] + 1]
+# flags given by get_flags_from_variant() for LoF annotations
+LOF_FLAGS = ('LoF', 'LC LoF', 'LoF flag')
+# consequences at least as severe as intron_variant, as a mask (see consequence_mask())
+INTRON_OR_WORSE_MASK = (1 << (CSQ_ORDER_DICT['intron_variant'] + 1)) - 1
+# max number of consequence strings with a cached mask
+CSQ_MASK_CACHE_SIZE = 100000
+_CSQ_MASKS: dict = {}
 
 METRICS = ['BaseQRankSum',
            'ClippingRankSum',
@@ -69,6 +89,18 @@ METRICS = ['BaseQRankSum',
            'ReadPosRankSum',
            'VQSLOD']
 
+VARIANT_LIST_HEADERS = [['variant_id', 'Variant'],
+                        ['chrom', 'Chrom'],
+                        ['pos', 'Position'],
+                        ['HGVS', 'Consequence'],
+                        ['filter', 'Filter'],
+                        ['major_consequence', 'Annotation'],
+                        ['flags', 'Flags'],
+                        ['allele_count', 'Allele Count'],
+                        ['allele_num', 'Allele Number'],
+                        ['hom_count', 'Number of Homozygous Alleles'],
+                        ['allele_freq', 'Allele Frequency']]
+
 PROTEIN_LETTERS_1TO3 = {
     'A': 'Ala', 'C': 'Cys', 'D': 'Asp', 'E': 'Glu',
     'F': 'Phe', 'G': 'Gly', 'H': 'His', 'I': 'Ile',
@@ -145,13 +177,167 @@ def annotation_severity(annotation: dict) -> float:
         float: severity score
 
     """
-    score = float(-CSQ_ORDER_DICT[worst_csq_from_csq(annotation['Consequence'])])
+    score = float(-worst_csq_index_from_mask(consequence_mask(annotation['Consequence'])))
     if annotation['CANONICAL'] == 'YES':
         score += 0.1
     return score
 
 
-def get_coverage(dataset: str, datatype: str, item: str, ds_version: str = None) -> dict:
+def bin_coverage(coverage: list, start: int, bin_size: int) -> list:
+    """
+    Aggregate coverage into bins of bin_size bases, the first one starting at start.
+
+    The coverage is given per base or in coverage bins, which are weighted by the
+    number of positions with coverage in them. A row before start is added to
+    the first bin.
+
+    Args:
+        coverage (list): coverage dicts, per base or per bin
+        start (int): first position of the first bin
+        bin_size (int): number of bases per bin
+
+    Returns:
+        list: pos, mean, median, min, max and coverage for each bin with coverage
+
+    """
+    bins: dict = {}
+    for row in coverage:
+        if row['mean'] is None:
+            continue
+        positions = row.get('positions', 1)
+        index = max(0, (row['pos'] - start) // bin_size)
+        if index not in bins:
+            bins[index] = {'pos': start + index * bin_size,
+                           'positions': 0,
+                           'mean': 0.0,
+                           'median': 0.0,
+                           'min': row.get('min_mean', row['mean']),
+                           'max': row.get('max_mean', row['mean']),
+                           'coverage': [0.0] * len(row['coverage'] or [])}
+        current = bins[index]
+        current['positions'] += positions
+        current['mean'] += row['mean'] * positions
+        current['median'] += (row['median'] or 0) * positions
+        current['min'] = min(current['min'], row.get('min_mean', row['mean']))
+        current['max'] = max(current['max'], row.get('max_mean', row['mean']))
+        for i, value in enumerate((row['coverage'] or [])[:len(current['coverage'])]):
+            current['coverage'][i] += value * positions
+
+    binned = []
+    for index in sorted(bins):
+        current = bins[index]
+        positions = current.pop('positions')
+        current['mean'] /= positions
+        current['median'] /= positions
+        current['coverage'] = [value / positions for value in current['coverage']]
+        binned.append(current)
+    return binned
+
+
+def consequence_mask(csq: str) -> int:
+    """
+    Encode a possibly &-filled consequence string as a bitmask.
+
+    Bit i is set if the string contains CSQ_ORDER[i], so the worst consequence
+    is the lowest set bit, see worst_csq_index_from_mask(). The masks are cached,
+    as VEP only produces a limited number of distinct consequence strings.
+
+    Args:
+        csq (str): string of consequences, seperated with & (if multiple)
+
+    Returns:
+        int: the bitmask
+
+    """
+    mask = _CSQ_MASKS.get(csq)
+    if mask is None:
+        mask = 0
+        for consequence in csq.split('&'):
+            mask |= 1 << CSQ_ORDER_DICT[consequence]
+        if len(_CSQ_MASKS) < CSQ_MASK_CACHE_SIZE:
+            _CSQ_MASKS[csq] = mask
+    return mask
+
+
+def format_variant(variant: dict, datatype: str, item: str, refgene: str = None) -> dict:
+    """
+    Prepare a variant from the database for the variant list of a datatype.
+
+    Args:
+        variant (dict): variant from the database
+        datatype (str): type of data
+        item (str): query item
+        refgene (str): gene of the transcript if datatype is transcript
+
+    Returns:
+        dict: the formatted variant
+
+    """
+    if variant.get('vep_annotations') is None and variant.get('major_consequence') is not None:
+        # consequence summary computed at import
+        variant['HGVS'] = variant['hgvs']
+        variant['CANONICAL'] = variant['canonical']
+    else:
+        if datatype in ('gene', 'transcript'):
+            anno = None
+            if datatype == 'transcript':
+                anno = [ann for ann in variant['vep_annotations'] if ann['Feature'] == item]
+                if not anno:
+                    anno = [ann for ann in variant['vep_annotations']
+                            if ann['Gene'] == refgene]
+            else:
+                anno = [ann for ann in variant['vep_annotations'] if ann['Gene'] == item]
+            if anno:
+                variant['vep_annotations'] = anno
+        add_consequence_to_variant(variant)
+
+    remove_extraneous_information(variant)
+
+    variant['major_consequence'] = (variant['major_consequence'].replace('_variant', '')
+                                    .replace('_prime_', '\'')
+                                    .replace('_', ' '))
+
+    # This is so an array values turns into a comma separated string instead
+    return {k: ", ".join(v) if isinstance(v, list) else v for k, v in variant.items()}
+
+
+def get_binned_coverage(dataset: str, chrom: str, start: int,  # pylint: disable=too-many-arguments
+                        stop: int, bins: int, ds_version: str = None) -> list:
+    """
+    Retrieve coverage aggregated into a number of bins.
+
+    Uses the largest coverage bins computed at import that fit in the requested
+    bins, or the coverage per base for small regions and versions imported
+    without coverage bins.
+
+    Args:
+        dataset (str): short name of the dataset
+        chrom (str): chromosome
+        start (int): first position of the region
+        stop (int): last position of the region
+        bins (int): number of bins
+        ds_version (str): the dataset version
+
+    Returns:
+        list: binned coverage, see bin_coverage()
+
+    """
+    bin_size = -(-(stop - start + 1) // bins)
+    sizes = [size for size in COVERAGE_BIN_SIZES if size <= bin_size]
+    coverage = None
+    if sizes:
+        try:
+            coverage = lookups.get_coverage_bins(dataset, chrom, start, stop, sizes[-1],
+                                                 ds_version)
+        except error.NotFoundError:
+            pass
+    if not coverage:
+        coverage = lookups.get_coverage_for_bases(dataset, chrom, start, stop, ds_version)
+    return bin_coverage(coverage, start, bin_size)
+
+
+def get_coverage(dataset: str, datatype: str, item: str,  # pylint: disable=too-many-arguments
+                 ds_version: str = None, bins: str = None) -> dict:
     """
     Retrieve coverage for a gene/region/transcript.
 
@@ -160,6 +346,7 @@ def get_coverage(dataset: str, datatype: str, item: str, ds_version: str = None)
         datatype (str): type of "region" (gene/region/transcript)
         item (str): the datatype item to look up
         ds_version (str): the dataset version
+        bins (str): number of bins to aggregate the coverage into; None for coverage per base
 
     Returns:
         dict: start, stop, coverage list
@@ -167,30 +354,37 @@ def get_coverage(dataset: str, datatype: str, item: str, ds_version: str = None)
     """
     ret: dict = {'coverage': []}
 
-    if datatype == 'gene':
-        gene = lookups.get_gene(dataset, item)
-        if gene:
-            transcript = lookups.get_transcript(dataset, gene['canonical_transcript'])
-            if transcript:
-                start = transcript['start'] - EXON_PADDING
-                stop = transcript['stop'] + EXON_PADDING
-                ret['coverage'] = lookups.get_coverage_for_transcript(dataset, transcript['chrom'],
-                                                                      start, stop, ds_version)
+    if bins is not None:
+        bins = parse_bins(bins)
 
-    elif datatype == 'region':
+    if datatype == 'region':
         chrom, start, stop = parse_region(item)
 
         if is_region_too_large(start, stop):
             raise error.MalformedRequest('Region too large')
-        ret['coverage'] = lookups.get_coverage_for_bases(dataset, chrom, start, stop, ds_version)
-
+        if bins:
+            ret['coverage'] = get_binned_coverage(dataset, chrom, start, stop, bins, ds_version)
+        else:
+            ret['coverage'] = lookups.get_coverage_for_bases(dataset, chrom, start, stop,
+                                                             ds_version)
+        return ret
+
+    transcript = None
+    if datatype == 'gene':
+        gene = lookups.get_gene(dataset, item)
+        if gene:
+            transcript = lookups.get_transcript(dataset, gene['canonical_transcript'])
     elif datatype == 'transcript':
         transcript = lookups.get_transcript(dataset, item)
-        if transcript:
-            start = transcript['start'] - EXON_PADDING
+
+    if transcript:
+        start = transcript['start'] - EXON_PADDING
+        coverage = lookups.get_coverage_for_exons(dataset, transcript, EXON_PADDING, ds_version)
+        if bins:
+            # binned from the exons, as the coverage bins include the introns
             stop = transcript['stop'] + EXON_PADDING
-            ret['coverage'] = lookups.get_coverage_for_transcript(dataset, transcript['chrom'],
-                                                                  start, stop, ds_version)
+            coverage = bin_coverage(coverage, start, -(-(stop - start + 1) // bins))
+        ret['coverage'] = coverage
 
     return ret
 
@@ -321,6 +515,38 @@ def get_transcript_hgvs(annotation: dict) -> str:
         return ''
 
 
+def get_variant_frequencies_ndjson(dataset: str, variants: list, ds_version: str = None):
+    """
+    Generate the frequencies of many variants as NDJSON, a chunk of lines at a time.
+
+    There is one line per requested variant, in the requested order.
+
+    Args:
+        dataset (str): dataset short name
+        variants (list): (chrom, pos, ref, alt) for each variant
+        ds_version (str): dataset version
+
+    Yields:
+        str: NDJSON lines
+
+    """
+    lines = []
+    for (chrom, pos, ref, alt), variant in lookups.iter_variant_frequencies(dataset, variants,
+                                                                           ds_version):
+        line = {'variantId': f'{chrom}-{pos}-{ref}-{alt}', 'found': variant is not None}
+        if variant:
+            line.update({'alleleCount': variant['allele_count'],
+                         'alleleNum': variant['allele_num'],
+                         'alleleFreq': variant['allele_freq'],
+                         'homCount': variant['hom_count'] or 0})
+        lines.append(json.dumps(line) + '\n')
+        if len(lines) >= VARIANT_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
 def get_variant_list(dataset: str, datatype: str, item: str, ds_version: str = None) -> dict:
     """
     Retrieve variants for a datatype.
@@ -335,63 +561,85 @@ def get_variant_list(dataset: str, datatype: str, item: str, ds_version: str = N
         dict: {variants:list, headers:list}
 
     """
-    headers = [['variant_id', 'Variant'],
-               ['chrom', 'Chrom'],
-               ['pos', 'Position'],
-               ['HGVS', 'Consequence'],
-               ['filter', 'Filter'],
-               ['major_consequence', 'Annotation'],
-               ['flags', 'Flags'],
-               ['allele_count', 'Allele Count'],
-               ['allele_num', 'Allele Number'],
-               ['hom_count', 'Number of Homozygous Alleles'],
-               ['allele_freq', 'Allele Frequency']]
+    query, refgene = get_variant_list_query(dataset, datatype, item, ds_version)
+    transcript_id = item if datatype == 'transcript' else None
 
-    if datatype == 'gene':
-        variants = lookups.get_variants_in_gene(dataset, item, ds_version)
+    # format while iterating so the database rows are not kept in memory
+    variants = [format_variant(variant, datatype, item, refgene)
+                for variant in lookups.iter_variants(query, transcript_id=transcript_id)]
 
-    elif datatype == 'region':
-        chrom, start, stop = parse_region(item)
+    return {'variants': variants, 'headers': VARIANT_LIST_HEADERS}
 
-        if is_region_too_large(start, stop):
-            raise error.MalformedRequest('Region too large')
-        variants = lookups.get_variants_in_region(dataset, chrom, start, stop, ds_version)
 
-    elif datatype == 'transcript':
-        variants = lookups.get_variants_in_transcript(dataset, item, ds_version)
-        transcript = lookups.get_transcript(dataset, item, ds_version)
-        refgene = transcript['gene_id']
+def get_variant_list_csv(dataset: str, datatype: str, item: str,  # pylint: disable=too-many-arguments
+                         ds_version: str = None, filter_type: str = None,
+                         chunk_size: int = VARIANT_CHUNK_SIZE):
+    """
+    Generate the variant list for a datatype as CSV, a chunk of rows at a time.
+
+    The variants are read using a server-side cursor and the filters are
+    applied in the database as far as possible.
+
+    Args:
+        dataset (str): dataset short name
+        datatype (str): type of data
+        item (str): query item
+        ds_version (str): dataset version
+        filter_type (str): type of filter to apply
+        chunk_size (int): number of variants per chunk
 
-    if variants:
-        for variant in variants:
-            if datatype in ('gene', 'transcript'):
-                anno = None
-                if datatype == 'transcript':
-                    anno = [ann for ann in variant['vep_annotations'] if ann['Feature'] == item]
-                    if not anno:
-                        anno = [ann for ann in variant['vep_annotations'] if ann['Gene'] == refgene]
-                else:
-                    anno = [ann for ann in variant['vep_annotations'] if ann['Gene'] == item]
-                if anno:
-                    variant['vep_annotations'] = anno
+    Yields:
+        str: CSV lines, starting with the header
 
-        add_consequence_to_variants(variants)
+    """
+    query, refgene = get_variant_list_query(dataset, datatype, item, ds_version)
+    transcript_id = item if datatype == 'transcript' else None
+
+    condition = variant_filter_condition(filter_type, datatype)
+    if condition is not None:
+        query = query.where(condition)
 
-        for variant in variants:
-            remove_extraneous_information(variant)
+    yield ','.join([h[1] for h in VARIANT_LIST_HEADERS]) + '\n'
 
-        # Format output
-        def format_variant(variant):
-            variant['major_consequence'] = (variant['major_consequence'].replace('_variant', '')
-                                            .replace('_prime_', '\'')
-                                            .replace('_', ' '))
+    headers = [h[0] for h in VARIANT_LIST_HEADERS]
+    rows = []
+    for variant in lookups.iter_variants(query, transcript_id=transcript_id):
+        variant = format_variant(variant, datatype, item, refgene)
+        if not variant_passes_filter(variant, filter_type):
+            continue
+        rows.append(','.join(map(str, [variant[h] for h in headers])) + '\n')
+        if len(rows) >= chunk_size:
+            yield ''.join(rows)
+            rows = []
+    if rows:
+        yield ''.join(rows)
 
-            # This is so an array values turns into a comma separated string instead
-            return {k: ", ".join(v) if isinstance(v, list) else v for k, v in variant.items()}
 
-        variants = list(map(format_variant, variants))
+def get_variant_list_query(dataset: str, datatype: str, item: str,
+                           ds_version: str = None) -> tuple:
+    """
+    Build the query for the variant list of a datatype, selecting only the list columns.
+
+    Args:
+        dataset (str): dataset short name
+        datatype (str): type of data
+        item (str): query item
+        ds_version (str): dataset version
 
-    return {'variants': variants, 'headers': headers}
+    Returns:
+        tuple: (query, gene id of the transcript if datatype is transcript)
+
+    """
+    refgene = None
+    if datatype == 'region':
+        chrom, start, stop = parse_region(item)
+        if is_region_too_large(start, stop):
+            raise error.MalformedRequest('Region too large')
+        item = (chrom, start, stop)
+    query = lookups.get_variants_query(dataset, datatype, item, ds_version, list_columns=True)
+    if datatype == 'transcript':
+        refgene = lookups.get_transcript(dataset, item, ds_version)['gene_id']
+    return query, refgene
 
 
 def order_vep_by_csq(annotation_list: list) -> list:
@@ -407,9 +655,10 @@ def order_vep_by_csq(annotation_list: list) -> list:
     """
     for ann in annotation_list:
         try:
-            ann['major_consequence'] = worst_csq_from_csq(ann['Consequence'])
+            index = worst_csq_index_from_mask(consequence_mask(ann['Consequence']))
         except KeyError:
-            ann['major_consequence'] = ''
+            index = CSQ_ORDER_DICT['']
+        ann['major_consequence'] = REV_CSQ_ORDER_DICT[index]
     return sorted(annotation_list, key=(lambda ann: CSQ_ORDER_DICT[ann['major_consequence']]))
 
 
@@ -429,6 +678,26 @@ def is_region_too_large(start: int, stop: int) -> bool:
     return int(stop)-int(start) > region_limit
 
 
+def parse_bins(bins: str) -> int:
+    """
+    Parse the number of bins of a coverage request.
+
+    Args:
+        bins (str): number of bins
+
+    Returns:
+        int: number of bins
+
+    """
+    try:
+        bins = int(bins)
+    except ValueError as err:
+        raise error.ParsingError(f'Number of bins is not an integer: {bins}') from err
+    if bins < 1:
+        raise error.ParsingError(f'Number of bins must be positive: {bins}')
+    return bins
+
+
 def parse_dataset(dataset: str, ds_version: str = None) -> tuple:
     """
     Check/parse if the dataset name is in the beacon form (``reference:dataset:version``).
@@ -476,6 +745,64 @@ def parse_region(region: str) -> tuple:
     return chrom, start, stop
 
 
+def parse_variant_lookup(body: str) -> list:
+    """
+    Parse the variants of a frequency lookup.
+
+    The body is either a JSON list of variant ids (``chrom-pos-ref-alt``),
+    optionally as ``{"variants": [...]}``, or text with one variant per line,
+    given as a variant id or as VCF columns (CHROM, POS, ID, REF, ALT, ...).
+    Empty lines and lines starting with ``#`` are ignored, and ALT may
+    contain several alleles separated by commas.
+
+    Args:
+        body (str): the request body
+
+    Returns:
+        list: (chrom, pos, ref, alt) for each variant
+
+    """
+    # pylint: disable=too-many-branches
+    if body.lstrip().startswith(('[', '{')):
+        try:
+            data = json.loads(body)
+        except ValueError as err:
+            raise error.ParsingError(f'Unable to parse the JSON body ({err}).') from err
+        if isinstance(data, dict):
+            data = data.get('variants')
+        if not isinstance(data, list) or not all(isinstance(item, str) for item in data):
+            raise error.ParsingError('Expected a list of variant ids.')
+        rows = [item.split('-') for item in data]
+    else:
+        rows = []
+        for line in body.splitlines():
+            if not line.strip() or line.startswith('#'):
+                continue
+            if '\t' in line:
+                columns = line.split('\t')
+                if len(columns) < 5:
+                    raise error.ParsingError(f'Unable to parse VCF line {line}.')
+                rows += [columns[:2] + [columns[3], alt] for alt in columns[4].split(',')]
+            else:
+                rows.append(line.strip().split('-'))
+
+    variants = []
+    for row in rows:
+        if len(row) != 4:
+            raise error.ParsingError(f'Unable to parse variant {"-".join(row)}.')
+        chrom, pos, ref, alt = row
+        if chrom.lower().startswith('chr'):
+            chrom = chrom[3:]
+        try:
+            variants.append((chrom, int(pos), ref.upper(), alt.upper()))
+        except ValueError as err:
+            raise error.ParsingError(f'Position is not an integer in {"-".join(row)}.') from err
+
+    if len(variants) > VARIANT_LOOKUP_LIMIT:
+        raise error.MalformedRequest(f'Too many variants (max {VARIANT_LOOKUP_LIMIT}).')
+    return variants
+
+
 def remove_extraneous_information(variant: dict):
     """
     Remove information that is not used in the frontend from a variant.
@@ -485,11 +812,9 @@ def remove_extraneous_information(variant: dict):
         variant (dict): variant data from database
 
     """
-    del variant['id']
-    del variant['dataset_version']
-    del variant['orig_alt_alleles']
-    del variant['site_quality']
-    del variant['vep_annotations']
+    for key in ('id', 'dataset_version', 'orig_alt_alleles', 'site_quality',
+                'vep_annotations', 'hgvs', 'canonical', 'HGVSc', 'HGVSp', 'category'):
+        variant.pop(key, None)
 
 
 def remove_extraneous_vep_annotations(annotation_list: list) -> list:
@@ -504,7 +829,102 @@ def remove_extraneous_vep_annotations(annotation_list: list) -> list:
 
     """
     return [ann for ann in annotation_list
-            if worst_csq_index(ann['Consequence'].split('&')) <= CSQ_ORDER_DICT['intron_variant']]
+            if consequence_mask(ann['Consequence']) & INTRON_OR_WORSE_MASK]
+
+
+def summarise_consequences(annotations: list) -> dict:
+    """
+    Summarise the most severe consequence of a variant, as shown in the variant lists.
+
+    Args:
+        annotations (list): VEP annotations of the variant; not modified
+
+    Returns:
+        dict: major_consequence, flags, hgvs and canonical
+
+    """
+    variant = {'vep_annotations': [dict(annotation) for annotation in annotations]}
+    add_consequence_to_variant(variant)
+    return {'major_consequence': variant['major_consequence'],
+            'flags': variant['flags'] or [],
+            'hgvs': variant.get('HGVS', ''),
+            'canonical': variant.get('CANONICAL', '')}
+
+
+def variant_filter_condition(filter_type: str, datatype: str = None):
+    """
+    Build an SQL condition for the variants that may pass a variant list filter.
+
+    The condition can include variants that do not pass the filter, so the
+    result should still be checked using variant_passes_filter(). The
+    consequences are checked using the consequence summary of the list, as
+    selected by lookups.get_variants_query(), and using the VEP annotations
+    only for variants imported without a summary.
+
+    Args:
+        filter_type (str): type of filter, e.g. ``mislof~false``
+        datatype (str): gene, transcript or region
+
+    Returns:
+        peewee.Expression: the condition; None if no variants can be excluded
+
+    """
+    if not filter_type:
+        return None
+    filters = filter_type.split('~')
+    conditions = []
+    if filters[1] == 'false':
+        conditions.append(db.Variant.filter_string == 'PASS')
+
+    consequences = None
+    if filters[0] == 'mislof':
+        consequences = LOF_CONSEQUENCES + ['missense_variant']
+    elif 'lof' in filters[0]:
+        consequences = LOF_CONSEQUENCES
+    if consequences:
+        summary = {'gene': db.VariantGenes,
+                   'transcript': db.VariantTranscripts}.get(datatype, db.Variant)
+        summary_condition = summary.flags.contains_any(*LOF_FLAGS)
+        if filters[0] == 'mislof':
+            summary_condition |= summary.major_consequence == 'missense_variant'
+        # LoF flags come from a LoF annotation or a LoF consequence
+        csq_regex = '(^|&)({})(&|$)'.format('|'.join(consequences))
+        vep_condition = SQL("EXISTS (SELECT 1 FROM jsonb_array_elements(vep_annotations) " +
+                            "AS anno WHERE anno->>'LoF' <> '' OR anno->>'Consequence' ~ %s)",
+                            [csq_regex])
+        conditions.append(Case(None, [(summary.major_consequence.is_null(), vep_condition)],
+                               summary_condition))
+
+    if not conditions:
+        return None
+    condition = conditions[0]
+    for extra in conditions[1:]:
+        condition &= extra
+    return condition
+
+
+def variant_passes_filter(variant: dict, filter_type: str) -> bool:
+    """
+    Check whether a formatted variant passes a variant list filter.
+
+    Args:
+        variant (dict): variant from format_variant()
+        filter_type (str): type of filter, e.g. ``mislof~false``
+
+    Returns:
+        bool: whether the variant should be included
+
+    """
+    if not filter_type:
+        return True
+    filters = filter_type.split('~')
+    if filters[1] == 'false' and variant['filter_string'] != 'PASS':
+        return False
+    if filters[0] == 'mislof':
+        return variant['major_consequence'] == 'missense' or 'LoF' in variant['flags']
+    if 'lof' in filters[0]:
+        return 'LoF' in variant['flags']
+    return True
 
 
 def worst_csq_from_list(csq_list: list) -> str:
@@ -532,7 +952,7 @@ def worst_csq_from_csq(csq: str) -> str:
         str: the worst consequence
 
     """
-    return REV_CSQ_ORDER_DICT[worst_csq_index(csq.split('&'))]
+    return REV_CSQ_ORDER_DICT[worst_csq_index_from_mask(consequence_mask(csq))]
 
 
 def worst_csq_index(csq_list: list) -> int:
@@ -548,7 +968,21 @@ def worst_csq_index(csq_list: list) -> int:
         int: index in CSQ_ODER_DICT of the worst consequence
 
     """
-    return min([CSQ_ORDER_DICT[csq] for csq in csq_list])
+    return min(CSQ_ORDER_DICT[csq] for csq in csq_list)
+
+
+def worst_csq_index_from_mask(mask: int) -> int:
+    """
+    Find the index of the worst consequence in a consequence bitmask.
+
+    Args:
+        mask (int): bitmask from consequence_mask()
+
+    Returns:
+        int: index in CSQ_ORDER of the worst consequence
+
+    """
+    return (mask & -mask).bit_length() - 1
 
 
 def worst_csq_with_vep(annotation_list: list) -> dict:
@@ -566,6 +1000,11 @@ def worst_csq_with_vep(annotation_list: list) -> dict:
     """
     if not annotation_list:
         return {}
-    worst = max(annotation_list, key=annotation_severity)
-    worst['major_consequence'] = worst_csq_from_csq(worst['Consequence'])
+    # same order as annotation_severity(), computed for all annotations at once
+    severities = [(worst_csq_index_from_mask(consequence_mask(annotation['Consequence'])),
+                   annotation['CANONICAL'] != 'YES')
+                  for annotation in annotation_list]
+    worst_pos = min(range(len(severities)), key=severities.__getitem__)
+    worst = annotation_list[worst_pos]
+    worst['major_consequence'] = REV_CSQ_ORDER_DICT[severities[worst_pos][0]]
     return worst
@@ -0,0 +1,170 @@
+"""Cache of rendered responses, kept per dataset version."""
+
+import collections
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import NamedTuple
+import urllib.parse
+
+
+class CachedResponse(NamedTuple):
+    """A rendered response body with its ETag and content type."""
+    etag: str
+    content_type: str
+    body: bytes
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Compute the ETag of a response body, the same way as Tornado does.
+
+    Args:
+        body (bytes): the response body
+
+    Returns:
+        str: the quoted ETag
+
+    """
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies limited by their total size, with an optional disk tier.
+
+    Entries are keyed by the dataset, the id of the dataset version and the
+    request URI, so a new version of a dataset never gets the responses of an
+    older one. The memory tier belongs to the process, while the disk tier is
+    shared by all processes using the same directory.
+
+    The memory tier is not thread-safe and should only be used from the IOLoop.
+    The disk methods (load, save) block and are meant to run in an executor.
+    """
+
+    def __init__(self, max_bytes: int, directory: str = None):
+        """
+        Create an empty cache.
+
+        Args:
+            max_bytes (int): total size of the bodies kept in memory; 0 disables the memory tier
+            directory (str): directory of the disk tier; None disables it
+
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory or None
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any responses are cached."""
+        return bool(self.max_bytes or self.directory)
+
+    def add(self, key: tuple, entry: CachedResponse):
+        """
+        Add a response to the memory tier, evicting the least recently used ones.
+
+        Responses larger than the whole budget are not added.
+
+        Args:
+            key (tuple): (dataset, dataset version id, uri)
+            entry (CachedResponse): the response
+
+        """
+        if len(entry.body) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self.size -= len(old.body)
+        self._entries[key] = entry
+        self.size += len(entry.body)
+        while self.size > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.size -= len(old.body)
+
+    def get(self, key: tuple) -> CachedResponse:
+        """
+        Get a response from the memory tier.
+
+        Args:
+            key (tuple): (dataset, dataset version id, uri)
+
+        Returns:
+            CachedResponse: the response; None if not cached
+
+        """
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+        return entry
+
+    def invalidate(self, dataset: str = None):
+        """
+        Drop cached responses from both tiers.
+
+        Args:
+            dataset (str): short name of the dataset to drop; None drops all responses
+
+        """
+        for key in [key for key in self._entries if dataset is None or key[0] == dataset]:
+            self.size -= len(self._entries.pop(key).body)
+        if self.directory and os.path.isdir(self.directory):
+            if dataset is None:
+                paths = [os.path.join(self.directory, name)
+                         for name in os.listdir(self.directory)]
+            else:
+                paths = [self._dataset_path(dataset)]
+            for path in paths:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def load(self, key: tuple) -> CachedResponse:
+        """
+        Read a response from the disk tier.
+
+        Args:
+            key (tuple): (dataset, dataset version id, uri)
+
+        Returns:
+            CachedResponse: the response; None if not cached
+
+        """
+        try:
+            with open(self._path(key), 'rb') as cache_file:
+                etag = cache_file.readline().decode().rstrip('\n')
+                content_type = cache_file.readline().decode().rstrip('\n')
+                return CachedResponse(etag, content_type, cache_file.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: tuple, entry: CachedResponse):
+        """
+        Write a response to the disk tier.
+
+        The file is replaced atomically, so other processes never read a partial response.
+
+        Args:
+            key (tuple): (dataset, dataset version id, uri)
+            entry (CachedResponse): the response
+
+        """
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(tmp_fd, 'wb') as cache_file:
+                cache_file.write(f'{entry.etag}\n{entry.content_type}\n'.encode())
+                cache_file.write(entry.body)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logging.warning(f"Unable to save response in the cache: {err}")
+
+    def _dataset_path(self, dataset: str) -> str:
+        return os.path.join(self.directory, urllib.parse.quote(dataset, safe=''))
+
+    def _path(self, key: tuple) -> str:
+        dataset, version_id, uri = key
+        return os.path.join(self._dataset_path(dataset), str(version_id),
+                            hashlib.sha1(uri.encode()).hexdigest())
@@ -1,20 +1,38 @@
 import logging
+import os
+import signal
 import sys
+import time
 
+import psycopg2
+import tornado.gen
 import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 from tornado.options import define, options
 import tornado.web
 
 import application
 import handlers
 import auth
+import coverage_files
+import db
 import settings as swefreq_settings
 
+from modules.browser import lookups
 from modules.browser.route import routes as browser_routes
 
 define("port", default=4000, help="run on the given port", type=int)
 define("develop", default=False, help="Run in develop environment", type=bool)
+define("workers", default=1, type=int,
+       help="number of worker processes, each with its own connection pool (0 = one per CPU)")
+define("shutdown_wait", default=5, type=float,
+       help="seconds to let in-flight requests finish before a worker exits")
+
+# seconds between attempts to reopen the dataset version listener, doubled up to the max
+LISTEN_RETRY_MIN = 1
+LISTEN_RETRY_MAX = 60
 
 # Setup the Tornado Application
 # pylint: disable=no-member
@@ -91,6 +109,193 @@ class Application(tornado.web.Application):
         tornado.web.Application.__init__(self, self.declared_handlers, **settings)
 
 
+def invalidate_caches(dataset: str = None):
+    """
+    Drop the cached dataset versions, responses, coverage files and searches
+    without results of a dataset.
+
+    Args:
+        dataset (str): short name of the dataset; None drops the entries of all datasets
+
+    """
+    db.invalidate_dataset_version_cache(dataset)
+    handlers.RESPONSE_CACHE.invalidate(dataset)
+    coverage_files.invalidate_coverage_files(dataset)
+    lookups.invalidate_awesomebar_misses(dataset)
+
+
+def watch_dataset_versions(ioloop):
+    """
+    Invalidate cached dataset versions, responses, coverage files and searches
+    when the importer announces a change.
+
+    If the listening connection cannot be opened, or is lost, it is reopened
+    with an increasing delay, and all caches are dropped once it is back since
+    changes may have been missed. Until then the caches are only bounded by
+    their TTLs.
+
+    Args:
+        ioloop (tornado.ioloop.IOLoop): the loop to register the listener on
+
+    """
+    connection = None
+
+    def on_notify(fd, events):  # pylint: disable=unused-argument
+        try:
+            connection.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as err:
+            logging.warning(f"Lost the dataset version listener: {err}")
+            ioloop.remove_handler(fd)
+            connection.close()
+            reconnect.callback_time = LISTEN_RETRY_MIN * 1000
+            reconnect.start()
+            return
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            logging.info(f"Dataset versions changed for {notify.payload}")
+            invalidate_caches(notify.payload)
+
+    def connect() -> bool:
+        nonlocal connection
+        try:
+            connection = db.listen_for_dataset_version_changes()
+        except psycopg2.OperationalError as err:
+            logging.warning("Not listening for dataset version changes, " +
+                            f"retrying in {reconnect.callback_time / 1000:g} s: {err}")
+            return False
+        ioloop.add_handler(connection.fileno(), on_notify, tornado.ioloop.IOLoop.READ)
+        return True
+
+    def retry():
+        reconnect.callback_time = min(reconnect.callback_time * 2, LISTEN_RETRY_MAX * 1000)
+        if connect():
+            reconnect.stop()
+            logging.info("Listening for dataset version changes again")
+            invalidate_caches()
+
+    reconnect = tornado.ioloop.PeriodicCallback(retry, LISTEN_RETRY_MIN * 1000)
+    if not connect():
+        reconnect.start()
+
+
+def serve(sockets=None):
+    """
+    Run the application in this process until it receives SIGTERM or SIGINT.
+
+    On shutdown the server stops accepting connections and lets in-flight
+    requests finish, for at most ``--shutdown_wait`` seconds, before exiting.
+
+    Args:
+        sockets (list): listening sockets shared with other workers;
+                        if not given, listen on ``--port``
+
+    """
+    tornado_application = Application(tornado_settings)
+    if sockets:
+        server = tornado.httpserver.HTTPServer(tornado_application, xheaders=True)
+        server.add_sockets(sockets)
+    else:
+        server = tornado_application.listen(options.port, xheaders=True)
+
+    ioloop = tornado.ioloop.IOLoop.current()
+    watch_dataset_versions(ioloop)
+
+    async def shutdown():
+        logging.info(f"Worker {os.getpid()} shutting down")
+        server.stop()
+        deadline = time.monotonic() + options.shutdown_wait
+        while handlers.ACTIVE_REQUESTS and time.monotonic() < deadline:
+            await tornado.gen.sleep(0.1)
+        await server.close_all_connections()
+        db.database.close_all()
+        ioloop.stop()
+
+    def on_signal(signum, frame):  # pylint: disable=unused-argument
+        ioloop.add_callback_from_signal(shutdown)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    ioloop.start()
+
+
+def supervise(num_workers: int):
+    """
+    Fork worker processes sharing one listening socket and keep them running.
+
+    Workers that die are replaced. SIGHUP starts a new set of workers and
+    gracefully stops the old ones; SIGTERM/SIGINT stops all workers gracefully.
+
+    Args:
+        num_workers (int): number of worker processes
+
+    """
+    sockets = tornado.netutil.bind_sockets(options.port)
+    # workers must not share connections with the supervisor
+    db.database.close_all()
+
+    workers = {}
+    stopping = False
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_DFL)
+            status = 0
+            try:
+                serve(sockets)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Worker failed")
+                status = 1
+            os._exit(status)  # pylint: disable=protected-access
+        workers[pid] = time.monotonic()
+
+    def stop_workers(pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def on_stop(signum, frame):  # pylint: disable=unused-argument
+        nonlocal stopping
+        stopping = True
+        stop_workers(list(workers))
+
+    def on_restart(signum, frame):  # pylint: disable=unused-argument
+        logging.info("Restarting workers")
+        old_workers = list(workers)
+        for pid in old_workers:
+            workers.pop(pid)
+        for _ in range(num_workers):
+            start_worker()
+        stop_workers(old_workers)
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_restart)
+
+    for _ in range(num_workers):
+        start_worker()
+    logging.info(f"Started {num_workers} workers on port {options.port}")
+
+    while True:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in workers:
+            continue
+        started = workers.pop(pid)
+        if stopping:
+            continue
+        logging.warning(f"Worker {pid} exited with status {status}, starting a new one")
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        start_worker()
+
+
 if __name__ == '__main__':
     # Make sure that the extra option to `settings` isn't upsetting tornado
     if '--settings_file' in sys.argv:
@@ -107,12 +312,11 @@ if __name__ == '__main__':
         tornado_settings['develop'] = True
         logging.getLogger().setLevel(logging.DEBUG)
 
-    # Instantiate Application
-    tornado_application = Application(tornado_settings)
-    tornado_application.listen(options.port, xheaders=True)
-
-    # Get a handle to the instance of IOLoop
-    ioloop = tornado.ioloop.IOLoop.instance()
-
-    # Start the IOLoop
-    ioloop.start()
+    worker_count = options.workers or tornado.process.cpu_count()
+    if worker_count == 1:
+        serve()
+    elif options.develop:
+        logging.error("--develop (autoreload) can only be used with a single worker")
+        sys.exit(1)
+    else:
+        supervise(worker_count)
@@ -34,6 +34,41 @@ psql_name = json_settings["postgresName"]
 psql_user = json_settings["postgresUser"]
 psql_pass = json_settings["postgresPass"]
 
+# Connection pool: max open connections, seconds before a connection is
+# recycled, seconds to wait for a free connection, and whether to check
+# connections with a trivial query before handing them out
+psql_pool_size = json_settings.get("postgresPoolSize", 20)
+psql_pool_stale_timeout = json_settings.get("postgresPoolStaleTimeout", 300)
+psql_pool_wait_timeout = json_settings.get("postgresPoolWaitTimeout", 10)
+psql_pool_health_check = json_settings.get("postgresPoolHealthCheck", True)
+
+# Seconds a resolved dataset version is kept in the in-process cache (0 disables it)
+dataset_version_cache_ttl = json_settings.get("datasetVersionCacheTtl", 300)
+
+# Threads running blocking database queries for async handlers, and the
+# longest time (in seconds) a single statement may run
+query_workers = json_settings.get("queryWorkers", 8)
+query_timeout = json_settings.get("queryTimeout", 30)
+
+# Threads running streamed queries (downloads and bulk lookups), separate from
+# the query workers, and the longest time (in seconds) a stream waits for the
+# client to read before it is aborted
+stream_workers = json_settings.get("streamWorkers", 4)
+stream_read_timeout = json_settings.get("streamReadTimeout", 60)
+
+# Rows fetched per round trip when iterating over variants with a server-side cursor
+variant_fetch_size = json_settings.get("variantFetchSize", 1000)
+
+# Browser response cache: bytes kept in memory per process (0 disables it), an
+# optional directory shared by all workers, and the max-age (in seconds) sent
+# with responses for an explicitly requested dataset version
+response_cache_size = json_settings.get("responseCacheSize", 64 * 1024 * 1024)
+response_cache_dir = json_settings.get("responseCacheDir", "")
+response_cache_max_age = json_settings.get("responseCacheMaxAge", 86400)
+
+# Directory of the memory-mapped coverage files written by the importer (empty disables them)
+coverage_dir = json_settings.get("coverageDir", "")
+
 # e-mail config
 mail_server = json_settings["mailServer"]
 from_address = json_settings["fromAddress"]
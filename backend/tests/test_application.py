@@ -97,6 +97,7 @@ def test_get_dataset():
                             "portalAvail": True,
                             "fileAccess": "REGISTERED",
                             "beaconAccess": "PUBLIC",
+                            "coverageBlocks": False,
                             "dataset": 1,
                             "referenceSet": 1,
                             "varCallRef": None},
@@ -123,6 +124,7 @@ def test_get_dataset():
                             "portalAvail": True,
                             "fileAccess": "REGISTERED",
                             "beaconAccess": "PUBLIC",
+                            "coverageBlocks": False,
                             "dataset": 2,
                             "referenceSet": 1,
                             "varCallRef":None},
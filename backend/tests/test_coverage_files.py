@@ -0,0 +1,70 @@
+"""
+Test the memory-mapped coverage files
+"""
+import pytest
+
+import coverage_files
+
+
+def test_write_read(tmp_path):
+    """
+    Test CoverageWriter and CoverageFile
+    """
+    rows = [{'chrom': '22', 'pos': pos, 'mean': 24.94, 'median': 24.0,
+             'coverage': [1.0, 0.993, 0.009]}
+            for pos in range(100, 200, 10)]
+    writer = coverage_files.CoverageWriter(str(tmp_path), 4)
+    for row in rows:
+        writer.add(row)
+    writer.add({'chrom': 'X', 'pos': 5, 'mean': 1.5, 'median': 1.0, 'coverage': [0.5, 0.0, 0.0]})
+    writer.close()
+
+    coverage_file = coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 4, '22')
+    assert coverage_file.size == 10
+    assert coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 4, '22') is coverage_file
+    expected = [{key: value for key, value in row.items() if key != 'chrom'} for row in rows]
+    assert coverage_file.read(0, 1000) == expected
+    assert coverage_file.read(110, 130) == expected[1:4]
+    assert coverage_file.read(111, 129) == expected[2:3]
+    assert coverage_file.read(111, 119) == []
+    assert coverage_file.read(500, 600) == []
+    assert coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 4, 'X').read(5, 5)[0]['mean'] == 1.5
+
+    # missing files
+    assert not coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 4, '1')
+    assert not coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 5, '22')
+    assert not coverage_files.get_coverage_file('', 'SweGen', 4, '22')
+
+    # unsorted positions
+    writer = coverage_files.CoverageWriter(str(tmp_path), 6)
+    writer.add(rows[1])
+    with pytest.raises(ValueError):
+        writer.add(rows[0])
+
+
+def test_invalidate_coverage_files(tmp_path):
+    """
+    Test invalidate_coverage_files()
+    """
+    row = {'chrom': '22', 'pos': 100, 'mean': 24.94, 'median': 24.0, 'coverage': [1.0]}
+    for dataset_version in (1, 2):
+        writer = coverage_files.CoverageWriter(str(tmp_path), dataset_version)
+        writer.add(row)
+        writer.close()
+    first = coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 1, '22')
+    other = coverage_files.get_coverage_file(str(tmp_path), 'SweGen2', 2, '22')
+
+    # a re-import replaces the file
+    writer = coverage_files.CoverageWriter(str(tmp_path), 1)
+    writer.add(dict(row, mean=30.0))
+    writer.close()
+    assert coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 1, '22') is first
+
+    coverage_files.invalidate_coverage_files('SweGen')
+    coverage_file = coverage_files.get_coverage_file(str(tmp_path), 'SweGen', 1, '22')
+    assert coverage_file is not first
+    assert coverage_file.read(100, 100)[0]['mean'] == 30.0
+    assert coverage_files.get_coverage_file(str(tmp_path), 'SweGen2', 2, '22') is other
+
+    coverage_files.invalidate_coverage_files()
+    assert coverage_files.get_coverage_file(str(tmp_path), 'SweGen2', 2, '22') is not other
@@ -0,0 +1,93 @@
+"""
+Test the helper functions in db.py
+"""
+import psycopg2
+
+import db
+
+
+def test_coverage_block_field():
+    """
+    Test CoverageBlockField
+    """
+    field = db.CoverageBlock.coverage
+    coverage = [{'pos': 16364820, 'mean': 75.45, 'median': 71.0,
+                 'coverage': [1.0, 0.999, 0.17]},
+                {'pos': 16364830, 'mean': 0.0, 'median': 0.0,
+                 'coverage': [0.0, 0.0, 0.0]}]
+    for value in (coverage, []):
+        blob = db.database.execute_sql('SELECT %s', (field.db_value(value),)).fetchone()[0]
+        assert field.python_value(blob) == value
+    assert field.python_value(None) is None
+
+
+def test_get_dataset_version_record():
+    """
+    Test get_dataset_version_record()
+    """
+    db.invalidate_dataset_version_cache()
+    record = db.get_dataset_version_record('SweGen')
+    assert record.short_name == 'SweGen'
+    assert record.id == db.get_dataset_version('SweGen').id
+    assert record.reference_set == db.get_dataset_version('SweGen').reference_set.id
+    # cached
+    assert db.get_dataset_version_record('SweGen') is record
+
+    record = db.get_dataset_version_record('SweGen', '20161223')
+    assert record.version == '20161223'
+
+    assert not db.get_dataset_version_record('BAD_DATASET')
+    assert not db.get_dataset_version_record('SweGen', 'BAD_VERSION')
+
+
+def test_invalidate_dataset_version_cache():
+    """
+    Test invalidate_dataset_version_cache()
+    """
+    record = db.get_dataset_version_record('SweGen')
+    other = db.get_dataset_version_record('SweGen2')
+    db.invalidate_dataset_version_cache('SweGen')
+    assert db.get_dataset_version_record('SweGen') is not record
+    assert db.get_dataset_version_record('SweGen') == record
+    assert db.get_dataset_version_record('SweGen2') is other
+
+    db.invalidate_dataset_version_cache()
+    assert db.get_dataset_version_record('SweGen2') is not other
+
+
+def test_pool_stats():
+    """
+    Test PostgresqlPool.pool_stats()
+    """
+    db.database.close()
+    before = db.database.pool_stats()
+    with db.database.connection_context():
+        db.database.execute_sql('SELECT 1')
+        stats = db.database.pool_stats()
+        assert stats['in_use'] >= 1
+    stats = db.database.pool_stats()
+    assert stats['checkouts'] == before['checkouts'] + 1
+    assert stats['idle'] >= 1
+    assert stats['wait_max'] >= 0
+
+
+def test_pool_health_check(monkeypatch):
+    """
+    Test the health check of idle connections in PostgresqlPool
+    """
+    db.database.close()
+    with db.database.connection_context():
+        conn = db.database.connection()
+        pid = db.database.execute_sql('SELECT pg_backend_pid()').fetchone()[0]
+    # recently returned connections are reused without a check
+    with db.database.connection_context():
+        assert db.database.connection() is conn
+    other = psycopg2.connect(dbname=db.database.database, **db.database.connect_params)
+    with other.cursor() as cursor:
+        cursor.execute('SELECT pg_terminate_backend(%s)', (pid,))
+    other.close()
+    monkeypatch.setattr(db.PostgresqlPool, 'HEALTH_CHECK_IDLE', 0)
+    with db.database.connection_context():
+        assert db.database.connection() is not conn
+        assert db.database.execute_sql('SELECT 1').fetchone()[0] == 1
+    assert conn.closed
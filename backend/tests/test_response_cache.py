@@ -0,0 +1,76 @@
+"""
+Test the response cache
+"""
+import response_cache
+
+
+def make_entry(body: bytes) -> response_cache.CachedResponse:
+    """
+    Create a cache entry for a body
+    """
+    return response_cache.CachedResponse(response_cache.make_etag(body),
+                                         'application/json', body)
+
+
+def test_add_get():
+    """
+    Test ResponseCache.add() and ResponseCache.get()
+    """
+    cache = response_cache.ResponseCache(10)
+    cache.add(('SweGen', 1, '/a'), make_entry(b'aaaa'))
+    cache.add(('SweGen', 1, '/b'), make_entry(b'bbbb'))
+    assert cache.get(('SweGen', 1, '/a')).body == b'aaaa'
+    assert not cache.get(('SweGen', 2, '/a'))
+    assert cache.size == 8
+
+    # least recently used is evicted
+    cache.add(('SweGen', 1, '/c'), make_entry(b'cccc'))
+    assert not cache.get(('SweGen', 1, '/b'))
+    assert cache.get(('SweGen', 1, '/a'))
+    assert cache.size == 8
+
+    # replaced
+    cache.add(('SweGen', 1, '/a'), make_entry(b'aa'))
+    assert cache.get(('SweGen', 1, '/a')).body == b'aa'
+    assert cache.size == 6
+
+    # larger than the budget
+    cache.add(('SweGen', 1, '/d'), make_entry(b'd' * 11))
+    assert not cache.get(('SweGen', 1, '/d'))
+    assert cache.size == 6
+
+    assert not response_cache.ResponseCache(0).enabled
+
+
+def test_invalidate(tmp_path):
+    """
+    Test ResponseCache.invalidate()
+    """
+    cache = response_cache.ResponseCache(100, str(tmp_path))
+    for key in (('SweGen', 1, '/a'), ('SweGen', 2, '/a'), ('Other', 3, '/a')):
+        cache.add(key, make_entry(b'body'))
+        cache.save(key, make_entry(b'body'))
+
+    cache.invalidate('SweGen')
+    assert not cache.get(('SweGen', 1, '/a'))
+    assert not cache.load(('SweGen', 2, '/a'))
+    assert cache.get(('Other', 3, '/a'))
+    assert cache.load(('Other', 3, '/a'))
+    assert cache.size == 4
+
+    cache.invalidate()
+    assert not cache.get(('Other', 3, '/a'))
+    assert not cache.load(('Other', 3, '/a'))
+    assert cache.size == 0
+
+
+def test_save_load(tmp_path):
+    """
+    Test ResponseCache.save() and ResponseCache.load()
+    """
+    cache = response_cache.ResponseCache(0, str(tmp_path))
+    assert cache.enabled
+    entry = make_entry(b'{"a": 1}\n')
+    cache.save(('Data/set', 1, '/a?b=c'), entry)
+    assert cache.load(('Data/set', 1, '/a?b=c')) == entry
+    assert not cache.load(('Data/set', 1, '/a'))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Load rows into a table with COPY FROM STDIN instead of INSERT statements."""
+
+import io
+import json
+
+from peewee import AutoField, BlobField, ForeignKeyField
+from playhouse.postgres_ext import ArrayField, BinaryJSONField
+
+import db
+
+# characters escaped in the COPY text format
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'})
+
+
+def copy_fields(model, with_id: bool = False) -> list:
+    """
+    Get the fields of a model that are set when loading rows.
+
+    Args:
+        model: the peewee model of the table
+        with_id (bool): include an auto-incrementing id
+
+    Returns:
+        list: the fields
+
+    """
+    return [field for field in model._meta.sorted_fields  # pylint: disable=protected-access
+            if with_id or not isinstance(field, AutoField)]
+
+
+def copy_rows(model, rows: list) -> int:
+    """
+    Load rows into the table of a model using COPY FROM STDIN.
+
+    The rows are the same dicts as given to insert_many(); missing keys are
+    loaded as NULL, and an auto-incrementing id is generated unless the rows
+    have one. The rows are loaded using the current connection, so they are
+    part of any open transaction.
+
+    Args:
+        model: the peewee model of the table
+        rows (list): the rows (dict)
+
+    Returns:
+        int: number of rows loaded
+
+    """
+    fields = copy_fields(model, with_id=bool(rows) and 'id' in rows[0])
+    data = io.StringIO(''.join('\t'.join(format_value(field, row.get(field.name))
+                                         for field in fields) + '\n'
+                               for row in rows))
+    table = f'"{model._meta.schema}"."{model._meta.table_name}"'  # pylint: disable=protected-access
+    columns = ', '.join(f'"{field.column_name}"' for field in fields)
+    cursor = db.database.cursor()
+    cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', data)
+    return len(rows)
+
+
+def format_value(field, value) -> str:
+    """
+    Format a value for a column in the COPY text format.
+
+    Args:
+        field: the peewee field of the column
+        value: the value, as given to insert_many()
+
+    Returns:
+        str: the escaped value
+
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(field, ForeignKeyField):
+        value = field.db_value(value)
+    elif isinstance(field, BinaryJSONField):
+        value = json.dumps(value)
+    elif isinstance(field, ArrayField):
+        value = format_array(value)
+    elif isinstance(field, BlobField):
+        blob = field.db_value(value)
+        return '\\\\x' + bytes(getattr(blob, 'adapted', blob)).hex()
+    return str(value).translate(COPY_ESCAPES)
+
+
+def format_array(values: list) -> str:
+    """
+    Format a list as a PostgreSQL array literal.
+
+    Args:
+        values (list): the values of the array
+
+    Returns:
+        str: the array literal
+
+    """
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append('NULL')
+        else:
+            elements.append('"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(elements) + '}'
@@ -3,20 +3,70 @@
 Baseclass for the data importers
 '''
 
+import functools
+import io
 import os
 import sys
 import gzip
 import time
+import shutil
 import logging
+import subprocess
 import urllib.request
 
 import MySQLdb
 
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
+
+# external decompressors, by order of preference, reading stdin and writing stdout
+DECOMPRESSORS = {'pigz': ['pigz', '-dc'],
+                 'bgzip': ['bgzip', '-dc']}
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+class PipeReader(io.RawIOBase):
+    '''
+    Read a file decompressed by an external program
+
+    fileno() gives the compressed file, which shares its position with the
+    decompressor, so the read progress can be followed as for other files.
+    '''
+    def __init__(self, command, in_file):
+        super().__init__()
+        self.in_file = in_file
+        self.process = subprocess.Popen(command, stdin=in_file, stdout=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self.process.stdout.readinto(buffer)
+        if not size and self.process.wait():
+            raise IOError("{} failed with exit status {}".format(self.process.args[0],
+                                                                 self.process.returncode))
+        return size
+
+    def fileno(self):
+        return self.in_file.fileno()
+
+    def close(self):
+        if not self.closed:
+            self.process.stdout.close()
+            self.process.wait()
+            self.in_file.close()
+        super().close()
+
+
 class DataImporter():
     '''
     Baseclass for the data importers
     '''
     BLOCKSIZE = 1024
+    # lines read between updates of the read progress
+    PROGRESS_LINES = 10000
 
     def __init__(self, settings):
         self.settings = settings
@@ -87,17 +137,83 @@ class DataImporter():
         filename = self._download(base_url, version)
         return self._open(filename)
 
-    def _open(self, filename, binary=True):  # pylint: disable=no-self-use
-        mode = 'rb' if binary else 'rt'
-        encoding = None if binary else 'utf8'
+    def _decompressor(self):
+        '''
+        Get the decompressor to use for gzipped files.
+
+        With the setting 'auto' this is the first external decompressor that is
+        installed, otherwise isal if python-isal is installed, otherwise gzip.
+        '''
+        decompressor = self.settings.decompressor
+        if decompressor == 'auto':
+            for name in DECOMPRESSORS:
+                if shutil.which(name):
+                    return name
+            return 'isal' if igzip else 'gzip'
+        if decompressor == 'isal' and not igzip:
+            logging.warning("python-isal is not installed, using gzip")
+            return 'gzip'
+        return decompressor
+
+    def _open(self, filename, binary=True):
+        '''
+        Open a file, decompressing it if it is gzipped.
+
+        Gzipped files are decompressed by an external decompressor, isal or the
+        gzip module, see _decompressor(), and read in large buffers.
+        '''
         try:
             logging.debug("Opening file {}".format(filename))
-            return gzip.open(filename, mode, encoding=encoding) \
-                if filename.endswith(".gz") \
-                   else open(filename)
+            if not filename.endswith(".gz"):
+                return open(filename)
+            in_file = open(filename, 'rb')
+            decompressor = self._decompressor()
+            if decompressor in DECOMPRESSORS:
+                stream = PipeReader(DECOMPRESSORS[decompressor], in_file)
+            elif decompressor == 'isal':
+                stream = igzip.IGzipFile(fileobj=in_file)
+            else:
+                stream = gzip.GzipFile(fileobj=in_file)
+            stream = io.BufferedReader(stream, READ_BUFFER_SIZE)
+            return stream if binary else io.TextIOWrapper(stream, encoding='utf8')
         except IOError as error:
             logging.error("IOERROR: {}".format(error))
 
+    def _read_lines(self, in_files: list, show_progress: bool = True, progress=None):
+        """
+        Read the lines of opened files, showing the progress by bytes read.
+
+        The progress is based on the position in the underlying (compressed)
+        files, so the files do not have to be read in advance to count their
+        lines. The estimated time left is based on the bytes read per second.
+
+        Args:
+            in_files (list): the opened files, from _open()
+            show_progress (bool): show the progress, unless disabled in the settings
+            progress (function): called with the bytes read and the total size
+                                 instead of showing the progress
+
+        Yields:
+            the lines of the files, in order
+
+        """
+        show_progress = show_progress and self.progress_bar and progress is None
+        total = sum(os.fstat(in_file.fileno()).st_size for in_file in in_files)
+        start = time.time()
+        if show_progress:
+            progress = functools.partial(self._update_read_progress, start=start)
+        done = 0
+        for in_file in in_files:
+            for i, line in enumerate(in_file):
+                yield line
+                if progress and not i % DataImporter.PROGRESS_LINES:
+                    progress(done + os.lseek(in_file.fileno(), 0, os.SEEK_CUR), total)
+            done += os.fstat(in_file.fileno()).st_size
+        if show_progress:
+            self._update_read_progress(total, total, start, finished=True)
+        elif progress:
+            progress(total, total)
+
     def _time_format(self, seconds):  # pylint: disable=no-self-use
         hour, rem = divmod(seconds, 3600)
         mins, secs = divmod(rem, 60)
@@ -115,6 +231,28 @@ class DataImporter():
     def _time_to(self, start, progress=0.01):
         return self._time_format((time.time() - start)/progress)
 
+    def _update_read_progress(self, position, total, start, finished=False):
+        """
+        Show how much of the input has been read, with the rate and estimated time left.
+
+        Args:
+            position (int): bytes read
+            total (int): total size of the input (bytes)
+            start (float): time when the reading started
+            finished (bool): end the progress line
+
+        """
+        elapsed = max(time.time() - start, 1e-6)
+        rate = position / elapsed
+        line = f"\r{min(position / max(total, 1), 1):6.1%} of {total / 1e6:,.1f} MB, " + \
+               f"{rate / 1e6:,.1f} MB/s"
+        if finished:
+            line += f", done in {self._time_format(elapsed)}\n"
+        elif rate:
+            line = f"{line}, {self._time_format((total - position) / rate)} left".ljust(72)
+        sys.stderr.write(line)
+        sys.stderr.flush()
+
     def _update_progress_bar(self, current_count, total, last_progress, finished=False):  # pylint: disable=no-self-use
         if not finished:
             progress = current_count/total
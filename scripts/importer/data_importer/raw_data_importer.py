@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 """Read data from a vcf file and add the variants to a database."""
-
+# pylint: disable=too-many-lines
+
+import array
+import multiprocessing
+import os
+import functools
+import operator
+import queue
 import re
 import sys
 import time
 import logging
+import zlib
+
+from psycopg2.extras import execute_values
 
+import coverage_files
 import db
+from modules.browser.utils import COVERAGE_BIN_SIZES, summarise_consequences
+from .copy_loader import copy_rows
 from .data_importer import DataImporter
 
 METRICS = [
@@ -23,6 +36,10 @@ METRICS = [
 ]
 
 
+class VariantImportError(Exception):
+    """Importing the variants failed, and the variants inserted were deleted."""
+
+
 class RawDataImporter(DataImporter):
     """Read data from a vcf file and add the variants to a database."""
 
@@ -32,13 +49,13 @@ class RawDataImporter(DataImporter):
         self.dataset_version = None
         self.dataset = None
         self.sampleset = None
-        self.counter = {'coverage': None,
-                        'variants': None,
-                        'beaconvariants': 0,
+        self.counter = {'beaconvariants': 0,
                         'calls': 0,
                         'tmp_calls': set()}
         self.lastpos = 0
         self.chrom = None
+        # ranges (first, last) of the ids of the variants inserted
+        self.variant_ids = []
 
     def _set_dataset_info(self):
         """Save dataset information given as parameters."""
@@ -121,12 +138,23 @@ class RawDataImporter(DataImporter):
         if not self.settings.dry_run:
             db.BeaconCounts.insert(datarow).execute()
 
-    def _insert_coverage(self):
+    def _insert_coverage(self):  # pylint: disable=too-many-branches,too-many-statements
         """
         Import coverage.
 
         Header columns are chromosome, position, mean coverage, median coverage,
         and then coverage under 1, 5 10, 15, 20, 25, 30, 50, 100.
+
+        With coverage_blocks the coverage is stored in compact blocks of
+        positions (data.coverage_blocks) instead of one row per position, as
+        recorded for the dataset version.
+
+        With coverage_dir the coverage is also written to memory-mapped coverage
+        files, which are then read by the browser instead of the database.
+
+        In both modes the coverage is also aggregated in bins of each size in
+        COVERAGE_BIN_SIZES (data.coverage_bins) while it is read, replacing
+        any existing bins of the dataset version for the chromosomes read.
         """
         start = time.time()
         header = [('chrom', str), ('pos', int), ('mean', float),
@@ -134,52 +162,69 @@ class RawDataImporter(DataImporter):
                   ('cov10', float), ('cov15', float), ('cov20', float), ('cov25', float),
                   ('cov30', float), ('cov50', float), ('cov100', float)]
         logging.info("Inserting Coverage")
+        model = db.CoverageBlock if self.settings.coverage_blocks else db.Coverage
         batch = []
-        last_progress = -1.0
+        block = []
+        batch_rows = 0
         counter = 0
+        bins = {}
+        bin_batch = []
+        chroms = set()
+        writer = None
+        if self.settings.coverage_dir and not self.settings.dry_run:
+            writer = coverage_files.CoverageWriter(self.settings.coverage_dir,
+                                                   self.dataset_version.id)
         with db.database.atomic():
-            for filename in self.settings.coverage_file:
-                for line in self._open(filename, binary=False):
-                    line = line.strip()
-                    if line.startswith("#"):
-                        continue
-
-                    data = self._parse_baseinfo(header, line)
-
-                    # re-format coverage for batch
-                    data['coverage'] = [data['cov1'], data['cov5'], data['cov10'],
-                                        data['cov15'], data['cov20'], data['cov25'],
-                                        data['cov30'], data['cov50'], data['cov100']]
-                    del data['cov1']
-                    del data['cov5']
-                    del data['cov10']
-                    del data['cov15']
-                    del data['cov20']
-                    del data['cov25']
-                    del data['cov30']
-                    del data['cov50']
-                    del data['cov100']
-
-                    if self.counter['coverage'] is not None:
-                        counter += 1
+            in_files = [self._open(filename, binary=False)
+                        for filename in self.settings.coverage_file]
+            for line in self._read_lines(in_files):
+                line = line.strip()
+                if line.startswith("#"):
+                    continue
+
+                data = self._parse_baseinfo(header, line)
+
+                # re-format coverage for batch
+                data['coverage'] = [data.pop(column) for column, _ in header[4:]]
 
+                counter += 1
+
+                if data['chrom'] not in chroms and not self.settings.dry_run:
+                    (db.CoverageBin.delete()
+                     .where((db.CoverageBin.dataset_version == self.dataset_version.id) &
+                            (db.CoverageBin.chrom == data['chrom']))
+                     .execute())
+                chroms.add(data['chrom'])
+                if writer:
+                    writer.add(data)
+                bin_batch += self._add_to_coverage_bins(bins, data)
+                if self.settings.coverage_blocks:
+                    if block and ((block[0]['chrom'],
+                                   block[0]['pos'] // db.COVERAGE_BLOCK_SIZE) !=
+                                  (data['chrom'], data['pos'] // db.COVERAGE_BLOCK_SIZE)):
+                        batch += [self._make_coverage_block(block)]
+                        block = []
+                    block += [data]
+                else:
                     batch += [data]
-                    if len(batch) >= self.settings.batch_size:
-                        if not self.settings.dry_run:
-                            db.Coverage.insert_many(batch).execute()
-                        batch = []
-                        # Update progress
-                        if self.counter['coverage'] is not None:
-                            last_progress = self._update_progress_bar(counter,
-                                                                      self.counter['coverage'],
-                                                                      last_progress)
-            if batch and not self.settings.dry_run:
-                db.Coverage.insert_many(batch).execute()
-        if self.counter['coverage'] is not None:
-            last_progress = self._update_progress_bar(counter,
-                                                      self.counter['coverage'],
-                                                      last_progress,
-                                                      finished=True)
+                batch_rows += 1
+                if batch_rows >= self.settings.batch_size and batch:
+                    if not self.settings.dry_run:
+                        self._insert_rows(model, batch)
+                        self._insert_rows(db.CoverageBin, bin_batch)
+                    batch = []
+                    bin_batch = []
+                    batch_rows = len(block)
+            if block:
+                batch += [self._make_coverage_block(block)]
+            bin_batch += [self._make_coverage_bin(current) for current in bins.values()]
+            if not self.settings.dry_run:
+                self._insert_rows(model, batch)
+                self._insert_rows(db.CoverageBin, bin_batch)
+                self.dataset_version.coverage_blocks = self.settings.coverage_blocks
+                self.dataset_version.save()
+        if writer:
+            writer.close()
         self._log_insertion(counter, "coverage", start)
 
     def _parse_manta(self):
@@ -189,98 +234,85 @@ class RawDataImporter(DataImporter):
 
         batch = []
         counter = 0
-        last_progress = 0
         start = time.time()
-        for filename in self.settings.variant_file:
-            for line in self._open(filename):
-                line = line.strip()
-                if line.startswith("#"):
-                    continue
+        in_files = [self._open(filename, binary=False) for filename in self.settings.variant_file]
+        for line in self._read_lines(in_files):
+            line = line.strip()
+            if line.startswith("#"):
+                continue
 
-                base = self._parse_baseinfo(header, line)
-                info = self._parse_info(line)
+            base = self._parse_baseinfo(header, line)
+            info = self._parse_info(line)
 
-                if info.get('SVTYPE') != 'BND':
-                    continue
-
-                if self._is_non_chromosome(base["chrom"]):
-                    # A BND *from* a non-chromosome.
-                    continue
+            if info.get('SVTYPE') != 'BND':
+                continue
 
-                batch += self._parse_bnd_alleles(base, info)
+            if self._is_non_chromosome(base["chrom"]):
+                # A BND *from* a non-chromosome.
+                continue
 
-                # count variants (one per vcf row)
-                counter += 1
+            batch += self._parse_bnd_alleles(base, info)
 
-                if len(batch) >= self.settings.batch_size:
-                    if not self.settings.dry_run:
-                        db.VariantMate.insert_many(batch).execute()
-                    batch = []
+            # count variants (one per vcf row)
+            counter += 1
 
-                    # Update progress
-                    if self.counter['variants']:
-                        last_progress = self._update_progress_bar(counter,
-                                                                  self.counter['variants'],
-                                                                  last_progress)
+            if len(batch) >= self.settings.batch_size:
+                if not self.settings.dry_run:
+                    self._insert_rows(db.VariantMate, batch)
+                batch = []
 
         # Store all variants and counter values
         if batch and not self.settings.dry_run:
-            db.VariantMate.insert_many(batch).execute()
+            self._insert_rows(db.VariantMate, batch)
 
-        if self.counter['variants']:
-            last_progress = self._update_progress_bar(counter,
-                                                      self.counter['variants'],
-                                                      last_progress,
-                                                      finished=True)
         self._log_insertion(counter, "breakend", start)
 
-    def _estimate_variant_lastid(self):  # pylint: disable=no-self-use
-        """
-        Return the id of the variant with the highest id.
-
-        Returns 0 if table is empty.
-
-        Returns:
-            int: id of the variant with highest id or 0
-
-        """
-        try:
-            return (db.Variant.select(db.Variant.id)
-                    .order_by(db.Variant.id.desc())
-                    .limit(1)
-                    .get().id)
-        except db.Variant.DoesNotExist:
-            return 0
-
     def _add_variants_to_db(self, batch: list, genes: list, transcripts: list, references: dict):
         """
         Add variants to db.
 
+        The ids of the variants are reserved from the id sequence before they
+        are inserted, so the genes, transcripts and rsids can be linked
+        without looking up the variants, even if other imports run at the
+        same time. The ids are recorded in variant_ids.
+
         Args:
             batch (list): variant data (dict)
             genes (list): genes for the variants
             transcripts(list): transcripts for the variants
             references (dict): reference genes and transcripts
         """
-        if not self.settings.beacon_only:
-            curr_id = self._estimate_variant_lastid()
-
-        db.Variant.insert_many(batch).execute()
+        indexes = self._allocate_variant_ids(len(batch))
+        for variant, index in zip(batch, indexes):
+            variant['id'] = index
+
+        self._insert_rows(db.Variant, batch)
+        for index in indexes:
+            if self.variant_ids and self.variant_ids[-1][1] == index - 1:
+                self.variant_ids[-1][1] = index
+            else:
+                self.variant_ids.append([index, index])
 
-        # check if the variant dbid estimate is correct, otherwise must check manually
         if not self.settings.beacon_only:
-            last_id = self._estimate_variant_lastid()
-            if last_id and last_id-curr_id == len(batch):
-                indexes = list(range(curr_id+1, last_id+1))
-            else:
-                logging.warning("Bad match between ids - slow check")
-                indexes = []
-                for entry in batch:
-                    indexes.append(db.Variant.select(db.Variant.id)
-                                   .where(db.Variant.variant_id == entry['variant_id'])
-                                   .get().id)
             self._add_variant_genes(indexes, genes, references['genes'])
             self._add_variant_transcripts(indexes, transcripts, references['transcripts'])
+            self._add_variant_rsids(indexes, batch)
+
+    @staticmethod
+    def _allocate_variant_ids(count: int) -> list:
+        """
+        Reserve ids for new variants from the id sequence of data.variants.
+
+        Args:
+            count (int): number of ids to reserve
+
+        Returns:
+            list: the reserved ids
+        """
+        cursor = db.database.execute_sql("SELECT nextval(pg_get_serial_sequence(" +
+                                         "'data.variants', 'id')) " +
+                                         "FROM generate_series(1, %s)", (count,))
+        return [row[0] for row in cursor]
 
     def _get_genes_transcripts(self):
         """
@@ -361,12 +393,11 @@ class RawDataImporter(DataImporter):
                                if len(vep_field_names) == len(x.split('|'))]
                 data['vep_annotations'] = [ann for ann in annotations
                                            if int(ann['ALLELE_NUM']) == i + 1]
-                batch_cont['genes'].append(list({annotation['Gene']
-                                                 for annotation in data['vep_annotations']
-                                                 if annotation['Gene'][:4] == 'ENSG'}))
-                batch_cont['transcripts'].append(list({annotation['Feature']
-                                                       for annotation in data['vep_annotations']
-                                                       if annotation['Feature'][:4] == 'ENST'}))
+                data.update(summarise_consequences(data['vep_annotations']))
+                batch_cont['genes'].append(self._summarise_by(data['vep_annotations'],
+                                                              'Gene', 'ENSG'))
+                batch_cont['transcripts'].append(self._summarise_by(data['vep_annotations'],
+                                                                    'Feature', 'ENST'))
 
             data['hom_count'] = hom_counts[i] if hom_counts else None
 
@@ -381,9 +412,44 @@ class RawDataImporter(DataImporter):
                 self.counter['beaconvariants'] += 1  # count variants (one/alternate)
 
     def _insert_variants(self):
-        """Import variants from a VCF file."""
+        """
+        Import variants from a VCF file.
+
+        With workers the chromosomes are split into shards, each imported by
+        its own process, see _insert_variant_shards().
+        """
         logging.info(f"Inserting variants{' (dry run)' if self.settings.dry_run else ''}")
         start = time.time()
+        references = dict(zip(('genes', 'transcripts'), self._get_genes_transcripts()))
+
+        if self.settings.workers > 1:
+            result = self._insert_variant_shards(references, self.settings.workers)
+        else:
+            result = self._insert_variant_shard(references)
+
+        if self.settings.set_vcf_sampleset_size and result['samples']:
+            self.sampleset.sample_size = result['samples']
+            self.sampleset.save()
+
+        self.dataset_version.num_variants = result['variants']
+        self.dataset_version.save()
+        self._log_insertion(result['variants'], "variant", start)
+
+    def _insert_variant_shard(self, references: dict, shard: int = 0,  # pylint: disable=too-many-branches
+                              shards: int = 1, progress=None) -> dict:
+        """
+        Import the variants of the chromosomes in a shard.
+
+        Args:
+            references (dict): reference genes and transcripts
+            shard (int): the shard to import
+            shards (int): number of shards
+            progress (function): called with the bytes read, see _read_lines();
+                                 by default the progress is shown
+
+        Returns:
+            dict: number of variant rows (variants) and of samples in the VCF (samples)
+        """
         headers = [("chrom", str), ("pos", int), ("rsid", str), ("ref", str),
                    ("alt", str), ("site_quality", float), ("filter_string", str)]
         batch_container = {'batch': [],
@@ -392,48 +458,44 @@ class RawDataImporter(DataImporter):
 
         vep_field_names = None
 
-        last_progress = -1.0
         counter = 0
         samples = 0
 
-        references = dict(zip(('genes', 'transcripts'), self._get_genes_transcripts()))
-
         with db.database.atomic():
-            for filename in self.settings.variant_file:
-                for line in self._open(filename, binary=False):
-                    line = line.strip()
-
-                    if line.startswith("#"):
-                        # Check for some information that we need
-                        if line.startswith('##INFO=<ID=CSQ'):
-                            vep_field_names = line.split('Format: ')[-1].strip('">').split('|')
-                        if line.startswith('#CHROM'):
-                            samples = len(line.split('\t')[9:])
-                        continue
-
-                    if not self.settings.beacon_only and not vep_field_names:
-                        logging.error("VEP_field_names is empty. " +
-                                      "Make sure VCF header is present.")
-                        sys.exit(1)
-
-                    self._parse_variant_row(line, batch_container, headers, vep_field_names)
-                    counter += 1  # count variants (one per vcf row)
-
-                    if len(batch_container['batch']) >= self.settings.batch_size:
-                        if not self.settings.dry_run:
-                            self._add_variants_to_db(batch_container['batch'],
-                                                     batch_container['genes'],
-                                                     batch_container['transcripts'],
-                                                     references)
-
-                        batch_container['genes'] = []
-                        batch_container['transcripts'] = []
-                        batch_container['batch'] = []
-                        # Update progress
-                        if self.counter['variants'] is not None:
-                            last_progress = self._update_progress_bar(counter,
-                                                                      self.counter['variants'],
-                                                                      last_progress)
+            in_files = [self._open(filename, binary=False)
+                        for filename in self.settings.variant_file]
+            for line in self._read_lines(in_files, progress=progress):
+                line = line.strip()
+
+                if line.startswith("#"):
+                    # Check for some information that we need
+                    if line.startswith('##INFO=<ID=CSQ'):
+                        vep_field_names = line.split('Format: ')[-1].strip('">').split('|')
+                    if line.startswith('#CHROM'):
+                        samples = len(line.split('\t')[9:])
+                    continue
+
+                if shards > 1 and self._shard_of(line[:line.find('\t')], shards) != shard:
+                    continue
+
+                if not self.settings.beacon_only and not vep_field_names:
+                    logging.error("VEP_field_names is empty. " +
+                                  "Make sure VCF header is present.")
+                    sys.exit(1)
+
+                self._parse_variant_row(line, batch_container, headers, vep_field_names)
+                counter += 1  # count variants (one per vcf row)
+
+                if len(batch_container['batch']) >= self.settings.batch_size:
+                    if not self.settings.dry_run:
+                        self._add_variants_to_db(batch_container['batch'],
+                                                 batch_container['genes'],
+                                                 batch_container['transcripts'],
+                                                 references)
+
+                    batch_container['genes'] = []
+                    batch_container['transcripts'] = []
+                    batch_container['batch'] = []
 
             if batch_container['batch'] and not self.settings.dry_run:
                 self._add_variants_to_db(batch_container['batch'],
@@ -441,19 +503,124 @@ class RawDataImporter(DataImporter):
                                          batch_container['transcripts'],
                                          references)
 
-        if self.settings.set_vcf_sampleset_size and samples:
-            self.sampleset.sample_size = samples
-            self.sampleset.save()
+        return {'variants': counter, 'samples': samples}
 
-        self.dataset_version.num_variants = counter
-        self.dataset_version.save()
-        if self.counter['variants'] is not None:
-            last_progress = self._update_progress_bar(counter,
-                                                      self.counter['variants'],
-                                                      last_progress,
-                                                      finished=True)
+    def _insert_variant_shards(self, references: dict, workers: int) -> dict:
+        """
+        Import the variants using one worker process per shard of the chromosomes.
+
+        Each worker reads the input files, but only parses and inserts the
+        variants of its own chromosomes, in its own transaction. The call
+        counts of the workers are added to the counters of the importer.
+        The progress shown is that of the slowest worker. If any worker fails,
+        the variants inserted by the others, as reported by their ids, are
+        deleted and VariantImportError is raised.
+
+        Args:
+            references (dict): reference genes and transcripts
+            workers (int): number of worker processes
+
+        Returns:
+            dict: number of variant rows (variants) and of samples in the VCF (samples)
+
+        Raises:
+            VariantImportError: if any worker failed
+        """
+        # workers must not share connections with the coordinator
+        db.database.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        positions = context.Array('q', workers, lock=False)
+        processes = [context.Process(target=self._run_variant_shard,
+                                     args=(references, shard, workers, results, positions))
+                     for shard in range(workers)]
+        for process in processes:
+            process.start()
+
+        total = sum(os.path.getsize(filename) for filename in self.settings.variant_file)
+        start = time.time()
+        shard_results = []
+        while len(shard_results) < len(processes):
+            try:
+                shard_results.append(results.get(timeout=1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+            if self.progress_bar:
+                self._update_read_progress(min(positions), total, start)
+        for process in processes:
+            process.join()
+        if self.progress_bar:
+            self._update_read_progress(min(positions), total, start, finished=True)
+
+        if (len(shard_results) < len(processes) or
+                any(process.exitcode for process in processes) or
+                any('error' in result for result in shard_results)):
+            deleted = self._delete_variants([ids for result in shard_results
+                                             for ids in result.get('ids', [])])
+            raise VariantImportError("Variant import failed in at least one worker, " +
+                                     f"deleted the {deleted:,} variants inserted by the others")
+
+        self.counter['calls'] += sum(result['calls'] for result in shard_results)
+        self.counter['beaconvariants'] += sum(result['beaconvariants']
+                                              for result in shard_results)
+        return {'variants': sum(result['variants'] for result in shard_results),
+                'samples': max(result['samples'] for result in shard_results)}
+
+    def _run_variant_shard(self, references: dict, shard: int,  # pylint: disable=too-many-arguments
+                           shards: int, results: multiprocessing.Queue, positions):
+        """
+        Import the variants of a shard in a worker process, see _insert_variant_shards().
+
+        Args:
+            references (dict): reference genes and transcripts
+            shard (int): the shard to import
+            shards (int): number of shards
+            results (multiprocessing.Queue): queue for the result of the shard
+            positions (multiprocessing.Array): bytes read by each shard
+        """
+        def progress(position, total):  # pylint: disable=unused-argument
+            positions[shard] = position
 
-        self._log_insertion(counter, "variant", start)
+        start = time.time()
+        try:
+            result = self._insert_variant_shard(references, shard, shards, progress)
+            # count the calls at the last position of the shard
+            self.counter['calls'] += len(self.counter['tmp_calls'])
+            result.update(calls=self.counter['calls'],
+                          beaconvariants=self.counter['beaconvariants'],
+                          ids=self.variant_ids)
+            logging.info(f"Shard {shard + 1}/{shards}: inserted {result['variants']} variant " +
+                         f"records in {self._time_since(start)}")
+        except Exception as err:  # pylint: disable=broad-except
+            logging.exception(f"Shard {shard + 1}/{shards} failed")
+            result = {'error': str(err)}
+        finally:
+            db.database.close_all()
+        results.put(result)
+
+    def _delete_variants(self, ids: list) -> int:
+        """
+        Delete the variants of the dataset version with the given ids.
+
+        Their genes, transcripts and rsids are deleted as well.
+
+        Args:
+            ids (list): ranges (first, last) of the ids, as in variant_ids
+
+        Returns:
+            int: number of variants deleted
+        """
+        if not ids:
+            return 0
+        variants = (db.Variant.select(db.Variant.id)
+                    .where((db.Variant.dataset_version == self.dataset_version.id) &
+                           functools.reduce(operator.or_, [db.Variant.id.between(first, last)
+                                                           for first, last in ids])))
+        with db.database.atomic():
+            for model in (db.VariantRsid, db.VariantGenes, db.VariantTranscripts):
+                model.delete().where(model.variant.in_(variants)).execute()
+            return db.Variant.delete().where(db.Variant.id.in_(variants)).execute()
 
     def _get_callcount(self, data):
         """Increment the call count by the calls found at this position."""
@@ -476,32 +643,21 @@ class RawDataImporter(DataImporter):
         # save the references for this position
         self.counter['tmp_calls'].add(data['ref'])
 
-    def count_entries(self):
-        """Count the number of entries."""
+    def add_consequences(self):
+        """
+        Add the consequence summaries to variants imported without them.
+
+        Covers the variants as well as their genes and transcripts, so existing
+        dataset versions can be listed without reading the VEP annotations.
+        """
         start = time.time()
-        if self.settings.coverage_file:
-            self.counter['coverage'] = 0
-            logging.info("Counting coverage lines")
-            for filename in self.settings.coverage_file:
-                for line in self._open(filename, binary=False):
-                    line = line.strip()
-                    if line.startswith("#"):
-                        continue
-                    self.counter['coverage'] += 1
-            logging.info(f"Found {self.counter['coverage']:,} coverage lines")
-
-        if self.settings.variant_file:
-            self.counter['variants'] = 0
-            logging.info("Counting variant lines")
-            for filename in self.settings.variant_file:
-                for line in self._open(filename, binary=False):
-                    line = line.strip()
-                    if line.startswith("#"):
-                        continue
-                    self.counter['variants'] += 1
-            logging.info("Found {:,} variants".format(self.counter['variants']))
-
-        logging.info("Counted input data lines in {} ".format(self._time_since(start)))
+        counter = self._add_missing_summaries(db.Variant)
+        counter += self._add_missing_summaries(db.VariantGenes, db.Gene.gene_id, 'Gene')
+        counter += self._add_missing_summaries(db.VariantTranscripts,
+                                               db.Transcript.transcript_id, 'Feature')
+        self._log_insertion(counter, "consequence summary", start)
+        if not self.settings.dry_run:
+            db.notify_dataset_version_changed(self.dataset.short_name)
 
     def prepare_data(self):
         """Prepare for inserting data into db."""
@@ -520,6 +676,129 @@ class RawDataImporter(DataImporter):
                 self._create_beacon_counts()
         if not self.settings.beacon_only and self.settings.coverage_file:
             self._insert_coverage()
+        if not self.settings.dry_run:
+            db.notify_dataset_version_changed(self.dataset.short_name)
+
+    @staticmethod
+    def _add_to_coverage_bins(bins: dict, row: dict) -> list:
+        """
+        Add the coverage of a position to the current bin of each size in COVERAGE_BIN_SIZES.
+
+        The positions must be added in order. The values are rounded to the
+        precision stored in data.coverage (real) before they are aggregated,
+        so the bins are the same for both ways of storing the coverage.
+
+        Args:
+            bins (dict): the current bin of each size, updated
+            row (dict): coverage of the position
+
+        Returns:
+            list: the bins completed before the position, see _make_coverage_bin()
+        """
+        done = []
+        values = array.array('f', [row['mean'], row['median']] + row['coverage']).tolist()
+        for bin_size in COVERAGE_BIN_SIZES:
+            pos = row['pos'] // bin_size * bin_size
+            current = bins.get(bin_size)
+            if current and (current['chrom'] != row['chrom'] or current['pos'] != pos):
+                done.append(RawDataImporter._make_coverage_bin(current))
+                current = None
+            if not current:
+                current = bins[bin_size] = {'dataset_version': row['dataset_version'],
+                                            'bin_size': bin_size,
+                                            'chrom': row['chrom'],
+                                            'pos': pos,
+                                            'positions': 0,
+                                            'min_mean': values[0],
+                                            'max_mean': values[0],
+                                            'sums': [0.0] * len(values)}
+            current['positions'] += 1
+            current['min_mean'] = min(current['min_mean'], values[0])
+            current['max_mean'] = max(current['max_mean'], values[0])
+            current['sums'] = [total + value for total, value in zip(current['sums'], values)]
+        return done
+
+    @staticmethod
+    def _make_coverage_bin(current: dict) -> dict:
+        """
+        Make a coverage bin of the aggregated coverage of its positions.
+
+        Args:
+            current (dict): the bin, see _add_to_coverage_bins()
+
+        Returns:
+            dict: the coverage bin
+        """
+        averages = [total / current['positions'] for total in current['sums']]
+        return {'dataset_version': current['dataset_version'],
+                'bin_size': current['bin_size'],
+                'chrom': current['chrom'],
+                'pos': current['pos'],
+                'positions': current['positions'],
+                'mean': averages[0],
+                'median': averages[1],
+                'min_mean': current['min_mean'],
+                'max_mean': current['max_mean'],
+                'coverage': averages[2:]}
+
+    def _add_missing_summaries(self, model, feature=None, key: str = None) -> int:
+        """
+        Add the consequence summary to the rows of a table that lack it.
+
+        The rows are updated with one statement per batch.
+
+        Args:
+            model: db.Variant, db.VariantGenes or db.VariantTranscripts
+            feature: id field of the gene or transcript of the rows
+            key (str): VEP annotation field matching feature
+
+        Returns:
+            int: number of rows with a summary added
+        """
+        if feature is None:
+            query = db.Variant.select(db.Variant.id, db.Variant.vep_annotations)
+        else:
+            query = (model.select(model.id, db.Variant.vep_annotations, feature)
+                     .join(db.Variant)
+                     .switch(model)
+                     .join(feature.model))
+        query = query.where((db.Variant.dataset_version == self.dataset_version.id) &
+                            (model.major_consequence.is_null()) &
+                            (db.Variant.vep_annotations.is_null(False)))
+
+        table = f'"{model._meta.schema}"."{model._meta.table_name}"'  # pylint: disable=protected-access
+        update = (f'UPDATE {table} AS target SET major_consequence = summary.major_consequence, ' +
+                  'flags = summary.flags, hgvs = summary.hgvs, canonical = summary.canonical ' +
+                  'FROM (VALUES %s) AS summary (id, major_consequence, flags, hgvs, canonical) ' +
+                  'WHERE target.id = summary.id')
+
+        counter = 0
+        last_id = 0
+        while True:
+            rows = list(query.where(model.id > last_id)
+                        .order_by(model.id)
+                        .limit(self.settings.batch_size)
+                        .tuples())
+            if not rows:
+                break
+            summaries = []
+            for row in rows:
+                annotations = row[1]
+                if feature is not None:
+                    annotations = [annotation for annotation in annotations
+                                   if annotation[key] == row[2]]
+                summary = summarise_consequences(annotations)
+                summaries.append((row[0], summary['major_consequence'], summary['flags'],
+                                  summary['hgvs'], summary['canonical']))
+            if not self.settings.dry_run:
+                with db.database.atomic():
+                    execute_values(db.database.cursor(), update, summaries,
+                                   template='(%s, %s, %s::varchar[], %s, %s)',
+                                   page_size=len(summaries))
+            counter += len(rows)
+            last_id = rows[-1][0]
+        logging.info(f"Found {counter:,} rows without a summary in {model._meta.table_name}")  # pylint: disable=protected-access
+        return counter
 
     def _add_variant_genes(self, variant_indexes: list,
                            genes_to_add: list,
@@ -529,17 +808,36 @@ class RawDataImporter(DataImporter):
 
         Args:
             variant_indexes (list): dbids of the variants
-            genes_to_add (list): the genes for each variant (str)
+            genes_to_add (list): gene: consequence summary (dict) for each variant
             ref_genes (dict): genename: dbid
         """
         batch = []
         for i in range(len(variant_indexes)):
-            connected_genes = [{'variant': variant_indexes[i], 'gene': ref_genes[gene]}
-                               for gene in genes_to_add[i]
+            connected_genes = [{'variant': variant_indexes[i], 'gene': ref_genes[gene], **summary}
+                               for gene, summary in genes_to_add[i].items()
                                if gene]
             batch += connected_genes
         if not self.settings.dry_run:
-            db.VariantGenes.insert_many(batch).execute()
+            self._insert_rows(db.VariantGenes, batch)
+
+    def _add_variant_rsids(self, variant_indexes: list, variants: list):
+        """
+        Add the rsids of the provided variants to the rsid lookup.
+
+        Args:
+            variant_indexes (list): dbids of the variants
+            variants (list): variant data (dict)
+        """
+        batch = [{'dataset_version': self.dataset_version,
+                  'rsid': variant['rsid'],
+                  'variant': variant_index}
+                 for variant_index, variant in zip(variant_indexes, variants)
+                 if variant['rsid'] is not None]
+        if batch and not self.settings.dry_run:
+            if self.settings.copy:
+                copy_rows(db.VariantRsid, batch)
+            else:
+                db.VariantRsid.insert_many(batch).on_conflict_ignore().execute()
 
     def _add_variant_transcripts(self, variant_indexes: list,
                                  transcripts_to_add: list,
@@ -549,17 +847,67 @@ class RawDataImporter(DataImporter):
 
         Args:
             variant_indexes (list): dbids of the variants
-            transcripts_to_add (list): the transcripts for each variant (str)
+            transcripts_to_add (list): transcript: consequence summary (dict) for each variant
             ref_transcripts (dict): genename: dbid
         """
         batch = []
         for i in range(len(variant_indexes)):
             connected_transcripts = [{'variant': variant_indexes[i],
-                                      'transcript': ref_transcripts[transcript]}
-                                     for transcript in transcripts_to_add[i]]
+                                      'transcript': ref_transcripts[transcript],
+                                      **summary}
+                                     for transcript, summary in transcripts_to_add[i].items()]
             batch += connected_transcripts
         if not self.settings.dry_run:
-            db.VariantTranscripts.insert_many(batch).execute()
+            self._insert_rows(db.VariantTranscripts, batch)
+
+    def _insert_rows(self, model, rows: list):
+        """
+        Insert rows into the table of a model.
+
+        With copy the rows are loaded using COPY, otherwise using an INSERT
+        statement.
+
+        Args:
+            model: the peewee model of the table
+            rows (list): the rows (dict)
+        """
+        if not rows:
+            return
+        if self.settings.copy:
+            copy_rows(model, rows)
+        else:
+            model.insert_many(rows).execute()
+
+    @staticmethod
+    def _make_coverage_block(rows: list) -> dict:
+        """
+        Make a coverage block of the coverage of consecutive positions.
+
+        Args:
+            rows (list): coverage (dict) of the positions in the block
+
+        Returns:
+            dict: the coverage block
+        """
+        return {'dataset_version': rows[0]['dataset_version'],
+                'chrom': rows[0]['chrom'],
+                'start_pos': min(row['pos'] for row in rows),
+                'end_pos': max(row['pos'] for row in rows),
+                'coverage': rows}
+
+    @staticmethod
+    def _shard_of(chrom: str, shards: int) -> int:
+        """
+        Get the shard of a chromosome, for importing variants in parallel.
+
+        Args:
+            chrom (str): the chromosome
+            shards (int): number of shards
+
+        Returns:
+            int: the shard of the chromosome
+        """
+        return zlib.crc32(chrom.encode()) % shards
 
     @staticmethod
     def _is_non_chromosome(chrom):
@@ -571,12 +919,14 @@ class RawDataImporter(DataImporter):
         return chrom.startswith('GL') or chrom.startswith('MT')
 
     def _log_insertion(self, counter, insertion_type, start):
-        """Log the progress of the import."""
+        """Log the progress of the import, including the throughput in rows/s."""
         action = "Inserted" if not self.settings.dry_run else "Dry-ran insertion of"
-        logging.info("{} {} {} records in {}".format(action,
-                                                     counter,
-                                                     insertion_type,
-                                                     self._time_since(start)))
+        rate = counter / max(time.time() - start, 1e-6)
+        logging.info("{} {} {} records in {} ({:,.0f} rows/s)".format(action,
+                                                                     counter,
+                                                                     insertion_type,
+                                                                     self._time_since(start),
+                                                                     rate))
 
     def _parse_baseinfo(self, header, line):
         """
@@ -647,3 +997,21 @@ class RawDataImporter(DataImporter):
         """Parse the INFO field of a vcf line."""
         parts = re.split(r';(?=\w)', line.split('\t')[7])
         return {x[0]: x[1] for x in map(lambda s: s.split('=', 1) if '=' in s else (s, s), parts)}
+
+    @staticmethod
+    def _summarise_by(annotations: list, key: str, prefix: str) -> dict:
+        """
+        Summarise the consequences of a variant per gene or transcript.
+
+        Args:
+            annotations (list): VEP annotations of the variant
+            key (str): annotation field with the gene or transcript id
+            prefix (str): only include ids starting with the prefix, e.g. ENSG
+
+        Returns:
+            dict: id: consequence summary
+        """
+        ids = {annotation[key] for annotation in annotations if annotation[key][:4] == prefix}
+        return {id_: summarise_consequences([annotation for annotation in annotations
+                                             if annotation[key] == id_])
+                for id_ in ids}
@@ -24,10 +24,7 @@ class ReferenceSetImporter(DataImporter):  # pylint: disable=too-many-instance-a
         """Set the provided settings and prepare variables."""
         super().__init__(settings)
 
-        # counters for statistics and progress
-        self.numbers = {'genes': None,
-                        'transcripts': None,
-                        'features': None}
+        # counters for statistics
         self.counters = {'genes': 0,
                          'transcripts': 0,
                          'features': 0}
@@ -281,50 +278,16 @@ class ReferenceSetImporter(DataImporter):  # pylint: disable=too-many-instance-a
                 self.genes[i]['canonical_transcript'] = canonical_dict[gene['gene_id']]
 
             self.counters['genes'] += 1
-            if self.numbers['genes'] is not None:
-                last_progress = self._update_progress_bar(i, self.numbers['genes'], last_progress)
+            if self.progress_bar:
+                last_progress = self._update_progress_bar(i, len(self.genes), last_progress)
             i += 1
 
-        if self.numbers['genes'] is not None:
-            last_progress = self._update_progress_bar(i, self.numbers['genes'],
+        if self.progress_bar:
+            last_progress = self._update_progress_bar(i, len(self.genes),
                                                       last_progress, finished=True)
         logging.info("Canonical transcript information from ensembl " +
                      f"added in {self._time_since(start)}.")
 
-    def count_entries(self):
-        """Count the number of entries."""
-        logging.info("Counting features in gencode file (for progress bar)")
-        start = time.time()
-        self.numbers['genes'] = 0
-        self.numbers['transcripts'] = 0
-        self.numbers['features'] = 0
-        for row in self.gencode:
-            raw = bytes(row).decode('ascii').strip()
-            if raw[0] == "#":
-                continue
-            values = raw.split("\t")
-            if len(values) < 2:
-                continue
-
-            if self.chrom and values[0][3:] not in self.chrom:
-                continue
-
-            if values[2] == 'gene':
-                self.numbers['genes'] += 1
-            elif values[2] == 'transcript':
-                self.numbers['transcripts'] += 1
-            elif values[2] in ['CDS', 'exon', 'UTR']:
-                self.numbers['features'] += 1
-
-        self.gencode.rewind()
-
-        pad = max([len("{:,}".format(self.numbers[t]))
-                   for t in ["genes", "transcripts", "features"]])
-        logging.info("Parsed file in {:3.1f}s".format(time.time()-start))
-        logging.info("Genes      : {0:>{pad},}".format(self.numbers['genes'], pad=pad))
-        logging.info("Transcripts: {0:>{pad},}".format(self.numbers['transcripts'], pad=pad))
-        logging.info("Features   : {0:>{pad},}".format(self.numbers['features'], pad=pad))
-
     def prepare_data(self):
         """Prepare for import of data."""
         self._open_gencode()
@@ -335,8 +298,7 @@ class ReferenceSetImporter(DataImporter):  # pylint: disable=too-many-instance-a
         """Start the data import."""
         start = time.time()
         logging.info("Reading gencode data into buffers.")
-        last_progress = -1.0
-        for line in self.gencode:
+        for line in self._read_lines([self.gencode]):
             line = bytes(line).decode('ascii').strip()
             if line.startswith("#"):
                 continue
@@ -355,11 +317,6 @@ class ReferenceSetImporter(DataImporter):  # pylint: disable=too-many-instance-a
                         'strand':values[6],
                         'gene_id':info['gene_id'].split('.')[0]}
 
-                # only progress for genes to keep it simple
-                if self.numbers['genes'] is not None:
-                    last_progress = self._update_progress_bar(self.counters['genes'],
-                                                              self.numbers['genes'],
-                                                              last_progress)
                 if values[2] == 'gene':
                     data['name'] = info['gene_name']
                     self.genes += [data]
@@ -381,11 +338,6 @@ class ReferenceSetImporter(DataImporter):  # pylint: disable=too-many-instance-a
             except Exception as error:  # pylint: disable=broad-except
                 logging.error("{}".format(error))
                 break
-        if self.numbers['genes'] is not None:
-            last_progress = self._update_progress_bar(self.counters['genes'],
-                                                      self.numbers['genes'],
-                                                      last_progress,
-                                                      finished=True)
         logging.info("Gencode data read into buffers in {}.".format(self._time_since(start)))
         self._read_ensembl()
         self._read_dbnsfp()
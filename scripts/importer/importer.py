@@ -12,13 +12,14 @@ as well as pip3 packages:
 """
 
 from data_importer.reference_set_importer import ReferenceSetImporter
-from data_importer.raw_data_importer import RawDataImporter
+from data_importer.raw_data_importer import RawDataImporter, VariantImportError
 
 if __name__ == '__main__':
 
     import os
     import argparse
     import logging
+    import sys
 
     PARSER = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -70,12 +71,33 @@ if __name__ == '__main__':
                         help="Coverage file(s) to import.")
     PARSER.add_argument("--variant_file", nargs="*",
                         help="Variant file(s) to import.")
+    PARSER.add_argument("--coverage_blocks", action="store_true",
+                        help=("Store the coverage in compact blocks of positions "
+                              "instead of one row per position."))
+    PARSER.add_argument("--workers", type=int, default=1,
+                        help=("Import the variants using this many processes, "
+                              "each handling a share of the chromosomes."))
+    PARSER.add_argument("--decompressor", default="auto",
+                        choices=["auto", "pigz", "bgzip", "isal", "gzip"],
+                        help=("Decompressor for gzipped input files; auto uses "
+                              "pigz or bgzip if installed, then python-isal, "
+                              "then the gzip module."))
+    PARSER.add_argument("--copy", action="store_true",
+                        help=("Load variants, coverage and mates using COPY "
+                              "instead of INSERT statements."))
+    PARSER.add_argument("--coverage_dir", default="",
+                        help=("Also write the coverage to memory-mapped files in "
+                              "this directory, read by the browser if set as "
+                              "coverageDir."))
 
     # Actions
     PARSER.add_argument("--add_reference", action="store_true",
                         help="Insert new reference set.")
     PARSER.add_argument("--add_raw_data", action="store_true",
                         help="Adds a Coverage and Variants to the database.")
+    PARSER.add_argument("--add_consequences", action="store_true",
+                        help=("Add consequence summaries to the variants of a "
+                              "dataset version imported without them."))
     PARSER.add_argument("--dry_run", action="store_true",
                         help="Do not insert anything into the database")
 
@@ -114,14 +136,20 @@ if __name__ == '__main__':
 
         IMPORTER = ReferenceSetImporter(ARGS)
         IMPORTER.prepare_data()
-        if not ARGS.disable_progress:
-            IMPORTER.count_entries()
         IMPORTER.start_import()
 
     if ARGS.add_raw_data:
         logging.info(f"Adding raw data {'(dry run)' if ARGS.dry_run else ''}")
         IMPORTER = RawDataImporter(ARGS)
         IMPORTER.prepare_data()
-        if not ARGS.disable_progress:
-            IMPORTER.count_entries()
-        IMPORTER.start_import()
+        try:
+            IMPORTER.start_import()
+        except VariantImportError as err:
+            logging.error(err)
+            sys.exit(1)
+
+    if ARGS.add_consequences:
+        logging.info(f"Adding consequence summaries {'(dry run)' if ARGS.dry_run else ''}")
+        IMPORTER = RawDataImporter(ARGS)
+        IMPORTER.prepare_data()
+        IMPORTER.add_consequences()
@@ -0,0 +1,82 @@
+"""
+Test loading rows with COPY FROM STDIN
+"""
+from peewee import AutoField, BlobField, CharField, IntegerField, Model
+from playhouse.postgres_ext import ArrayField, BinaryJSONField
+
+import db
+from data_importer import copy_loader
+
+
+class CopyTest(Model):
+    """Temporary table with a column of each type handled by the COPY formatting."""
+    class Meta:
+        database = db.database
+        schema = 'pg_temp'
+        table_name = 'copy_test'
+
+    id = AutoField()
+    name = CharField(null=True)
+    count = IntegerField(null=True)
+    tags = ArrayField(CharField, null=True)
+    info = BinaryJSONField(null=True)
+    data = BlobField(null=True)
+
+
+def test_format_value():
+    """
+    Test format_value()
+    """
+    name = CopyTest.name
+    assert copy_loader.format_value(name, None) == '\\N'
+    assert copy_loader.format_value(name, 'plain') == 'plain'
+    assert copy_loader.format_value(name, 'back\\slash') == 'back\\\\slash'
+    assert copy_loader.format_value(name, 'a\tb\nc\rd') == 'a\\tb\\nc\\rd'
+    assert copy_loader.format_value(name, 'say "hi"') == 'say "hi"'
+    assert copy_loader.format_value(name, '\\N') == '\\\\N'
+    assert copy_loader.format_value(CopyTest.count, 0) == '0'
+    assert copy_loader.format_value(CopyTest.info, {'a': 'tab\there'}) == '{"a": "tab\\\\there"}'
+    assert copy_loader.format_value(CopyTest.data, b'\x00\\\xff') == '\\\\x005cff'
+    assert copy_loader.format_value(CopyTest.tags, ['a"b', 'c\\d']) == '{"a\\\\"b","c\\\\\\\\d"}'
+    assert copy_loader.format_value(CopyTest.tags, None) == '\\N'
+    assert copy_loader.format_value(db.Variant.dataset_version, 4) == '4'
+    assert copy_loader.format_value(db.Variant.dataset_version, db.DatasetVersion(id=5)) == '5'
+
+
+def test_format_array():
+    """
+    Test format_array()
+    """
+    assert copy_loader.format_array([]) == '{}'
+    assert copy_loader.format_array(['a', None, 'NULL']) == '{"a",NULL,"NULL"}'
+    assert copy_loader.format_array(['quote"', 'back\\slash']) == '{"quote\\"","back\\\\slash"}'
+    assert copy_loader.format_array([1, 2.5]) == '{"1","2.5"}'
+    assert copy_loader.format_array(['tab\t', 'comma,', '{brace}']) == \
+        '{"tab\t","comma,","{brace}"}'
+
+
+def test_copy_rows():
+    """
+    Test copy_rows(), reading the rows back from a temporary table
+    """
+    rows = [{'name': 'back\\slash\ttab\nnewline "quote"', 'count': 1,
+             'tags': ['a"b', 'c\\d', None, 'NULL', 'x,y'], 'info': {'key': 'tab\t"\\'},
+             'data': b'\x00\\\n\xff'},
+            {'name': '\\N', 'count': None, 'tags': [], 'info': None, 'data': None},
+            {'name': None}]
+    with db.database.atomic() as transaction:
+        db.database.execute_sql('CREATE TEMP TABLE copy_test (id serial PRIMARY KEY, ' +
+                                'name varchar, count integer, tags varchar[], ' +
+                                'info jsonb, data bytea) ON COMMIT DROP')
+        assert copy_loader.copy_rows(CopyTest, rows) == 3
+        loaded = list(CopyTest.select().order_by(CopyTest.id).dicts())
+        transaction.rollback()
+
+    for row, result in zip(rows, loaded):
+        for key, value in row.items():
+            if key == 'data' and value is not None:
+                assert bytes(result[key]) == value
+            else:
+                assert result[key] == value
+    assert loaded[2]['tags'] is None
+    assert [row['id'] for row in loaded] == [1, 2, 3]
@@ -0,0 +1,39 @@
+"""
+Test the helpers of the raw data importer
+"""
+from data_importer.raw_data_importer import RawDataImporter
+
+
+def test_coverage_bins():
+    """
+    Test _add_to_coverage_bins() and _make_coverage_bin()
+    """
+    rows = [{'dataset_version': 1, 'chrom': '22', 'pos': pos, 'mean': mean,
+             'median': median, 'coverage': [1.0, 0.5]}
+            for pos, mean, median in ((150, 10.0, 10.0), (160, 20.0, 19.0),
+                                      (250, 30.0, 30.0), (1250, 0.1, 0.0))]
+    rows.append(dict(rows[0], chrom='X'))
+    bins = {}
+    done = []
+    for row in rows:
+        done += RawDataImporter._add_to_coverage_bins(bins, row)  # pylint: disable=protected-access
+    done += [RawDataImporter._make_coverage_bin(current)  # pylint: disable=protected-access
+             for current in bins.values()]
+
+    by_size = {}
+    for coverage_bin in done:
+        by_size.setdefault(coverage_bin['bin_size'], []).append(coverage_bin)
+    assert [(row['chrom'], row['pos'], row['positions']) for row in by_size[100]] == \
+        [('22', 100, 2), ('22', 200, 1), ('22', 1200, 1), ('X', 100, 1)]
+    assert [(row['chrom'], row['pos'], row['positions']) for row in by_size[1000]] == \
+        [('22', 0, 3), ('22', 1000, 1), ('X', 0, 1)]
+    assert [(row['chrom'], row['pos'], row['positions']) for row in by_size[10000]] == \
+        [('22', 0, 4), ('X', 0, 1)]
+
+    first = by_size[100][0]
+    assert (first['mean'], first['median'], first['min_mean'], first['max_mean']) == \
+        (15.0, 14.5, 10.0, 20.0)
+    assert first['coverage'] == [1.0, 0.5]
+    # the values are rounded to the precision of the database
+    assert by_size[100][2]['mean'] != 0.1
+    assert abs(by_size[100][2]['mean'] - 0.1) < 1e-7
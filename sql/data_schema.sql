@@ -136,7 +136,8 @@ CREATE TABLE IF NOT EXISTS data.dataset_versions (
     coverage_levels     integer[]       DEFAULT NULL, -- Levels used for data.coverage.coverage
     portal_avail        boolean         NOT NULL,
     file_access         access_levels   NOT NULL,
-    beacon_access       access_levels   NOT NULL
+    beacon_access       access_levels   NOT NULL,
+    coverage_blocks     boolean         NOT NULL DEFAULT false -- Coverage in data.coverage_blocks instead of data.coverage
 );
 
 CREATE TABLE IF NOT EXISTS data.dataset_files (
@@ -169,7 +170,20 @@ CREATE TABLE IF NOT EXISTS data.variants (
     allele_count integer,
     allele_num integer,
     quality_metrics jsonb,
-    vep_annotations jsonb
+    vep_annotations jsonb,
+    -- most severe consequence of the VEP annotations, computed at import
+    major_consequence varchar,
+    flags varchar[],
+    hgvs varchar,
+    canonical varchar
+);
+
+-- Compact rsid lookup, the primary key is used for index-only scans
+CREATE TABLE IF NOT EXISTS data.variant_rsids (
+    dataset_version integer REFERENCES data.dataset_versions,
+    rsid integer,
+    variant integer REFERENCES data.variants,
+    PRIMARY KEY (dataset_version, rsid, variant)
 );
 
 -- For storing breakends
@@ -193,13 +207,23 @@ CREATE TABLE IF NOT EXISTS data.mates (
 CREATE TABLE IF NOT EXISTS data.variant_genes (
     id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
     variant integer REFERENCES data.variants,
-    gene integer REFERENCES data.genes
+    gene integer REFERENCES data.genes,
+    -- most severe consequence of the VEP annotations for the gene, computed at import
+    major_consequence varchar,
+    flags varchar[],
+    hgvs varchar,
+    canonical varchar
 );
 
 CREATE TABLE IF NOT EXISTS data.variant_transcripts (
     id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
     variant integer REFERENCES data.variants,
-    transcript integer REFERENCES data.transcripts
+    transcript integer REFERENCES data.transcripts,
+    -- most severe consequence of the VEP annotations for the transcript, computed at import
+    major_consequence varchar,
+    flags varchar[],
+    hgvs varchar,
+    canonical varchar
 );
 
 CREATE TABLE IF NOT EXISTS data.coverage (
@@ -212,6 +236,31 @@ CREATE TABLE IF NOT EXISTS data.coverage (
     coverage real[] -- These are the coverage values, for the levels defined in data.dataset_versions.coverage_levels
 );
 
+-- Compact alternative to data.coverage, see db.CoverageBlockField for the format
+CREATE TABLE IF NOT EXISTS data.coverage_blocks (
+    id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    dataset_version integer REFERENCES data.dataset_versions,
+    chrom varchar(10),
+    start_pos integer,
+    end_pos integer,
+    coverage bytea
+);
+
+-- Coverage aggregated in bins of bin_size bases, computed at import
+CREATE TABLE IF NOT EXISTS data.coverage_bins (
+    id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    dataset_version integer REFERENCES data.dataset_versions,
+    bin_size integer,
+    chrom varchar(10),
+    pos integer, -- first position of the bin
+    positions integer, -- number of positions with coverage in the bin
+    mean real,
+    median real,
+    min_mean real,
+    max_mean real,
+    coverage real[]
+);
+
 CREATE TABLE IF NOT EXISTS data.metrics (
     id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
     dataset_version integer REFERENCES data.dataset_versions,
@@ -236,6 +285,8 @@ CREATE OR REPLACE VIEW data.dataset_version_current AS
 --
 
 CREATE INDEX coverage_chrom_pos ON data.coverage (chrom, pos);
+CREATE INDEX coverage_blocks_chrom_pos ON data.coverage_blocks (dataset_version, chrom, start_pos);
+CREATE INDEX coverage_bins_chrom_pos ON data.coverage_bins (dataset_version, bin_size, chrom, pos);
 CREATE INDEX features_gene ON data.features (gene);
 CREATE INDEX features_transcript ON data.features (transcript);
 CREATE INDEX features_transcript_type ON data.features (transcript, feature_type);
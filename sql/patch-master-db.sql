@@ -1,3 +1,72 @@
 -- Patches a database that is using the master checkout of the
 -- swefreq.sql schema definition to the develop version.
 
+-- Consequence summary for the variant lists, computed at import
+ALTER TABLE data.variants ADD COLUMN IF NOT EXISTS major_consequence varchar;
+ALTER TABLE data.variants ADD COLUMN IF NOT EXISTS flags varchar[];
+ALTER TABLE data.variants ADD COLUMN IF NOT EXISTS hgvs varchar;
+ALTER TABLE data.variants ADD COLUMN IF NOT EXISTS canonical varchar;
+
+-- Consequence summary per gene and transcript of a variant
+ALTER TABLE data.variant_genes ADD COLUMN IF NOT EXISTS major_consequence varchar;
+ALTER TABLE data.variant_genes ADD COLUMN IF NOT EXISTS flags varchar[];
+ALTER TABLE data.variant_genes ADD COLUMN IF NOT EXISTS hgvs varchar;
+ALTER TABLE data.variant_genes ADD COLUMN IF NOT EXISTS canonical varchar;
+ALTER TABLE data.variant_transcripts ADD COLUMN IF NOT EXISTS major_consequence varchar;
+ALTER TABLE data.variant_transcripts ADD COLUMN IF NOT EXISTS flags varchar[];
+ALTER TABLE data.variant_transcripts ADD COLUMN IF NOT EXISTS hgvs varchar;
+ALTER TABLE data.variant_transcripts ADD COLUMN IF NOT EXISTS canonical varchar;
+
+-- Compact rsid lookup
+CREATE TABLE IF NOT EXISTS data.variant_rsids (
+    dataset_version integer REFERENCES data.dataset_versions,
+    rsid integer,
+    variant integer REFERENCES data.variants,
+    PRIMARY KEY (dataset_version, rsid, variant)
+);
+INSERT INTO data.variant_rsids (dataset_version, rsid, variant)
+    SELECT dataset_version, rsid, id FROM data.variants
+     WHERE rsid IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+-- Coverage aggregated in bins, computed at import
+CREATE TABLE IF NOT EXISTS data.coverage_bins (
+    id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    dataset_version integer REFERENCES data.dataset_versions,
+    bin_size integer,
+    chrom varchar(10),
+    pos integer,
+    positions integer,
+    mean real,
+    median real,
+    min_mean real,
+    max_mean real,
+    coverage real[]
+);
+CREATE INDEX IF NOT EXISTS coverage_bins_chrom_pos
+    ON data.coverage_bins (dataset_version, bin_size, chrom, pos);
+
+-- Compact alternative to data.coverage
+CREATE TABLE IF NOT EXISTS data.coverage_blocks (
+    id integer PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    dataset_version integer REFERENCES data.dataset_versions,
+    chrom varchar(10),
+    start_pos integer,
+    end_pos integer,
+    coverage bytea
+);
+CREATE INDEX IF NOT EXISTS coverage_blocks_chrom_pos
+    ON data.coverage_blocks (dataset_version, chrom, start_pos);
+
+-- Where the coverage of a dataset version is stored
+ALTER TABLE data.dataset_versions
+    ADD COLUMN IF NOT EXISTS coverage_blocks boolean NOT NULL DEFAULT false;
+CREATE OR REPLACE VIEW data.dataset_version_current AS
+    SELECT * FROM data.dataset_versions
+     WHERE (dataset, id)
+        IN (SELECT dataset, MAX(id) FROM data.dataset_versions
+             WHERE available_from < now()
+             GROUP BY dataset);
+CREATE OR REPLACE VIEW beacon.available_datasets AS
+    SELECT * FROM data.dataset_versions
+     WHERE available_from < now() AND beacon_access != 'PRIVATE';
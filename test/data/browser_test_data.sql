@@ -5660,3 +5660,16 @@ COPY data.variant_transcripts (id, variant, transcript) FROM stdin;
 4148	1665	31
 4153	1668	54
 \.
+
+INSERT INTO data.variant_rsids (dataset_version, rsid, variant)
+    SELECT dataset_version, rsid, id FROM data.variants WHERE rsid IS NOT NULL;
+
+INSERT INTO data.coverage_bins (dataset_version, bin_size, chrom, pos, positions,
+                                mean, median, min_mean, max_mean, coverage)
+    SELECT dataset_version, bin_size, chrom, pos / bin_size * bin_size, count(*),
+           avg(mean), avg(median), min(mean), max(mean),
+           ARRAY[avg(coverage[1]), avg(coverage[2]), avg(coverage[3]),
+                 avg(coverage[4]), avg(coverage[5]), avg(coverage[6]),
+                 avg(coverage[7]), avg(coverage[8]), avg(coverage[9])]
+      FROM data.coverage, unnest(ARRAY[100, 1000, 10000]) AS bin_size
+     GROUP BY dataset_version, bin_size, chrom, pos / bin_size;
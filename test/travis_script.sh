@@ -77,6 +77,11 @@ echo '>>> Test 4B: The browser backend'
 COVERAGE_FILE=.coverage_pytest PYTHONPATH=$PYTHONPATH:backend/ py.test backend/ --cov=backend/
 RETURN_VALUE=$((RETURN_VALUE + $?))
 
+
+echo '>>> Test 4C: The importer'
+COVERAGE_FILE=.coverage_importer PYTHONPATH=$PYTHONPATH:backend/:scripts/importer/ py.test scripts/importer/tests --cov=scripts/importer/
+RETURN_VALUE=$((RETURN_VALUE + $?))
+
 # Quit the app
 curl localhost:4000/developer/quit
 sleep 2 # Lets wait a little bit so the server has stopped
@@ -168,6 +173,63 @@ psql -U postgres -h 127.0.0.1 "$DBNAME" -c "select chrom_id, pos, ref, alt, chro
 diff mates_res.txt "$BASE/tests/data/mates_reference.txt"
 RETURN_VALUE=$((RETURN_VALUE + $?))
 
+echo '>>> Test 7. Importing data with COPY and parallel workers'
+
+# import the same data into an empty database, which must give the same dump
+echo "CREATE DATABASE ${DBNAME}_copy" > create_db.sql
+psql -U postgres -h 127.0.0.1 -f create_db.sql
+psql -U postgres -h 127.0.0.1 -f sql/data_schema.sql "${DBNAME}_copy"
+psql -U postgres -h 127.0.0.1 -f sql/user_schema.sql "${DBNAME}_copy"
+sed -i.tmp "s/\"postgresName\" : \"$DBNAME\"/\"postgresName\" : \"${DBNAME}_copy\"/" settings.json
+
+sed -i -e 's/mate_1/copy_1/' scripts/manage.sh
+scripts/manage.sh import --add_reference\
+                  --gencode_version 19\
+                  --ensembl_version homo_sapiens_core_75_37\
+                  --assembly_id GRCh37p13\
+                  --dbnsfp_version 2.9.3\
+                  --batch_size 2\
+                  --ref_name GRCh37p13
+
+psql -U postgres -h 127.0.0.1 -f "$BASE/tests/data/base_info.sql" "${DBNAME}_copy"
+
+sed -i -e 's/copy_1/copy_2/' scripts/manage.sh
+scripts/manage.sh import --add_raw_data \
+                   --dataset  "Dataset 1"\
+                   --version "Version 1"\
+                   --variant_file "$BASE/tests/data/dataset1_1.vcf.gz"\
+                   --count_calls \
+                   --coverage_file "$BASE/tests/data/dataset1_1_coverage.txt.gz"\
+                   --coverage_dir coverage_files\
+                   --copy --workers 2
+
+sed -i -e 's/copy_2/copy_3/' scripts/manage.sh
+scripts/manage.sh import --add_raw_data \
+                   --dataset  "Dataset 1"\
+                   --version "Version 2"\
+                   --variant_file "$BASE/tests/data/dataset1_2.vcf.gz"\
+                   --batch_size 2\
+                   --coverage_file "$BASE/tests/data/dataset1_2_coverage.txt.gz"\
+                   --coverage_dir coverage_files\
+                   --copy --workers 2
+
+sed -i -e 's/copy_3/copy_4/' scripts/manage.sh
+scripts/manage.sh import --add_raw_data \
+                   --dataset  "Dataset 2"\
+                   --version "Version 1"\
+                   --count_calls \
+                   --variant_file "$BASE/tests/data/dataset2_1.vcf.gz"\
+                   --beacon-only\
+                   --copy --workers 2
+
+pg_dump -U postgres -h 127.0.0.1 "${DBNAME}_copy" -f copydump.psql --data-only
+sed -i -r -e '/^--/d;/^$/d;s/^[0-9]+[^I]//' copydump.psql
+grep -v -P "^SE[TL]" copydump.psql | sort > scopydump.psql
+
+# compare dump to reference
+diff scopydump.psql ref.psql
+RETURN_VALUE=$((RETURN_VALUE + $?))
+
 echo '>>> Code evaluation'
 pylint backend
 RETURN_VALUE=$((RETURN_VALUE + $?))
@@ -176,7 +238,7 @@ RETURN_VALUE=$((RETURN_VALUE + $?))
 
 echo '>>> Finalising: Combine coverage'
 
-coverage combine .coverage_pytest .coverage_server .coverage_import_1 .coverage_import_2 .coverage_import_3 .coverage_import_4 .coverage_mate_1
+coverage combine .coverage_pytest .coverage_server .coverage_import_1 .coverage_import_2 .coverage_import_3 .coverage_import_4 .coverage_mate_1 .coverage_importer .coverage_copy_1 .coverage_copy_2 .coverage_copy_3 .coverage_copy_4
 
 if [ -f .coverage ]; then
     coveralls